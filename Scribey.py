@@ -1,10 +1,12 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
-from tkinterdnd2 import DND_FILES, TkinterDnD
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
+    Toplevel = tk.Toplevel
+except ImportError:
+    # Python built without Tk: the command line, search and benchmarks still work
+    tk = ttk = filedialog = messagebox = scrolledtext = simpledialog = None
+    Toplevel = object
 import threading
-# import whisper
-from faster_whisper import WhisperModel
-import yt_dlp
 import os
 import sys
 import re
@@ -12,34 +14,75 @@ import json
 from urllib.parse import urlparse
 import subprocess
 from pathlib import Path
-import torch
 import warnings
-import requests
 import traceback
 import webbrowser
 from datetime import datetime
 import queue
 import shutil
+import tempfile
+import time
+import itertools
+import contextlib
+import collections
 import subprocess
 from pathlib import Path
 
 # Constants and Configuration
 
-HAS_DIARIZATION = True
-try:
-    from pyannote.audio import Pipeline
-    import soundfile as sf
-    import librosa
-except ImportError:
-    HAS_DIARIZATION = False
-    print("Speaker diarization unavailable - missing dependencies")
+# Heavy packages (faster-whisper, torch, pyannote, yt-dlp) are imported where
+# they are used, so the window or a CLI job starts without paying for them.
+# tkinterdnd2 is only imported by the window, so headless use doesn't need it.
 
 DEPENDENCIES = {
     'base': ['faster-whisper', 'yt-dlp', 'tkinterdnd2', 'ffmpeg-python'],
-    'diarization': ['pyannote.audio', 'torch'] if HAS_DIARIZATION else [],
+    'diarization': ['pyannote.audio', 'torch'],
     'enhanced_formats': ['pandas']
 }
 
+# Modules that must all be importable for speaker diarization
+DIARIZATION_MODULES = ['pyannote.audio', 'soundfile', 'librosa']
+
+# Rough CPU processing seconds per second of audio for each Whisper model,
+# used to estimate finish times until real measurements replace them
+MODEL_SPEED_FACTORS = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.2,
+    "medium": 0.35,
+    "large": 0.6
+}
+
+SCHEDULING_POLICIES = ["fifo", "sjf", "fair"]
+
+# Declared (memory MB, CPU cores) per job stage, before any measurements
+STAGE_COSTS = {
+    "download": (150, 0.5),
+    "decode": (600, 1),
+    "transcribe:tiny": (400, 4),
+    "transcribe:base": (600, 4),
+    "transcribe:small": (1200, 4),
+    "transcribe:medium": (2600, 4),
+    "transcribe:large": (4800, 4),
+    "diarization": (2500, 2),
+}
+
+# Stages that share a single loaded pipeline and so run one at a time
+STAGE_SLOTS = {"diarization": 1}
+
+# Where heavy stages run: in the app's own process, or in a child process
+# that is recycled after a number of jobs ("job") or after every stage ("stage")
+PROCESS_ISOLATION_MODES = ["off", "job", "stage"]
+
+LANGUAGES = ["auto", "en", "de", "fr", "es", "it", "pt", "nl", "pl", "ru",
+             "uk", "tr", "ar", "hi", "ja", "ko", "zh"]
+
+# How widely an auto-detected language is reused
+LANGUAGE_SCOPES = ["batch", "source", "file"]
+
+# Detections less certain than this are used for the file but not reused
+LANGUAGE_REUSE_THRESHOLD = 0.7
+
 HF_TOKEN_INSTRUCTIONS = """
 To use speaker diarization, you need a HuggingFace token:
 1. Go to https://huggingface.co/settings/tokens
@@ -49,7 +92,65 @@ To use speaker diarization, you need a HuggingFace token:
 
 
 
-class YouTubeInputDialog(tk.Toplevel):
+def is_youtube_url(url):
+    try:
+        parsed = urlparse(url)
+        return 'youtube.com' in parsed.netloc or 'youtu.be' in parsed.netloc
+    except:
+        return False
+
+def fetch_youtube_info(url):
+    """Fetch title, duration and channel for a YouTube URL without downloading it"""
+    import yt_dlp
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return {
+        'title': info.get('title', url),
+        'duration': info.get('duration'),
+        'source': info.get('channel_id') or info.get('uploader_id') or info.get('channel')
+    }
+
+def language_key(scope, input_path, source, batch_id):
+    """Key under which an auto-detected language is shared with other jobs"""
+    if scope == "source":
+        if source:
+            return f"channel:{source}"
+        return f"folder:{os.path.dirname(os.path.abspath(input_path))}"
+    if scope == "batch":
+        return f"batch:{batch_id}"
+    return None
+
+def parse_speaker_hint(text):
+    """'auto', '2' or '2-4' -> pyannote speaker-count arguments"""
+    text = (text or "auto").strip().lower()
+    if text in ("", "auto"):
+        return {}
+    if "-" in text:
+        low, high = (part.strip() for part in text.split("-", 1))
+        hint = {}
+        if low:
+            hint["min_speakers"] = int(low)
+        if high:
+            hint["max_speakers"] = int(high)
+    else:
+        hint = {"num_speakers": int(text)}
+    if not hint:
+        raise ValueError(f"empty speaker range: {text!r}")
+    if any(count < 1 for count in hint.values()):
+        raise ValueError(f"speaker counts must be at least 1: {text!r}")
+    if hint.get("min_speakers", 1) > hint.get("max_speakers", hint.get("min_speakers", 1)):
+        raise ValueError(f"minimum speakers is above the maximum: {text!r}")
+    return hint
+
+def safe_filename(name):
+    return "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+class YouTubeInputDialog(Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.result = None
@@ -93,7 +194,7 @@ class YouTubeInputDialog(tk.Toplevel):
     def _on_cancel(self):
         self.destroy()
 
-class ChoiceDialog(tk.Toplevel):
+class ChoiceDialog(Toplevel):
     def __init__(self, parent, title, message):
         super().__init__(parent)
         self.title(title)
@@ -142,6 +243,48 @@ class Settings:
             "hf_token": "",
             "dark_mode": False,
             "batch_processing": False,
+            "word_timestamps": False,
+            "language": "auto",
+            "language_scope": "batch",
+            "model_store_directory": "",
+            "offline_models": False,
+            "use_speaker_index": True,
+            "search_index": True,
+            "search_index_path": "",
+            "vad_prefilter": False,
+            "cascade_model": "off",
+            "parallel_jobs": 1,
+            "process_isolation": "off",
+            "jobs_per_process": 1,
+            "shared_store_path": "",
+            "profile_jobs": "off",
+            "profile_stages": "",
+            "profile_top": 15,
+            "log_max_lines": 5000,
+            "archive_export": False,
+            "speaker_hint": "auto",
+            "diarization_segmentation_batch": 32,
+            "diarization_embedding_batch": 32,
+            "diarization_segmentation_step": 0.1,
+            "archive_directory": "",
+            "archive_format": "auto",
+            "memory_budget_mb": 0,
+            "cpu_budget": 0,
+            "cascade_logprob_threshold": -1.0,
+            "cascade_no_speech_threshold": 0.6,
+            "cascade_compression_threshold": 2.4,
+            "vad_threshold": 0.5,
+            "vad_min_silence_ms": 2000,
+            "vad_speech_pad_ms": 400,
+            "speaker_match_threshold": 0.6,
+            "schedule_policy": "fifo",
+            "device": "cpu",
+            "compute_type": "int8",
+            "diarization_memory_mb": 512,
+            "diarization_window_overlap": 30,
+            "scratch_directory": "",
+            "scratch_use_tmpfs": False,
+            "scratch_quota_mb": 4096,
             "recent_files": [],
             "last_used": datetime.now().isoformat()
         }
@@ -170,26 +313,237 @@ class Settings:
             self.current["recent_files"] = self.current["recent_files"][:10]  # Keep last 10
             self.save()
 
+class ModelStore:
+    """Local copy of model weights with integrity checks, so later runs work offline
+
+    Each model directory carries a manifest of file sizes, mtimes and SHA-256
+    hashes. Sizes and mtimes are checked on every use; a file is re-hashed only
+    when its mtime changed, which keeps the check cheap for multi-GB weights.
+    """
+    manifest_name = "scribey_manifest.json"
+    diarization_model = "pyannote/speaker-diarization@2.1"
+
+    def __init__(self, settings):
+        self.root = (settings.get("model_store_directory") or
+                     str(Path.home() / ".cache" / "scribey" / "models"))
+        self.offline = bool(settings.get("offline_models"))
+
+    @staticmethod
+    def apply_offline_mode(settings):
+        """Stop huggingface_hub from touching the network; must run before it is imported"""
+        if settings.get("offline_models"):
+            os.environ["HF_HUB_OFFLINE"] = "1"
+
+    def whisper_model(self, size):
+        """Return a local directory holding the Whisper model, downloading it if needed"""
+        target = os.path.join(self.root, "whisper", size)
+        state = self.check(target)
+        if state:
+            return target
+        if self.offline:
+            raise FileNotFoundError(
+                f"Whisper model '{size}' is missing or damaged in the model store "
+                f"({target}) and offline mode is on")
+        if state is False:
+            shutil.rmtree(target, ignore_errors=True)
+        from faster_whisper.utils import download_model
+        download_model(size, output_dir=target)
+        self.write_manifest(target)
+        return target
+
+    def diarization_cache(self):
+        """Cache directory for the pyannote pipeline; cleared if its files were damaged"""
+        target = os.path.join(self.root, "pyannote")
+        if self.check(target) is False:
+            if self.offline:
+                raise FileNotFoundError(
+                    f"Diarization model files in {target} are damaged and offline mode is on")
+            shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target, exist_ok=True)
+        return target
+
+    @staticmethod
+    def _sha256(path):
+        import hashlib
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def write_manifest(self, directory):
+        files = {}
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename == self.manifest_name:
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                stat = os.stat(full_path)
+                files[os.path.relpath(full_path, directory)] = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "sha256": self._sha256(full_path)
+                }
+        with open(os.path.join(directory, self.manifest_name), "w") as f:
+            json.dump({"files": files}, f, indent=2)
+
+    def check(self, directory):
+        """True if intact, False if damaged, None if the model was never stored"""
+        manifest_path = os.path.join(directory, self.manifest_name)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        changed = False
+        for name, entry in manifest.get("files", {}).items():
+            full_path = os.path.join(directory, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                return False
+            if stat.st_size != entry["size"]:
+                return False
+            if stat.st_mtime != entry["mtime"]:
+                if self._sha256(full_path) != entry["sha256"]:
+                    return False
+                entry["mtime"] = stat.st_mtime
+                changed = True
+
+        if changed:
+            with open(manifest_path, "w") as f:
+                json.dump(manifest, f, indent=2)
+        return True
+
+class EnvironmentProbe:
+    """Caches dependency probe results keyed by an environment fingerprint
+
+    The fingerprint covers the interpreter, the site-packages directories'
+    mtimes (pip touches them on install/uninstall) and the ffmpeg binary, so a
+    warm start answers every probe from disk without importing or spawning.
+    """
+    cache_file = "scribey_env_cache.json"
+    _cache = None
+
+    @staticmethod
+    def fingerprint():
+        import site
+        paths = set()
+        try:
+            paths.update(site.getsitepackages())
+        except AttributeError:
+            pass
+        try:
+            paths.add(site.getusersitepackages())
+        except AttributeError:
+            pass
+        paths.update(p for p in sys.path if p.endswith(("site-packages", "dist-packages")))
+
+        mtimes = {}
+        for path in sorted(paths):
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                continue
+
+        ffmpeg = shutil.which("ffmpeg")
+        try:
+            ffmpeg_mtime = os.path.getmtime(ffmpeg) if ffmpeg else None
+        except OSError:
+            ffmpeg_mtime = None
+
+        return {
+            "executable": sys.executable,
+            "version": sys.version,
+            "site_packages": mtimes,
+            "ffmpeg": ffmpeg,
+            "ffmpeg_mtime": ffmpeg_mtime
+        }
+
+    @staticmethod
+    def _load():
+        if EnvironmentProbe._cache is not None:
+            return EnvironmentProbe._cache
+        fingerprint = EnvironmentProbe.fingerprint()
+        results = {}
+        try:
+            with open(EnvironmentProbe.cache_file, 'r') as f:
+                stored = json.load(f)
+            if stored.get("fingerprint") == fingerprint:
+                results = stored.get("results", {})
+        except (OSError, ValueError):
+            pass
+        EnvironmentProbe._cache = {"fingerprint": fingerprint, "results": results}
+        return EnvironmentProbe._cache
+
+    @staticmethod
+    def _save():
+        try:
+            with open(EnvironmentProbe.cache_file, 'w') as f:
+                json.dump(EnvironmentProbe._cache, f, indent=2)
+        except OSError:
+            pass
+
+    @staticmethod
+    def get(name, probe):
+        """Return the cached result for name, running probe() only on a miss"""
+        cache = EnvironmentProbe._load()
+        if name not in cache["results"]:
+            cache["results"][name] = probe()
+            EnvironmentProbe._save()
+        return cache["results"][name]
+
+    @staticmethod
+    def set(name, value):
+        cache = EnvironmentProbe._load()
+        cache["results"][name] = value
+        EnvironmentProbe._save()
+
+    @staticmethod
+    def invalidate():
+        """Forget everything, e.g. after installing packages"""
+        EnvironmentProbe._cache = None
+        try:
+            os.remove(EnvironmentProbe.cache_file)
+        except OSError:
+            pass
+
+    @staticmethod
+    def has_diarization():
+        import importlib.util
+        def probe():
+            for module in DIARIZATION_MODULES:
+                try:
+                    if importlib.util.find_spec(module) is None:
+                        return False
+                except (ImportError, ValueError):
+                    return False
+            return True
+        return EnvironmentProbe.get("has_diarization", probe)
+
 class DependencyManager:
     @staticmethod
     def check_dependencies(feature='base'):
+        return EnvironmentProbe.get(f"missing:{feature}",
+                                    lambda: DependencyManager._find_missing(feature))
+
+    @staticmethod
+    def _find_missing(feature):
+        import importlib.util
         missing = []
         required = DEPENDENCIES.get(feature, [])
         
         for package in required:
             try:
-                if package == 'faster-whisper':
-                    from faster_whisper import WhisperModel
-                elif package == 'ffmpeg-python':
+                if package == 'ffmpeg-python':
                     # Try running ffmpeg directly
-                    result = subprocess.run(['ffmpeg', '-version'], 
-                                         capture_output=True, 
-                                         text=True)
-                    if result.returncode != 0:
+                    if not DependencyManager.check_ffmpeg():
                         missing.append(package)
-                else:
-                    __import__(package.replace('-', '_'))
-            except (ImportError, FileNotFoundError, subprocess.SubprocessError):
+                elif importlib.util.find_spec(package.replace('-', '_')) is None:
+                    # find_spec locates the package without importing it
+                    missing.append(package)
+            except (ImportError, ValueError):
                 missing.append(package)
         
         return missing
@@ -203,15 +557,18 @@ class DependencyManager:
                 results.append((package, True, "Successfully installed"))
             except Exception as e:
                 results.append((package, False, str(e)))
+        EnvironmentProbe.invalidate()
         return results
 
     @staticmethod
     def check_ffmpeg():
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True)
-            return True
-        except:
-            return False
+        def probe():
+            try:
+                result = subprocess.run(['ffmpeg', '-version'], capture_output=True)
+                return result.returncode == 0
+            except:
+                return False
+        return EnvironmentProbe.get("ffmpeg", probe)
 
     @staticmethod
     def check_diarization_auth():
@@ -225,388 +582,3879 @@ class DependencyManager:
             pass
         return False
 
-class TranscriptionWorker:
-    def __init__(self, callback):
-        self.callback = callback
-        self.queue = queue.Queue()
-        self.running = True
-        self.thread = threading.Thread(target=self._process_queue, daemon=True)
-        self.thread.start()
-        self.speaker_map = {}  # Add this line to store speaker mappings
+class MediaProbe:
+    _durations = {}
 
-    def _get_speaker_label(self, original_label):
-        """Convert pyannote speaker labels to friendly names"""
-        if original_label == "UNKNOWN":
-            return "UNKNOWN"
-            
-        if original_label not in self.speaker_map:
-            # Create new speaker number (1-based indexing)
-            speaker_num = len(self.speaker_map) + 1
-            self.speaker_map[original_label] = f"{speaker_num}"
-            
-        return self.speaker_map[original_label]
+    @staticmethod
+    def duration(path):
+        """Return the duration of a media file in seconds, or None if it can't be probed"""
+        try:
+            key = (path, os.path.getmtime(path))
+        except OSError:
+            return None
+        if key in MediaProbe._durations:
+            return MediaProbe._durations[key]
 
-    def _process_queue(self):
-        while self.running:
+        duration = None
+        # WAV headers are cheap to read without spawning anything
+        if path.lower().endswith(".wav"):
             try:
-                task = self.queue.get(timeout=1)
-                if task is None:
-                    continue
-                
-                input_path, output_path, options = task
-                self._process_task(input_path, output_path, options)
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                self.callback.on_error(str(e))
+                import wave
+                with wave.open(path, "rb") as wav:
+                    duration = wav.getnframes() / float(wav.getframerate())
+            except Exception:
+                duration = None
 
-    def _process_task(self, input_path, output_path, options):
-        """Process a single transcription task with proper resource management"""
-        temp_files = []
-        try:
-            # Download if YouTube
-            if self._is_youtube_url(input_path):
-                self.callback.on_status("Downloading YouTube audio...")
-                temp_audio = self._download_youtube_audio(input_path)
-                temp_files.append(temp_audio)
-                processed_input = temp_audio
+        if duration is None:
+            try:
+                result = subprocess.run(
+                    ["ffprobe", "-v", "error",
+                     "-show_entries", "format=duration",
+                     "-of", "default=noprint_wrappers=1:nokey=1",
+                     path],
+                    capture_output=True, text=True, timeout=15)
+                if result.returncode == 0:
+                    duration = float(result.stdout.strip())
+            except (OSError, ValueError, subprocess.SubprocessError):
+                duration = None
+
+        MediaProbe._durations[key] = duration
+        return duration
+
+    @staticmethod
+    def format_duration(seconds):
+        if seconds is None:
+            return "?"
+        seconds = int(round(seconds))
+        hours, rest = divmod(seconds, 3600)
+        minutes, secs = divmod(rest, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{secs:02d}"
+        return f"{minutes}:{secs:02d}"
+
+class JobCancelled(BaseException):
+    """Raised at a checkpoint once a job has been cancelled
+
+    Derives from BaseException, like KeyboardInterrupt, so the broad
+    `except Exception` recovery paths (e.g. diarization fallbacks) don't
+    swallow it.
+    """
+
+class TranscriptionJob:
+    """A queued transcription task plus the metadata the scheduler needs"""
+    _ids = itertools.count(1)
+
+    def __init__(self, input_path, output_path, options, duration=None,
+                 priority=0, batch_id=None):
+        self.id = next(TranscriptionJob._ids)
+        self.input_path = input_path
+        self.output_path = output_path
+        self.options = options
+        self.duration = duration
+        self.priority = priority
+        self.batch_id = batch_id
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.status = "queued"
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.lease = None  # (SharedJobStore, store job id, fence) for shared jobs
+        self.on_finished = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        # Wake a paused job so it can notice the cancellation
+        self.resume_event.set()
+
+    def pause(self):
+        self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def checkpoint(self):
+        """Block while paused; raise JobCancelled once cancelled"""
+        if not self.resume_event.is_set():
+            self.resume_event.wait()
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    @property
+    def model_key(self):
+        """Model configuration frozen at enqueue time"""
+        return (self.options.get("model_size", "base"),
+                self.options.get("device", "cpu"),
+                self.options.get("compute_type", "int8"))
+
+class JobScheduler:
+    """Thread-safe job queue with FIFO, shortest-job-first and fair ordering
+
+    Jobs with a higher priority always run first. Among those, jobs that use
+    the currently loaded model are preferred so a mixed queue doesn't keep
+    swapping models, but only for MAX_MODEL_RUN jobs in a row while other
+    models' jobs wait. Within that group:
+    - fifo: submission order
+    - sjf: shortest expected runtime first
+    - fair: highest response ratio first, so short jobs jump ahead but long
+      jobs age in and are never starved
+    """
+    DEFAULT_DURATION = 600  # Assumed length of media that couldn't be probed
+    MAX_MODEL_RUN = 8  # Same-model jobs in a row before other models get a turn
+
+    def __init__(self, policy="fifo", fair_weight=1.0):
+        self.policy = policy if policy in SCHEDULING_POLICIES else "fifo"
+        self.fair_weight = fair_weight
+        self.speed_factors = dict(MODEL_SPEED_FACTORS)
+        self._jobs = []
+        self._running = {}
+        self._cond = threading.Condition()
+        self.loaded_key = None  # Model configuration the worker has in memory
+        self._dispatched = []
+        self._batch_start_key = None
+        self._run_key = None  # Model of the latest dispatches...
+        self._run_length = 0  # ...and how many of them in a row
+
+    def put(self, job):
+        with self._cond:
+            self._jobs.append(job)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Pop the next job to run; raises queue.Empty on timeout"""
+        with self._cond:
+            if not self._cond.wait_for(self._runnable, timeout):
+                raise queue.Empty
+            now = time.time()
+            job = min(self._candidates(), key=lambda j: self._sort_key(j, now))
+            self._jobs.remove(job)
+            if not self._dispatched:
+                self._batch_start_key = self.loaded_key
+            self._dispatched.append(job)
+            if job.model_key == self._run_key:
+                self._run_length += 1
             else:
-                processed_input = input_path
+                self._run_key, self._run_length = job.model_key, 1
+            job.status = "running"
+            job.started_at = now
+            self._running[job.id] = job
+            return job
 
-            # Load model
-            self.callback.on_status("Loading Whisper model...")
-            model_size = self.callback.model_size.get()
-            model = WhisperModel(model_size, device="cpu", compute_type="int8")
+    def _runnable(self):
+        """Queued jobs that aren't on hold"""
+        return [job for job in self._jobs if not job.paused]
 
-            # Transcribe
-            self.callback.on_status("Transcribing audio...")
-            segments, info = model.transcribe(processed_input, beam_size=5)
+    def _candidates(self):
+        runnable = self._runnable()
+        top = max(job.priority for job in runnable)
+        candidates = [job for job in runnable if job.priority == top]
+        same_model = [job for job in candidates if job.model_key == self.loaded_key]
+        if self._run_key == self.loaded_key and self._run_length >= self.MAX_MODEL_RUN:
+            # Long enough on this model; let the others have a turn
+            return [job for job in candidates if job.model_key != self.loaded_key] or candidates
+        return same_model or candidates
 
-            # Convert to compatible format
-            result = {
-                "segments": []
-            }
+    def task_done(self, job, elapsed=None):
+        """Mark a job finished and refine the speed estimate for its model"""
+        model_size = job.model_key[0]
+        with self._cond:
+            self._running.pop(job.id, None)
+            if job.status == "running":
+                job.status = "done"
+            if elapsed and job.duration:
+                measured = elapsed / job.duration
+                previous = self.speed_factors.get(model_size, measured)
+                # Exponential moving average keeps one odd file from skewing things
+                self.speed_factors[model_size] = 0.7 * previous + 0.3 * measured
 
-            for segment in segments:
-                result["segments"].append({
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text
-                })
+    def remove(self, job_ids):
+        """Take queued jobs out of the queue; returns the ids that were queued"""
+        job_ids = set(job_ids)
+        with self._cond:
+            removed = {job.id for job in self._jobs if job.id in job_ids}
+            for job in self._jobs:
+                if job.id in removed:
+                    job.status = "cancelled"
+            self._jobs = [job for job in self._jobs if job.id not in removed]
+        return removed
 
-            # Handle diarization if requested
-            if options.get("use_diarization"):
-                self.callback.on_status("Processing speaker diarization...")
-                result = self._add_speaker_diarization(result, processed_input)
+    def notify(self):
+        """Wake the worker, e.g. after a held job was resumed"""
+        with self._cond:
+            self._cond.notify_all()
 
-            # Save output
-            self.callback.on_status("Saving transcript...")
-            self._save_transcript(result, output_path, options)
+    def set_policy(self, policy):
+        with self._cond:
+            if policy in SCHEDULING_POLICIES:
+                self.policy = policy
 
-            self.callback.on_complete(output_path)
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            for job in self._jobs:
+                if job.id == job_id:
+                    job.priority = priority
+                    return True
+        return False
 
-        except Exception as e:
-            self.callback.log(f"Error details: {str(e)}")
-            self.callback.on_error(str(e))
-        finally:
-            # Clean up temp files
-            for temp_file in temp_files:
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                        self.callback.log(f"Cleaned up temp file: {temp_file}")
-                except Exception as e:
-                    self.callback.log(f"Failed to clean up {temp_file}: {str(e)}")
+    def pending(self):
+        with self._cond:
+            return list(self._jobs)
 
-    def _is_youtube_url(self, url):
-        try:
-            parsed = urlparse(url)
-            return 'youtube.com' in parsed.netloc or 'youtu.be' in parsed.netloc
-        except:
-            return False
+    def running_jobs(self):
+        with self._cond:
+            return list(self._running.values())
 
-    def _download_youtube_audio(self, url):
-        """Download YouTube audio with improved error handling and path management"""
-        import os
-        import tempfile
-        from datetime import datetime
-        
+    def is_idle(self):
+        with self._cond:
+            return not self._jobs and not self._running
+
+    def drain_summary(self):
+        """Once the queue has fully drained, return (jobs, ungrouped_loads) and reset
+
+        ungrouped_loads is how many model loads the batch would have needed
+        had the jobs run in submission order.
+        """
+        with self._cond:
+            if self._jobs or self._running or not self._dispatched:
+                return None
+            previous = self._batch_start_key
+            ungrouped_loads = 0
+            for job in sorted(self._dispatched, key=lambda j: j.id):
+                if job.model_key != previous:
+                    ungrouped_loads += 1
+                    previous = job.model_key
+            jobs = len(self._dispatched)
+            self._dispatched = []
+            return jobs, ungrouped_loads
+
+    def _expected_runtime(self, job):
+        duration = job.duration if job.duration is not None else self.DEFAULT_DURATION
+        factor = self.speed_factors.get(job.model_key[0], MODEL_SPEED_FACTORS["base"])
+        return max(duration * factor, 1.0)
+
+    def _sort_key(self, job, now):
+        if self.policy == "sjf":
+            order = self._expected_runtime(job)
+        elif self.policy == "fair":
+            runtime = self._expected_runtime(job)
+            waited = max(now - job.enqueued_at, 0.0)
+            order = -(1.0 + self.fair_weight * waited / runtime)
+        else:
+            order = 0
+        return (-job.priority, order, job.id)
+
+    def estimate_finish_times(self, now=None):
+        """Return {job_id: expected finish timestamp} for running and queued jobs"""
+        if now is None:
+            now = time.time()
+        with self._cond:
+            clock = now
+            finish_times = {}
+            for job in self._running.values():
+                remaining = job.started_at + self._expected_runtime(job) - now
+                clock = max(clock, now + max(remaining, 0.0))
+                finish_times[job.id] = now + max(remaining, 0.0)
+            loaded_key = self.loaded_key
+            run_key, run_length = self._run_key, self._run_length
+            # Replay the dispatch order, including the model grouping. Within a
+            # priority level, get() takes the loaded model's jobs (up to
+            # MAX_MODEL_RUN in a row while others wait), then switches to the
+            # model whose best job sorts first, so sorted per-model buckets
+            # reproduce it in O(n log n) for large queues.
+            levels = {}
+            for job in self._runnable():
+                levels.setdefault(job.priority, {}).setdefault(job.model_key, []).append(job)
+            for priority in sorted(levels, reverse=True):
+                buckets = levels[priority]
+                for bucket in buckets.values():
+                    bucket.sort(key=lambda j: self._sort_key(j, now))
+                while buckets:
+                    capped = run_key == loaded_key and run_length >= self.MAX_MODEL_RUN
+                    if loaded_key not in buckets or (capped and len(buckets) > 1):
+                        choices = [key for key in buckets if key != loaded_key]
+                        loaded_key = min(choices,
+                                         key=lambda key: self._sort_key(buckets[key][0], now))
+                    if loaded_key != run_key:
+                        run_key, run_length = loaded_key, 0
+                    bucket = buckets[loaded_key]
+                    take = len(bucket) if len(buckets) == 1 else \
+                        max(self.MAX_MODEL_RUN - run_length, 1)
+                    for job in bucket[:take]:
+                        clock += self._expected_runtime(job)
+                        finish_times[job.id] = clock
+                    del bucket[:take]
+                    run_length += take
+                    if not bucket:
+                        del buckets[loaded_key]
+            return finish_times
+
+class LeaseLost(Exception):
+    """A shared-store lease expired or was taken over by another worker"""
+
+class SharedJobStore:
+    """Job queue shared by Scribey workers on several machines, in one SQLite file
+
+    A worker claims a job by taking a lease that it must renew by heartbeat.
+    Each claim bumps the job's fence token. Heartbeats and completion only
+    succeed with the current token, so a worker whose lease ran out and
+    was re-queued can no longer renew it or publish a result.
+    """
+    default_lease_seconds = 60
+    max_attempts = 3
+    file_name = "scribey_jobs.sqlite"
+
+    def __init__(self, path):
+        # A directory (e.g. a network share) holds the store under a fixed name
+        self.path = os.path.join(path, self.file_name) if os.path.isdir(path) else path
+        with self._connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    input_path TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    duration REAL,
+                    priority INTEGER DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    fence INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    enqueued_at REAL,
+                    finished_at REAL,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, id);
+            """)
+
+    def _connect(self):
+        import sqlite3
+        # Rollback journal rather than WAL: WAL needs shared memory, which
+        # network filesystems don't provide
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Exclusive write transaction, so claims and completions never interleave"""
+        db = self._connect()
         try:
-            # Create temp file in system temp directory
-            temp_dir = tempfile.gettempdir()
-            temp_filename = f"scribey_yt_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            temp_path = os.path.join(temp_dir, temp_filename)
-            
-            self.callback.log(f"Downloading to: {temp_path}")
-            
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': temp_path,  # No extension - let yt-dlp handle it
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'quiet': True,
-                'no_warnings': True,
-                'progress_hooks': [self._download_progress_hook]
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                self.callback.log("Starting YouTube download...")
-                ydl.download([url])
-                
-                # The actual file will have .mp3 extension added by yt-dlp
-                final_path = temp_path + '.mp3'
-                
-                # Verify file exists after download
-                if not os.path.exists(final_path):
-                    # Try alternate path (some yt-dlp versions handle this differently)
-                    alt_path = temp_path + '.audio.mp3'
-                    if os.path.exists(alt_path):
-                        final_path = alt_path
-                    else:
-                        # List all files in temp directory for debugging
-                        files = os.listdir(temp_dir)
-                        matching_files = [f for f in files if f.startswith(temp_filename)]
-                        if matching_files:
-                            final_path = os.path.join(temp_dir, matching_files[0])
-                        else:
-                            raise FileNotFoundError(f"Downloaded file not found. Tried paths:\n"
-                                                f"- {final_path}\n"
-                                                f"- {alt_path}")
-                
-                self.callback.log(f"Download completed: {final_path}")
-                return final_path
-            
-        except Exception as e:
-            self.callback.log(f"Download error: {str(e)}")
-            raise Exception(f"YouTube download failed: {str(e)}")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
 
-    def _download_progress_hook(self, d):
-        """Progress hook for YouTube download"""
-        if d['status'] == 'downloading':
+    def submit(self, input_path, output_path, options, duration=None, priority=0):
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO jobs (input_path, output_path, options, duration, priority, "
+                "enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (input_path, output_path, json.dumps(options), duration, priority, time.time()))
+            return cursor.lastrowid
+
+    def _requeue_expired(self, db, now):
+        """Hand jobs of workers that stopped heartbeating back to the queue
+
+        A job that has lost max_attempts workers this way probably kills
+        them (out of memory, a crash in a native library), so it fails.
+        """
+        db.execute("UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                   "error = 'Worker stopped responding', finished_at = ? "
+                   "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                   (now, now, self.max_attempts))
+        db.execute("UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL "
+                   "WHERE status = 'leased' AND lease_expires < ?", (now,))
+
+    def claim(self, worker_id, lease_seconds=None):
+        """Lease the next queued job; returns a dict with its fence token, or None"""
+        lease_seconds = lease_seconds or self.default_lease_seconds
+        now = time.time()
+        with self._transaction() as db:
+            self._requeue_expired(db, now)
+            row = db.execute(
+                "SELECT id, input_path, output_path, options, duration, priority, fence "
+                "FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                       "fence = fence + 1, attempts = attempts + 1 WHERE id = ?",
+                       (worker_id, now + lease_seconds, row[0]))
+        return {"id": row[0], "input_path": row[1], "output_path": row[2],
+                "options": json.loads(row[3]), "duration": row[4], "priority": row[5],
+                "fence": row[6] + 1}
+
+    def heartbeat(self, job_id, fence, lease_seconds=None):
+        """Extend a lease; False if it was lost"""
+        lease_seconds = lease_seconds or self.default_lease_seconds
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND fence = ? "
+                "AND status = 'leased'", (time.time() + lease_seconds, job_id, fence))
+            return cursor.rowcount == 1
+
+    def _check_lease(self, db, job_id, fence):
+        row = db.execute("SELECT status, fence, lease_expires FROM jobs WHERE id = ?",
+                         (job_id,)).fetchone()
+        if row is None or row[0] != 'leased' or row[1] != fence:
+            raise LeaseLost(f"Lease on shared job {job_id} was lost")
+
+    def complete(self, job_id, fence, publish):
+        """Run publish() and mark the job done, both under the store's write lock
+
+        Raises LeaseLost, without publishing, if the lease isn't ours anymore.
+        """
+        with self._transaction() as db:
+            self._check_lease(db, job_id, fence)
+            publish()
+            db.execute("UPDATE jobs SET status = 'done', lease_owner = NULL, "
+                       "lease_expires = NULL, finished_at = ? WHERE id = ?",
+                       (time.time(), job_id))
+
+    def release(self, job_id, fence, status, error=None, max_attempts=None):
+        """Give up a lease: 'failed' re-queues until max_attempts, 'cancelled' is final"""
+        with self._transaction() as db:
             try:
-                # Remove ANSI color codes from the percentage string
-                percent = d['_percent_str'].replace('[0;94m', '').replace('[0m', '')
-                speed = d.get('_speed_str', 'N/A').replace('[0;32m', '').replace('[0m', '')
-                self.callback.on_status(f"Downloading: {percent.strip()} at {speed.strip()}")
-            except:
-                pass
-        elif d['status'] == 'finished':
-            self.callback.on_status("Download finished, processing audio...")
-            
-    def _add_speaker_diarization(self, whisper_result, audio_path):
-        try:
-            from pyannote.audio import Pipeline
-            import soundfile as sf
-            import librosa
-            import tempfile
-            import os
-            settings = Settings().current
-            token = settings.get("hf_token")
-            
-            if not token:
-                raise ValueError("No HuggingFace token found in settings")
-            
-            # Suppress torchaudio warning
-            import warnings
-            warnings.filterwarnings("ignore", message=".*torchaudio.*backend.*")
-            
+                self._check_lease(db, job_id, fence)
+            except LeaseLost:
+                return False
+            if status == "failed":
+                attempts = db.execute("SELECT attempts FROM jobs WHERE id = ?",
+                                      (job_id,)).fetchone()[0]
+                if attempts < (max_attempts or self.max_attempts):
+                    status = "queued"
+            db.execute("UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                       "error = ?, finished_at = ? WHERE id = ?",
+                       (status, error, time.time() if status != "queued" else None, job_id))
+            return True
+
+    def counts(self):
+        """Number of jobs per status, with expired leases counted as queued"""
+        with self._transaction() as db:
+            self._requeue_expired(db, time.time())
+            return dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+class SharedQueueClient:
+    """Feeds jobs leased from a SharedJobStore into a worker and keeps their leases alive
+
+    Only claims a job when a worker thread is free to start it, so leases
+    don't expire in the local queue.
+    """
+
+    def __init__(self, store, worker, lease_seconds=None):
+        import socket
+        self.store = store
+        self.worker = worker
+        self.lease_seconds = lease_seconds or store.default_lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.leased = {}  # local job id -> TranscriptionJob
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self, poll=1.0):
+        last_heartbeat = 0.0
+        while self.running and self.worker.running:
             try:
-                # Convert audio to WAV format first
-                self.callback.on_status("Converting audio format...")
-                with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                    temp_wav_path = temp_wav.name
-                    # Load and resample audio
-                    y, sr = librosa.load(audio_path, sr=16000)
-                    sf.write(temp_wav_path, y, sr, format='WAV')
-                
-                # First try to load the pipeline
-                self.callback.on_status("Loading diarization model...")
-                pipeline = Pipeline.from_pretrained(
-                    "pyannote/speaker-diarization@2.1",
-                    use_auth_token=token
-                )
+                now = time.time()
+                if now - last_heartbeat >= self.lease_seconds / 3:
+                    self._heartbeat()
+                    last_heartbeat = now
+                busy = len(self.worker.scheduler.pending()) + \
+                    len(self.worker.scheduler.running_jobs())
+                if busy < len(self.worker.threads):
+                    claimed = self.store.claim(self.worker_id, self.lease_seconds)
+                    if claimed is not None:
+                        self._enqueue(claimed)
+                        continue
+            except Exception as e:
+                self.worker.callback.log(f"Shared queue error: {str(e)}")
+            time.sleep(poll)
 
-                self.callback.on_status("Performing speaker diarization...")
-                diarization = pipeline(temp_wav_path)
-                
-                # Process results
-                speakers = []
-                for turn, _, speaker in diarization.itertracks(yield_label=True):
-                    speakers.append({
-                        'start': turn.start,
-                        'end': turn.end,
-                        'speaker': speaker
-                    })
-                
-                # Clean up temporary file
+    def _enqueue(self, claimed):
+        job = TranscriptionJob(claimed["input_path"], claimed["output_path"],
+                               claimed["options"], duration=claimed["duration"],
+                               priority=claimed["priority"])
+        job.lease = (self.store, claimed["id"], claimed["fence"])
+        job.on_finished = self._finished
+        self.leased[job.id] = job
+        self.worker.callback.log(f"Claimed shared job {claimed['id']}: "
+                                 f"{os.path.basename(job.input_path)}")
+        self.worker.scheduler.put(job)
+
+    def _heartbeat(self):
+        for job in list(self.leased.values()):
+            if job.status == "done":
+                continue
+            store, store_id, fence = job.lease
+            if not store.heartbeat(store_id, fence, self.lease_seconds):
+                # Someone else owns it now; stop working on it
+                self.worker.callback.log(f"Lost lease on shared job {store_id}; stopping it")
+                self.leased.pop(job.id, None)
+                job.cancel()
+
+    def _finished(self, job):
+        """Report a finished local job back to the store (done is reported on publish)"""
+        self.leased.pop(job.id, None)
+        store, store_id, fence = job.lease
+        if job.status in ("failed", "cancelled"):
+            store.release(store_id, fence, job.status)
+
+    def stop(self):
+        self.running = False
+
+class ScratchSpace:
+    """Managed scratch area with one private directory per job
+
+    Directories are named after the owning process, so leftovers from a
+    crashed run can be recognised and removed on the next start.
+    """
+
+    def __init__(self, settings):
+        root = settings.get("scratch_directory") or ""
+        if not root and settings.get("scratch_use_tmpfs") and os.path.isdir("/dev/shm"):
+            root = "/dev/shm"
+        if not root:
+            root = tempfile.gettempdir()
+        self.root = os.path.join(root, "scribey")
+        self.quota_bytes = int(settings.get("scratch_quota_mb", 4096)) * 1024 * 1024
+        os.makedirs(self.root, exist_ok=True)
+        self.remove_stale()
+
+    def remove_stale(self):
+        """Delete job directories left behind by processes that no longer exist"""
+        try:
+            entries = os.listdir(self.root)
+        except OSError:
+            return
+        for name in entries:
+            pid = name.split("-", 1)[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            if not self._pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, OSError):
+            # Exists but belongs to someone else, or we can't tell on this platform
+            return True
+        return True
+
+    def job(self, job_id):
+        return ScratchJob(self, job_id)
+
+class ScratchJob:
+    """Context manager for one job's scratch directory; always removed on exit"""
+
+    def __init__(self, space, job_id):
+        self.space = space
+        self.job_id = job_id
+        self.path = None
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix=f"{os.getpid()}-job{self.job_id}-",
+                                     dir=self.space.root)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        return False
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def usage(self):
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
                 try:
-                    os.remove(temp_wav_path)
-                except:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
                     pass
-                    
-                # Add speaker information to whisper segments
-                for segment in whisper_result.get("segments", []):
-                    if not isinstance(segment, dict):
-                        continue
-                        
-                    start_time = segment.get('start', 0)
-                    end_time = segment.get('end', 0)
-                    
-                    matching_speakers = []
-                    for speaker in speakers:
-                        if (start_time >= speaker['start'] and 
-                            end_time <= speaker['end']):
-                            matching_speakers.append(speaker['speaker'])
-                    
-                    if matching_speakers:
-                        from collections import Counter
-                        segment['speaker'] = Counter(matching_speakers).most_common(1)[0][0]
-                    else:
-                        segment['speaker'] = "UNKNOWN"
+        return total
+
+    def reserve(self, nbytes):
+        """Raise before writing nbytes more would push the job over its quota"""
+        if self.usage() + nbytes > self.space.quota_bytes:
+            raise OSError(
+                f"Scratch quota exceeded: job needs {nbytes / 1e6:.0f} MB more, "
+                f"limit is {self.space.quota_bytes / 1e6:.0f} MB")
+
+class ResourceGovernor:
+    """Admission control for heavy job stages under a memory and CPU budget
+
+    Each stage reserves its expected cost before it starts and waits while
+    the budget is taken. A stage that ran alone has its peak RSS increase
+    measured, which refines the stored cost: upwards at once, downwards
+    slowly, so one light file doesn't invite swapping on the next.
+    """
+    costs_file = "scribey_resource_costs.json"
+
+    def __init__(self, settings, on_change=None):
+        self.settings = settings
+        self.on_change = on_change
+        self._cond = threading.Condition()
+        self.reservations = {}  # token -> {"job", "stage", "memory_mb", "cpu", "alone"}
+        self.waiting = {}  # token -> (job id, stage)
+        self._tokens = itertools.count(1)
+        self._peak_rss = 0
+        self._sampler = None
+        self.processes = set()  # Child pids whose memory counts as ours
+        self.costs = {stage: list(cost) for stage, cost in STAGE_COSTS.items()}
+        try:
+            with open(self.costs_file, 'r') as f:
+                for stage, memory_mb in json.load(f).items():
+                    if stage in self.costs:
+                        self.costs[stage][0] = memory_mb
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def total_memory_mb():
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)
+        except (ValueError, OSError, AttributeError):
+            return 8192
+
+    @staticmethod
+    def current_rss_mb(pid="self"):
+        """Resident set size of a process, or None where /proc isn't available"""
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def track(self, pid):
+        """Count a stage process's memory in measurements from now on"""
+        self.processes.add(pid)
+
+    def untrack(self, pid):
+        self.processes.discard(pid)
+
+    def rss_mb(self):
+        """RSS of this process plus its tracked stage processes"""
+        rss = self.current_rss_mb()
+        if rss is None:
+            return None
+        return rss + sum(self.current_rss_mb(pid) or 0 for pid in list(self.processes))
+
+    def budget(self):
+        memory = self.settings.get("memory_budget_mb") or self.total_memory_mb() * 0.75
+        cpu = self.settings.get("cpu_budget") or os.cpu_count() or 1
+        return memory, cpu
+
+    def cost(self, stage):
+        return tuple(self.costs.get(stage, (500, 1)))
+
+    def _fits(self, stage, memory_mb, cpu):
+        if not self.reservations:
+            # Always admit something, even if it is bigger than the whole budget
+            return True
+        budget_memory, budget_cpu = self.budget()
+        used_memory = sum(r["memory_mb"] for r in self.reservations.values())
+        used_cpu = sum(r["cpu"] for r in self.reservations.values())
+        if stage in STAGE_SLOTS:
+            active = sum(1 for r in self.reservations.values() if r["stage"] == stage)
+            if active >= STAGE_SLOTS[stage]:
+                return False
+        return used_memory + memory_mb <= budget_memory and used_cpu + cpu <= budget_cpu
+
+    def acquire(self, job_id, stage, checkpoint=None):
+        """Block until the stage fits the budget; returns a token for release()"""
+        memory_mb, cpu = self.cost(stage)
+        token = next(self._tokens)
+        with self._cond:
+            self.waiting[token] = (job_id, stage)
+        self._changed()
+        try:
+            with self._cond:
+                try:
+                    while not self._fits(stage, memory_mb, cpu):
+                        self._cond.wait(0.5)
+                        if checkpoint:
+                            checkpoint()  # A cancelled job stops waiting
+                finally:
+                    del self.waiting[token]
+                for other in self.reservations.values():
+                    other["alone"] = False
+                self.reservations[token] = {
+                    "job": job_id, "stage": stage, "memory_mb": memory_mb, "cpu": cpu,
+                    "alone": not self.reservations,
+                    "rss_before": self.rss_mb(),
+                }
+                self._peak_rss = self.reservations[token]["rss_before"] or 0
+                self._start_sampler()
+        finally:
+            self._changed()
+        return token
+
+    def release(self, token):
+        with self._cond:
+            reservation = self.reservations.pop(token)
+            if reservation["alone"] and reservation["rss_before"] is not None:
+                peak = max(self._peak_rss, self.rss_mb() or 0)
+                self._refine(reservation["stage"], peak - reservation["rss_before"])
+            self._cond.notify_all()
+        self._changed()
+
+    @contextlib.contextmanager
+    def stage(self, job_id, stage, checkpoint=None):
+        """Context manager form of acquire/release"""
+        token = self.acquire(job_id, stage, checkpoint)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def _refine(self, stage, measured_mb):
+        if stage not in self.costs or measured_mb <= 0:
+            return
+        previous = self.costs[stage][0]
+        # Grow straight to what was seen; shrink gradually
+        updated = max(measured_mb, 0.8 * previous + 0.2 * measured_mb)
+        self.costs[stage][0] = round(updated)
+        try:
+            tmp_path = self.costs_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({name: cost[0] for name, cost in self.costs.items()}, f, indent=2)
+            os.replace(tmp_path, self.costs_file)
+        except OSError:
+            pass
+
+    def _start_sampler(self):
+        """Track peak RSS while any stage is running"""
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+
+        def sample():
+            while True:
+                with self._cond:
+                    if not self.reservations:
+                        self._sampler = None
+                        return
+                rss = self.rss_mb()
+                if rss is None:
+                    return
+                self._peak_rss = max(self._peak_rss, rss)
+                time.sleep(0.25)
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+
+    def _changed(self):
+        # Never called with _cond held: the GUI's handler waits for the Tk
+        # thread, which may itself be waiting for _cond in describe()
+        if self.on_change:
+            self.on_change()
+
+    def snapshot(self):
+        """Current reservations and waiting stages, for display"""
+        with self._cond:
+            return ([dict(r) for r in self.reservations.values()],
+                    list(self.waiting.values()))
+
+    def describe(self):
+        reservations, waiting = self.snapshot()
+        budget_memory, budget_cpu = self.budget()
+        used_memory = sum(r["memory_mb"] for r in reservations)
+        used_cpu = sum(r["cpu"] for r in reservations)
+        text = (f"Reserved {used_memory / 1024:.1f}/{budget_memory / 1024:.1f} GB, "
+                f"{used_cpu:g}/{budget_cpu:g} CPU")
+        if reservations:
+            text += " - " + ", ".join(f"job {r['job']} {r['stage']}" for r in reservations)
+        if waiting:
+            text += " (waiting: " + ", ".join(f"job {job} {stage}"
+                                              for job, stage in waiting) + ")"
+        return text
+
+def parse_profile_stages(text):
+    """Comma-separated stage names -> list, or None for the whole job"""
+    return [name.strip() for name in (text or "").split(",") if name.strip()] or None
+
+class JobProfiler:
+    """Profiles one job on its worker thread, for the whole job or chosen stages
+
+    In "cprofile" mode cProfile provides the .prof stats. In "sampling" mode
+    a sampler thread records stacks instead, which give the collapsed-stack
+    (flamegraph) file, and the .prof is built from the samples so pstats and
+    snakeviz can still load it. Stages run in a stage process are profiled
+    there and merged in with merge().
+
+    From Python 3.12 cProfile sees every thread and only one can be enabled
+    at a time, so a job that shares the process with other jobs, or finds
+    cProfile taken, is sampled instead.
+    """
+    modes = ["cprofile", "sampling"]
+    _cprofile_lock = threading.Lock()  # Held by the profiler using cProfile (3.12+)
+
+    def __init__(self, mode="cprofile", stages=None, interval=0.005, shared=False):
+        self.note = None
+        self.holds_cprofile = False
+        if mode == "cprofile" and sys.version_info >= (3, 12):
+            if shared:
+                mode = "sampling"
+                self.note = "other jobs run alongside, so this one was sampled"
+            elif self._cprofile_lock.acquire(blocking=False):
+                self.holds_cprofile = True
+            else:
+                mode = "sampling"
+                self.note = "cProfile was busy with another job, so this one was sampled"
+        self.mode = mode
+        self.stages = stages  # None profiles the whole job
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = {}  # stack (root first) -> [count, seconds]
+        self.depth = 0
+        self.active = False
+        self.profile = None
+        self.sampler = None
+        self.merged = []  # pstats dicts from stage processes
+        self.stopped = threading.Event()
+        if mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+        else:
+            self.sampler = threading.Thread(target=self._sample, daemon=True)
+            self.sampler.start()
+
+    @classmethod
+    def for_job(cls, options, shared=False):
+        """A profiler if the job asked for one, else None (and no overhead)"""
+        mode = options.get("profile")
+        if not mode:
+            return None
+        return cls(mode, options.get("profile_stages") or None, shared=shared)
+
+    def wants(self, stage):
+        if self.stages is None:
+            return False  # Already covered by the whole-job section
+        return any(stage == name or stage.startswith(name + ":") for name in self.stages)
+
+    @contextlib.contextmanager
+    def section(self):
+        self.depth += 1
+        if self.depth == 1:
+            self.active = True
+            if self.profile:
+                self.profile.enable()
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                if self.profile:
+                    self.profile.disable()
+                self.active = False
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """Pause the running section while another process does the work"""
+        if self.profile:
+            self.profile.disable()
+        self.active = False
+        try:
+            yield
+        finally:
+            self.active = True
+            if self.profile:
+                self.profile.enable()
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                entry = self.samples.setdefault(tuple(reversed(stack)), [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def _sampled_stats(self):
+        """Turn the stack samples into the dict layout pstats loads"""
+        stats = {}
+        for stack, (count, seconds) in self.samples.items():
+            seen = set()
+            for depth, frame in enumerate(stack):
+                entry = stats.setdefault(frame, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if frame not in seen:
+                    seen.add(frame)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if leaf:
+                    entry[2] += seconds
+                if depth:
+                    caller = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[2] += seconds if leaf else 0.0
+                    caller[3] += seconds
+        return {frame: (cc, nc, tt, ct, {caller: tuple(v) for caller, v in callers.items()})
+                for frame, (cc, nc, tt, ct, callers) in stats.items()}
+
+    def _stop(self):
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        if self.holds_cprofile:
+            self.holds_cprofile = False
+            self._cprofile_lock.release()
+
+    def export(self):
+        """Stop and return (pstats dict, stack samples), for sending to another process"""
+        self._stop()
+        if self.profile:
+            self.profile.create_stats()
+            return self.profile.stats, {}
+        return self._sampled_stats(), self.samples
+
+    def merge(self, stats, samples):
+        """Add a stage process's export() to this profile"""
+        if not samples:
+            self.merged.append(stats)
+            return
+        # Sampled stats are rebuilt from all the samples when saving
+        for stack, (count, seconds) in samples.items():
+            entry = self.samples.setdefault(stack, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+
+    def save(self, base_path, top=15):
+        """Write <base>.prof, and <base>.collapsed when sampling; return summary lines"""
+        import pstats
+        import types
+
+        own, _ = self.export()
+        # pstats loads anything with create_stats() and a stats dict
+        stats = pstats.Stats()
+        stats.add(*[types.SimpleNamespace(stats=part, create_stats=lambda: None)
+                    for part in [own] + self.merged if part])
+        prof_path = base_path + ".prof"
+        stats.dump_stats(prof_path)
+        saved = [prof_path]
+        if self.samples:
+            collapsed_path = base_path + ".collapsed"
+            with open(collapsed_path, "w", encoding="utf-8") as f:
+                for stack, (count, _) in sorted(self.samples.items()):
+                    frames = ";".join(f"{os.path.basename(filename)}:{name}"
+                                      for filename, _, name in stack)
+                    f.write(f"{frames} {count}\n")
+            saved.append(collapsed_path)
+
+        lines = [f"Profile saved: {', '.join(saved)}"]
+        if self.note:
+            lines.append(f"Profile note: {self.note}")
+        stats = stats.stats
+        if not stats:
+            return lines  # Nothing was recorded
+        total = sum(tt for _, _, tt, _, _ in stats.values()) or 1.0
+        hottest = sorted(stats.items(), key=lambda item: -item[1][2])[:top]
+        for (filename, line, name), (_, calls, tt, ct, _) in hottest:
+            lines.append(f"{tt:8.2f}s {tt / total:4.0%} self {ct:8.2f}s total  "
+                         f"{name} ({os.path.basename(filename)}:{line})")
+        return lines
+
+class DiarizationStitcher:
+    """Joins per-window diarization output into one consistent timeline
+
+    Windows overlap; speakers in a new window are matched to global speakers
+    by how much they talk over the same stretch of the overlap, and the
+    overlap is then split at its midpoint so no turn is counted twice.
+    Speakers the overlap doesn't settle are matched by voice embedding
+    against every global speaker so far, so someone silent for a whole
+    window keeps their label when they speak again.
+    """
+
+    def __init__(self, threshold=0.6):
+        self.turns = []  # Finalised turns with global labels
+        self.previous = []  # Previous window's turns (global labels), not yet final
+        self.next_label = 0
+        self.threshold = threshold  # Cosine similarity needed for an embedding match
+        self.centroids = {}  # global label -> (unit embedding, windows seen)
+
+    def _new_label(self):
+        label = f"SPEAKER_{self.next_label:02d}"
+        self.next_label += 1
+        return label
+
+    @staticmethod
+    def _overlap(a_start, a_end, b_start, b_end):
+        return max(0.0, min(a_end, b_end) - max(a_start, b_start))
+
+    @staticmethod
+    def _normalise(vector):
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _match_embeddings(self, mapping, embeddings):
+        """Map still-unmatched local speakers to the most similar unused global speaker"""
+        import numpy as np
+        local = [label for label in embeddings if label not in mapping]
+        free = [label for label in self.centroids if label not in mapping.values()]
+        if not local or not free:
+            return
+        vectors = np.stack([self._normalise(embeddings[label]) for label in local])
+        known = np.stack([self.centroids[label][0] for label in free])
+        if vectors.shape[1] != known.shape[1]:
+            return
+        similarity = vectors @ known.T
+        taken = set()
+        for flat in np.argsort(-similarity, axis=None):
+            row, column = np.unravel_index(flat, similarity.shape)
+            if similarity[row, column] < self.threshold:
+                break
+            if local[row] in mapping or column in taken:
+                continue
+            mapping[local[row]] = free[column]
+            taken.add(column)
+
+    def _update_centroids(self, mapping, embeddings):
+        for local, vector in embeddings.items():
+            label = mapping.get(local)
+            if label is None:
+                continue
+            vector = self._normalise(vector)
+            if label in self.centroids:
+                # Running mean, kept on the unit sphere
+                centroid, count = self.centroids[label]
+                vector = self._normalise((centroid * count + vector) / (count + 1))
+                self.centroids[label] = (vector, count + 1)
+            else:
+                self.centroids[label] = (vector, 1)
+
+    def add_window(self, window_start, turns, overlap_end=None, embeddings=None):
+        """Add one window's turns (absolute times, local labels)
+
+        overlap_end is where the previous window stopped; None for the first window.
+        embeddings optionally maps local labels to voice embeddings.
+        """
+        embeddings = embeddings or {}
+        mapping = {}
+        if overlap_end is not None and self.previous:
+            scores = {}
+            for prev in self.previous:
+                for turn in turns:
+                    shared = self._overlap(prev['start'], prev['end'],
+                                           turn['start'], turn['end'])
+                    # Only the shared stretch of audio is evidence
+                    shared = min(shared, self._overlap(turn['start'], turn['end'],
+                                                       window_start, overlap_end))
+                    if shared > 0:
+                        key = (turn['speaker'], prev['speaker'])
+                        scores[key] = scores.get(key, 0.0) + shared
+            used = set()
+            for (local, global_label), _ in sorted(scores.items(), key=lambda item: -item[1]):
+                if local not in mapping and global_label not in used:
+                    mapping[local] = global_label
+                    used.add(global_label)
+
+        self._match_embeddings(mapping, embeddings)
+        for turn in turns:
+            if turn['speaker'] not in mapping:
+                mapping[turn['speaker']] = self._new_label()
+        self._update_centroids(mapping, embeddings)
+        current = [{'start': t['start'], 'end': t['end'], 'speaker': mapping[t['speaker']]}
+                   for t in turns]
+
+        if overlap_end is None:
+            self.previous = current
+            return
+
+        cut = (window_start + overlap_end) / 2.0
+        for turn in self.previous:
+            if turn['start'] < cut:
+                self._append({'start': turn['start'], 'end': min(turn['end'], cut),
+                              'speaker': turn['speaker']})
+        self.previous = []
+        for turn in current:
+            if turn['end'] > cut:
+                self.previous.append({'start': max(turn['start'], cut), 'end': turn['end'],
+                                      'speaker': turn['speaker']})
+
+    def _append(self, turn):
+        if turn['end'] <= turn['start']:
+            return
+        last = self.turns[-1] if self.turns else None
+        # Re-join a turn that was split at the cut point
+        if last and last['speaker'] == turn['speaker'] and turn['start'] - last['end'] < 0.01:
+            last['end'] = max(last['end'], turn['end'])
+        else:
+            self.turns.append(turn)
+
+    def finish(self):
+        for turn in self.previous:
+            self._append(turn)
+        self.previous = []
+        return sorted(self.turns, key=lambda t: t['start'])
+
+class SpeechTimeline:
+    """Speech regions of a file, and the map between original and speech-only time
+
+    The speech-only audio is the regions laid end to end; times measured in
+    it are mapped back onto the original recording.
+    """
+
+    def __init__(self, regions, total_seconds):
+        import numpy as np
+
+        self.regions = [(float(start), float(end)) for start, end in regions]
+        self.total_seconds = total_seconds
+        self.original_starts = np.array([start for start, _ in self.regions], dtype=np.float64)
+        lengths = np.array([end - start for start, end in self.regions], dtype=np.float64)
+        self.compact_starts = np.concatenate([[0.0], np.cumsum(lengths)[:-1]]) \
+            if self.regions else np.zeros(0)
+        self.speech_seconds = float(lengths.sum())
+
+    @staticmethod
+    def speech_ranges(samples, settings):
+        """Run Silero VAD (bundled with faster-whisper); (start, end) sample indices"""
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        vad_options = VadOptions(
+            threshold=settings.get("vad_threshold", 0.5),
+            min_silence_duration_ms=settings.get("vad_min_silence_ms", 2000),
+            speech_pad_ms=settings.get("vad_speech_pad_ms", 400))
+        return [(chunk["start"], chunk["end"])
+                for chunk in get_speech_timestamps(samples, vad_options)]
+
+    @classmethod
+    def detect(cls, samples, settings, sample_rate=16000):
+        """Speech timeline of decoded samples held in memory"""
+        regions = [(start / sample_rate, end / sample_rate)
+                   for start, end in cls.speech_ranges(samples, settings)]
+        return cls(regions, len(samples) / sample_rate)
+
+    @property
+    def skipped_seconds(self):
+        return max(self.total_seconds - self.speech_seconds, 0.0)
+
+    def to_original(self, t, end=False):
+        """Map a speech-only time back to the original timeline
+
+        An end time that lands exactly on a region boundary belongs to the
+        region before it, not the start of the next one.
+        """
+        import numpy as np
+
+        if not self.regions:
+            return t
+        side = "left" if end else "right"
+        index = np.searchsorted(self.compact_starts, t, side=side) - 1
+        index = np.clip(index, 0, len(self.regions) - 1)
+        return self.original_starts[index] + (t - self.compact_starts[index])
+
+    def restore(self, result):
+        """Rewrite segment, word and speaker times in a result to original time"""
+        segments = result["segments"]
+        if isinstance(segments, SegmentStore):
+            segments.set_times(
+                self.to_original(segments.starts), self.to_original(segments.ends, end=True),
+                self.to_original(segments.column("word_start_time")),
+                self.to_original(segments.column("word_end_time"), end=True))
+            return result
+        for segment in segments:
+            segment["start"] = float(self.to_original(segment["start"]))
+            segment["end"] = float(self.to_original(segment["end"], end=True))
+            for word in segment.get("words") or []:
+                word["start"] = float(self.to_original(word["start"]))
+                word["end"] = float(self.to_original(word["end"], end=True))
+        return result
+
+class SpeakerIndex:
+    """Persistent store of speaker centroid embeddings for IDs that hold across files
+
+    Centroids live in one L2-normalised float32 matrix, so matching a speaker is
+    a single matrix-vector product (cosine similarity) against every known voice.
+    """
+    default_path = "scribey_speakers.npz"
+    max_cached_embeddings = 5000
+
+    def __init__(self, path, threshold=0.6):
+        import numpy as np
+        self.path = path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.names = []
+        self.cache = {}  # (file, turns) hash -> embedding
+        self.load()
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self):
+        import numpy as np
+        if not os.path.exists(self.path):
+            return
+        with np.load(self.path, allow_pickle=False) as data:
+            self.centroids = data["centroids"].astype(np.float32)
+            self.counts = data["counts"].astype(np.int64)
+            self.names = [str(name) for name in data["names"]]
+            self.cache = {str(key): vector for key, vector in
+                          zip(data["cache_keys"], data["cache_vectors"].astype(np.float32))}
+
+    def save(self):
+        import numpy as np
+        with self.lock:
+            keys = list(self.cache)[-self.max_cached_embeddings:]
+            dim = self.centroids.shape[1] if len(self.names) else 0
+            vectors = (np.stack([self.cache[key] for key in keys]) if keys
+                       else np.zeros((0, dim), dtype=np.float32))
+            temp_path = self.path + ".tmp.npz"
+            np.savez(temp_path,
+                     centroids=self.centroids, counts=self.counts,
+                     names=np.array(self.names, dtype=str),
+                     cache_keys=np.array(keys, dtype=str), cache_vectors=vectors)
+            # Write-then-rename so a crash never leaves a half-written index
+            os.replace(temp_path, self.path)
+
+    def reset(self):
+        import numpy as np
+        with self.lock:
+            self.centroids = np.zeros((0, 0), dtype=np.float32)
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.names = []
+            self.cache = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def _normalise(vector):
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / (np.linalg.norm(vector) + 1e-9)
+
+    def cached_embedding(self, key):
+        return self.cache.get(key)
+
+    def cache_embedding(self, key, vector):
+        vector = self._normalise(vector)
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = vector
+        return vector
+
+    def identify(self, embeddings):
+        """Map {local label: embedding} to stable speaker names, enrolling new voices
+
+        Two speakers from the same file never map to the same identity: pairs are
+        assigned greedily from the most to the least similar.
+        """
+        import numpy as np
+        labels = {}
+        if not embeddings:
+            return labels
+        local = list(embeddings)
+        vectors = np.stack([self._normalise(embeddings[label]) for label in local])
+
+        with self.lock:
+            if len(self.names) and self.centroids.shape[1] == vectors.shape[1]:
+                similarity = vectors @ self.centroids.T  # (local, known)
+                taken = set()
+                for flat in np.argsort(-similarity, axis=None):
+                    row, column = np.unravel_index(flat, similarity.shape)
+                    if similarity[row, column] < self.threshold:
+                        break
+                    if local[row] in labels or column in taken:
+                        continue
+                    labels[local[row]] = self.names[column]
+                    taken.add(column)
+                    # Running mean of the centroid, kept on the unit sphere
+                    count = self.counts[column]
+                    centroid = (self.centroids[column] * count + vectors[row]) / (count + 1)
+                    self.centroids[column] = self._normalise(centroid)
+                    self.counts[column] = count + 1
+
+            for row, label in enumerate(local):
+                if label in labels:
+                    continue
+                name = str(len(self.names) + 1)
+                if len(self.names):
+                    self.centroids = np.vstack([self.centroids, vectors[row:row + 1]])
+                else:
+                    self.centroids = vectors[row:row + 1].copy()
+                self.counts = np.append(self.counts, 1)
+                self.names.append(name)
+                labels[label] = name
+        return labels
+
+class TranscriptIndex:
+    """SQLite FTS5 index over transcript segments
+
+    Each transcript's segments are inserted in one transaction, so they occupy a
+    contiguous rowid range; re-indexing a transcript deletes that range by rowid
+    instead of scanning the whole table.
+    """
+    default_path = "scribey_index.sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or self.default_path
+        with self._connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    id INTEGER PRIMARY KEY,
+                    output_path TEXT UNIQUE NOT NULL,
+                    source_path TEXT,
+                    title TEXT,
+                    model TEXT,
+                    language TEXT,
+                    mtime REAL,
+                    first_rowid INTEGER,
+                    last_rowid INTEGER,
+                    indexed_at TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+                    text,
+                    speaker UNINDEXED,
+                    start_time UNINDEXED,
+                    end_time UNINDEXED,
+                    line UNINDEXED,
+                    transcript_id UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                );
+            """)
+
+    def _connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def add(self, output_path, source_path, title, model, language, segments, lines):
+        """Index (or re-index) one transcript's segments"""
+        output_path = os.path.abspath(output_path)
+        try:
+            mtime = os.path.getmtime(output_path)
+        except OSError:
+            mtime = None
+        if isinstance(segments, SegmentStore):
+            rows = [(text.strip(), str(speaker if speaker is not None else 'UNKNOWN'),
+                     start, end, line)
+                    for (start, end, speaker, text), line in zip(segments.rows(), lines)]
+        else:
+            rows = [(segment['text'].strip(), str(segment.get('speaker', 'UNKNOWN')),
+                     segment.get('start'), segment.get('end'), line)
+                    for segment, line in zip(segments, lines)]
+
+        db = self._connect()
+        try:
+            with db:
+                self._remove(db, output_path)
+                cursor = db.execute(
+                    "INSERT INTO transcripts (output_path, source_path, title, model, language, "
+                    "mtime, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (output_path, source_path, title, model, language, mtime,
+                     datetime.now().isoformat()))
+                transcript_id = cursor.lastrowid
+                first = db.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM segments").fetchone()[0]
+                db.executemany(
+                    "INSERT INTO segments (rowid, text, speaker, start_time, end_time, line, "
+                    "transcript_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(first + i,) + row + (transcript_id,) for i, row in enumerate(rows)])
+                db.execute("UPDATE transcripts SET first_rowid = ?, last_rowid = ? WHERE id = ?",
+                           (first, first + len(rows) - 1, transcript_id))
+        finally:
+            db.close()
+
+    def _remove(self, db, output_path):
+        row = db.execute("SELECT id, first_rowid, last_rowid FROM transcripts WHERE output_path = ?",
+                         (output_path,)).fetchone()
+        if row is None:
+            return
+        transcript_id, first, last = row
+        if first is not None and last is not None and last >= first:
+            db.execute("DELETE FROM segments WHERE rowid BETWEEN ? AND ?", (first, last))
+        db.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
+
+    def is_current(self, output_path):
+        output_path = os.path.abspath(output_path)
+        db = self._connect()
+        try:
+            row = db.execute("SELECT mtime FROM transcripts WHERE output_path = ?",
+                             (output_path,)).fetchone()
+        finally:
+            db.close()
+        try:
+            return row is not None and row[0] == os.path.getmtime(output_path)
+        except OSError:
+            return False
+
+    def add_existing(self, output_path):
+        """Index a transcript file written earlier, by parsing its text layout"""
+        segments, lines = TranscriptIndex.parse_transcript(output_path)
+        self.add(output_path, None, None, None, None, segments, lines)
+        return len(segments)
+
+    @staticmethod
+    def parse_transcript(path):
+        """Read back the SPEAKER / [start - end] text layout written by _save_transcript"""
+        pattern = re.compile(r"^\[(\d+(?:\.\d+)?)s - (\d+(?:\.\d+)?)s\] (.*)$")
+        segments, lines = [], []
+        speaker = "UNKNOWN"
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                line = line.rstrip("\n")
+                if not line.strip():
+                    continue
+                if line.startswith("SPEAKER "):
+                    speaker = line[len("SPEAKER "):]
+                    continue
+                match = pattern.match(line)
+                if match:
+                    segments.append({"start": float(match.group(1)), "end": float(match.group(2)),
+                                     "text": match.group(3), "speaker": speaker})
+                else:
+                    segments.append({"start": None, "end": None, "text": line, "speaker": speaker})
+                lines.append(number)
+        return segments, lines
+
+    @staticmethod
+    def _quote_terms(query):
+        """Every word as a quoted FTS string, so nothing in it is read as syntax"""
+        terms = [term.replace('"', '') for term in query.split()]
+        return " ".join(f'"{term}"' for term in terms if term)
+
+    @staticmethod
+    def _to_fts_query(query):
+        """Pass well-formed FTS queries through; quote plain words and anything malformed"""
+        if not re.search(r'["*]|\b(AND|OR|NOT|NEAR)\b', query):
+            return TranscriptIndex._quote_terms(query)
+        words = re.sub(r'"[^"]*"', ' "" ', query).split()
+        balanced = query.count('"') % 2 == 0 and query.count("(") == query.count(")")
+        operators = ("AND", "OR", "NOT")
+        dangling = bool(words) and (words[0] in operators or words[-1] in operators or
+                                    any(a in operators and b in operators
+                                        for a, b in zip(words, words[1:])))
+        if not balanced or dangling:
+            return TranscriptIndex._quote_terms(query)
+        return query
+
+    def search(self, query, limit=50):
+        """Return the best-matching segments as dicts, best first"""
+        import sqlite3
+        fts_query = self._to_fts_query(query)
+        if not fts_query:
+            return []
+        sql = """
+            SELECT t.output_path, t.source_path, t.title, s.start_time, s.end_time,
+                   s.speaker, s.line, snippet(segments, 0, '[', ']', '...', 16)
+            FROM segments AS s
+            JOIN transcripts AS t ON t.id = s.transcript_id
+            WHERE segments MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """
+        db = self._connect()
+        try:
+            try:
+                rows = db.execute(sql, (fts_query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Still not valid FTS syntax (e.g. NEAR misuse): search for the words
+                quoted = self._quote_terms(query)
+                if quoted == fts_query or not quoted:
+                    raise
+                rows = db.execute(sql, (quoted, limit)).fetchall()
+        finally:
+            db.close()
+        keys = ("output_path", "source_path", "title", "start", "end", "speaker", "line", "snippet")
+        return [dict(zip(keys, row)) for row in rows]
+
+class SegmentStore:
+    """Compact, column-oriented transcript segments (and their words)
+
+    Times and scores live in typed arrays, segment and word texts in one
+    string buffer each, addressed by end offsets, and speaker and model
+    names are interned to small integer codes. A multi-hour transcript with
+    word timestamps is then a handful of arrays rather than millions of
+    dicts. Iterating yields plain dicts built on the fly, for code that
+    only reads.
+    """
+    def __init__(self):
+        import array
+        self._start = array.array('d')
+        self._end = array.array('d')
+        self._speaker = array.array('i')
+        self._model = array.array('h')
+        self._avg_logprob = array.array('d')
+        self._no_speech_prob = array.array('d')
+        self._compression_ratio = array.array('d')
+        self._text_end = array.array('q')
+        self._word_end = array.array('q')  # Cumulative word count per segment
+        self._word_start_time = array.array('d')
+        self._word_end_time = array.array('d')
+        self._word_probability = array.array('f')
+        self._word_text_end = array.array('q')
+        self._text_parts = []
+        self._word_text_parts = []
+        self._text = ""
+        self._word_text = ""
+        self.speakers = []  # code -> name
+        self._speaker_codes = {}
+        self.models = []  # code -> model name
+        self._model_codes = {}
+
+    def __len__(self):
+        return len(self._start)
+
+    @property
+    def word_count(self):
+        return len(self._word_start_time)
+
+    @property
+    def has_words(self):
+        return len(self._word_start_time) > 0
+
+    @staticmethod
+    def _intern(name, names, codes):
+        if name is None:
+            return -1
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def speaker_code(self, name):
+        return self._intern(name, self.speakers, self._speaker_codes)
+
+    def append(self, start, end, text, words=None, speaker=None, model=None,
+               avg_logprob=None, no_speech_prob=None, compression_ratio=None):
+        """Add a segment; words are (start, end, text, probability) tuples"""
+        nan = float("nan")
+        self._start.append(start)
+        self._end.append(end)
+        self._speaker.append(self.speaker_code(speaker))
+        self._model.append(self._intern(model, self.models, self._model_codes))
+        self._avg_logprob.append(nan if avg_logprob is None else avg_logprob)
+        self._no_speech_prob.append(nan if no_speech_prob is None else no_speech_prob)
+        self._compression_ratio.append(nan if compression_ratio is None else compression_ratio)
+        self._text_parts.append(text)
+        self._text_end.append((self._text_end[-1] if self._text_end else 0) + len(text))
+        for word_start, word_end, word, probability in words or ():
+            self._word_start_time.append(word_start)
+            self._word_end_time.append(word_end)
+            self._word_probability.append(nan if probability is None else probability)
+            self._word_text_parts.append(word)
+            self._word_text_end.append(
+                (self._word_text_end[-1] if self._word_text_end else 0) + len(word))
+        self._word_end.append(len(self._word_start_time))
+
+    def append_whisper(self, segment, word_timestamps, offset=0.0, model=None):
+        """Add a faster-whisper Segment, shifted by offset seconds"""
+        words = None
+        if word_timestamps and segment.words:
+            words = [(word.start + offset, word.end + offset, word.word, word.probability)
+                     for word in segment.words]
+        self.append(segment.start + offset, segment.end + offset, segment.text, words,
+                    model=model, avg_logprob=segment.avg_logprob,
+                    no_speech_prob=segment.no_speech_prob,
+                    compression_ratio=segment.compression_ratio)
+
+    @classmethod
+    def coerce(cls, segments):
+        """A SegmentStore for segments given either way (store or list of dicts)"""
+        if isinstance(segments, cls):
+            return segments
+        store = cls()
+        for segment in segments:
+            words = [(w['start'], w['end'], w['word'], w.get('probability'))
+                     for w in segment.get('words') or ()]
+            store.append(segment.get('start'), segment.get('end'), segment['text'], words,
+                         speaker=segment.get('speaker'), model=segment.get('model'),
+                         avg_logprob=segment.get('avg_logprob'),
+                         no_speech_prob=segment.get('no_speech_prob'),
+                         compression_ratio=segment.get('compression_ratio'))
+        return store
+
+    def _texts(self):
+        # Join appended parts into the single buffer only when read
+        if self._text_parts:
+            self._text += "".join(self._text_parts)
+            self._text_parts = []
+        if self._word_text_parts:
+            self._word_text += "".join(self._word_text_parts)
+            self._word_text_parts = []
+        return self._text, self._word_text
+
+    # Column access as NumPy arrays (copies; the store stays appendable)
+
+    def column(self, name):
+        import numpy as np
+        return np.array(getattr(self, "_" + name))
+
+    @property
+    def starts(self):
+        return self.column("start")
+
+    @property
+    def ends(self):
+        return self.column("end")
+
+    def bounds(self, index):
+        return self._start[index], self._end[index]
+
+    def text(self, index):
+        text, _ = self._texts()
+        begin = self._text_end[index - 1] if index else 0
+        return text[begin:self._text_end[index]]
+
+    def speaker(self, index):
+        code = self._speaker[index]
+        return self.speakers[code] if code >= 0 else None
+
+    def word_range(self, index):
+        return (self._word_end[index - 1] if index else 0), self._word_end[index]
+
+    def words(self, index):
+        _, word_text = self._texts()
+        first, last = self.word_range(index)
+        words = []
+        for w in range(first, last):
+            begin = self._word_text_end[w - 1] if w else 0
+            probability = self._word_probability[w]
+            words.append({"start": self._word_start_time[w], "end": self._word_end_time[w],
+                          "word": word_text[begin:self._word_text_end[w]],
+                          "probability": None if probability != probability else probability})
+        return words
+
+    def segment(self, index, words=False):
+        """One segment as a dict (a snapshot; changes to it aren't stored)"""
+        def score(values):
+            value = values[index]
+            return None if value != value else value  # NaN -> None
+
+        entry = {"start": self._start[index], "end": self._end[index],
+                 "text": self.text(index),
+                 "avg_logprob": score(self._avg_logprob),
+                 "no_speech_prob": score(self._no_speech_prob),
+                 "compression_ratio": score(self._compression_ratio)}
+        speaker = self.speaker(index)
+        if speaker is not None:
+            entry["speaker"] = speaker
+        if self._model[index] >= 0:
+            entry["model"] = self.models[self._model[index]]
+        if words:
+            entry["words"] = self.words(index)
+        return entry
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.segment(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.segment(index)
+
+    def rows(self):
+        """(start, end, speaker, text) per segment, for writers"""
+        text, _ = self._texts()
+        begin = 0
+        for index in range(len(self)):
+            end = self._text_end[index]
+            code = self._speaker[index]
+            yield (self._start[index], self._end[index],
+                   self.speakers[code] if code >= 0 else None, text[begin:end])
+            begin = end
+
+    # Bulk updates
+
+    def set_speakers(self, labels):
+        """Give every segment a speaker, interning the names"""
+        import array
+        self._speaker = array.array('i', (self.speaker_code(label) for label in labels))
+
+    def set_times(self, starts, ends, word_starts=None, word_ends=None):
+        import array
+        import numpy as np
+        self._start = array.array('d', np.asarray(starts, dtype=np.float64).tobytes())
+        self._end = array.array('d', np.asarray(ends, dtype=np.float64).tobytes())
+        if word_starts is not None:
+            self._word_start_time = array.array(
+                'd', np.asarray(word_starts, dtype=np.float64).tobytes())
+            self._word_end_time = array.array(
+                'd', np.asarray(word_ends, dtype=np.float64).tobytes())
+
+    def extend_range(self, other, first=0, last=None):
+        """Append segments first..last-1 of another store, words included"""
+        text, word_text = other._texts()
+        last = len(other) if last is None else last
+        for index in range(first, last):
+            code = other._speaker[index]
+            model = other._model[index]
+            word_first, word_last = other.word_range(index)
+            words = []
+            for w in range(word_first, word_last):
+                begin = other._word_text_end[w - 1] if w else 0
+                words.append((other._word_start_time[w], other._word_end_time[w],
+                              word_text[begin:other._word_text_end[w]],
+                              other._word_probability[w]))
+            begin = other._text_end[index - 1] if index else 0
+            self.append(other._start[index], other._end[index],
+                        text[begin:other._text_end[index]], words,
+                        speaker=other.speakers[code] if code >= 0 else None,
+                        model=other.models[model] if model >= 0 else None,
+                        avg_logprob=other._avg_logprob[index],
+                        no_speech_prob=other._no_speech_prob[index],
+                        compression_ratio=other._compression_ratio[index])
+        return self
+
+    def group_words(self, word_labels):
+        """New store of single-speaker utterances, split where the label or segment changes
+
+        Words are contiguous in the buffer, so each utterance's text is one slice.
+        Each utterance lies within one source segment and keeps its scores.
+        """
+        import numpy as np
+        _, word_text = self._texts()
+        store = SegmentStore()
+        count = self.word_count
+        if not count:
+            return store
+        codes = np.array([store.speaker_code(label) for label in word_labels])
+        word_segment = np.repeat(np.arange(len(self)),
+                                 np.diff(np.concatenate([[0], self.column("word_end")])))
+        breaks = np.flatnonzero((codes[1:] != codes[:-1]) |
+                                (word_segment[1:] != word_segment[:-1])) + 1
+        bounds = np.concatenate([[0], breaks, [count]])
+        text_ends = self.column("word_text_end")
+        word_starts, word_ends = self.column("word_start_time"), self.column("word_end_time")
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            begin = text_ends[first - 1] if first else 0
+            words = [(word_starts[w], word_ends[w],
+                      word_text[(text_ends[w - 1] if w else 0):text_ends[w]],
+                      self._word_probability[w]) for w in range(first, last)]
+            segment = word_segment[first]
+            model = self._model[segment]
+            store.append(word_starts[first], word_ends[last - 1],
+                         word_text[begin:text_ends[last - 1]], words,
+                         speaker=store.speakers[codes[first]],
+                         model=self.models[model] if model >= 0 else None,
+                         avg_logprob=self._avg_logprob[segment],
+                         no_speech_prob=self._no_speech_prob[segment],
+                         compression_ratio=self._compression_ratio[segment])
+        return store
+
+    def nbytes(self):
+        """Approximate memory held by the store"""
+        arrays = [value for value in vars(self).values() if hasattr(value, "buffer_info")]
+        text, word_text = self._texts()
+        return (sum(a.itemsize * len(a) for a in arrays) +
+                sys.getsizeof(text) + sys.getsizeof(word_text))
+
+class SpeakerAligner:
+    """Attach diarization turns to Whisper output"""
+    MAX_GAP = 1.0  # Words this far from any turn stay UNKNOWN
+
+    @staticmethod
+    def apply(whisper_result, speakers):
+        segments = whisper_result.get("segments", [])
+        if isinstance(segments, SegmentStore):
+            # Column path: labels are computed over the arrays, never per dict
+            if segments.has_words:
+                labels = SpeakerAligner.assign(segments.column("word_start_time"),
+                                               segments.column("word_end_time"), speakers)
+                whisper_result["segments"] = segments.group_words(labels)
+            else:
+                segments.set_speakers(SpeakerAligner.containing_speakers(
+                    segments.starts, segments.ends, speakers))
+            return whisper_result
+        if any(isinstance(segment, dict) and segment.get("words") for segment in segments):
+            whisper_result["segments"] = SpeakerAligner.words_to_utterances(segments, speakers)
+        else:
+            SpeakerAligner.label_segments(segments, speakers)
+        return whisper_result
+
+    @staticmethod
+    def label_segments(segments, speakers):
+        """Segment-level labels: a segment takes the speaker whose turn contains it"""
+        segments = [segment for segment in segments if isinstance(segment, dict)]
+        labels = SpeakerAligner.containing_speakers(
+            [segment.get('start', 0) for segment in segments],
+            [segment.get('end', 0) for segment in segments], speakers)
+        for segment, label in zip(segments, labels):
+            segment['speaker'] = label
+
+    @staticmethod
+    def containing_speakers(starts, ends, speakers):
+        """Per interval, the most common speaker among turns containing it, else UNKNOWN"""
+        from collections import Counter
+        import numpy as np
+
+        turn_starts = np.array([t['start'] for t in speakers], dtype=np.float64)
+        turn_ends = np.array([t['end'] for t in speakers], dtype=np.float64)
+        names = [t['speaker'] for t in speakers]
+        labels = []
+        for start_time, end_time in zip(starts, ends):
+            matching = np.flatnonzero((turn_starts <= start_time) & (turn_ends >= end_time))
+            if len(matching) == 1:
+                labels.append(names[matching[0]])
+            elif len(matching):
+                # If multiple speakers found, use the most common one
+                labels.append(Counter(names[i] for i in matching).most_common(1)[0][0])
+            else:
+                labels.append("UNKNOWN")
+        return labels
+
+    @staticmethod
+    def assign(starts, ends, speakers, max_gap=MAX_GAP):
+        """Vectorised speaker lookup for many intervals at once
+
+        Returns one label per interval, chosen by where its midpoint falls:
+        the latest-starting turn covering it, else the longest-running earlier
+        turn covering it, else the nearest turn within max_gap seconds.
+        """
+        import numpy as np
+
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        if not len(speakers):
+            return ["UNKNOWN"] * len(starts)
+
+        turns = sorted(speakers, key=lambda t: t['start'])
+        turn_starts = np.array([t['start'] for t in turns], dtype=np.float64)
+        turn_ends = np.array([t['end'] for t in turns], dtype=np.float64)
+        labels = np.array([t['speaker'] for t in turns] + ["UNKNOWN"], dtype=object)
+        unknown = len(turns)
+        positions = np.arange(len(turns))
+
+        # Furthest end reached by any turn up to each index, and which turn reached it
+        reach = np.maximum.accumulate(turn_ends)
+        reach_turn = np.maximum.accumulate(np.where(turn_ends >= reach, positions, 0))
+
+        mids = (starts + ends) / 2.0
+        index = np.searchsorted(turn_starts, mids, side="right") - 1
+        before_first = index < 0
+        index = np.clip(index, 0, len(turns) - 1)
+
+        choice = np.full(len(mids), unknown)
+        covered = ~before_first & (turn_ends[index] >= mids)
+        choice[covered] = index[covered]
+
+        covered_earlier = ~before_first & ~covered & (reach[index] >= mids)
+        choice[covered_earlier] = reach_turn[index[covered_earlier]]
+
+        # Gaps between turns: pick the closer neighbour
+        gap = choice == unknown
+        next_index = np.where(before_first, 0, np.minimum(index + 1, len(turns) - 1))
+        has_next = before_first | (index + 1 < len(turns))
+        gap_after = np.where(has_next, turn_starts[next_index] - mids, np.inf)
+        gap_before = np.where(before_first, np.inf, mids - reach[index])
+        use_next = gap & (gap_after < gap_before) & (gap_after <= max_gap)
+        use_prev = gap & ~use_next & (gap_before <= max_gap)
+        choice[use_next] = next_index[use_next]
+        choice[use_prev] = reach_turn[index[use_prev]]
+
+        return labels[choice].tolist()
+
+    @staticmethod
+    def words_to_utterances(segments, speakers):
+        """Label each word, then regroup words into single-speaker utterances"""
+        words = []
+        for segment_index, segment in enumerate(segments):
+            for word in segment.get("words") or []:
+                words.append((segment_index, word))
+        if not words:
+            SpeakerAligner.label_segments(segments, speakers)
+            return segments
+
+        labels = SpeakerAligner.assign([w['start'] for _, w in words],
+                                       [w['end'] for _, w in words],
+                                       speakers)
+        utterances = []
+        current = None
+        current_segment = None
+        for (segment_index, word), label in zip(words, labels):
+            # Break on speaker changes and on Whisper's own segment boundaries
+            if current is None or label != current['speaker'] or segment_index != current_segment:
+                current = {"start": word['start'], "end": word['end'], "text": "",
+                           "speaker": label, "words": []}
+                # An utterance never spans segments, so it keeps its segment's scores
+                for key in ("avg_logprob", "no_speech_prob", "compression_ratio", "model"):
+                    if key in segments[segment_index]:
+                        current[key] = segments[segment_index][key]
+                current_segment = segment_index
+                utterances.append(current)
+            current['end'] = word['end']
+            current['text'] += word['word']
+            current['words'].append(word)
+        return utterances
+
+class TranscriptionWorker:
+    def __init__(self, callback, policy="fifo", start=True):
+        self.callback = callback
+        self.scheduler = JobScheduler(policy)
+        self.running = True
+        self.model = None
+        self.model_key = None
+        self.model_loads = 0
+        self.model_lock = threading.RLock()
+        self.diarization_pipeline = None
+        self.detected_languages = {}  # language key -> (language, probability)
+        self.archives = {}  # directory -> SegmentArchive for the current batch
+        self.archive_lock = threading.Lock()
+        self.escalation_model = None  # Larger model for cascade re-decoding
+        self.escalation_key = None
+        # Job running on the current thread, and its raw pyannote label ->
+        # friendly number map
+        self.local = threading.local()
+        self.speaker_index = None
+        self.hosts = []  # Stage processes, one per worker thread when isolation is on
+        settings = callback.settings.current
+        self.governor = ResourceGovernor(settings, on_change=self._on_resources_change)
+        # Jobs run side by side; the governor keeps their heavy stages within budget
+        thread_count = max(int(settings.get("parallel_jobs", 1)), 1) if start else 0
+        self.threads = [threading.Thread(target=self._process_queue, daemon=True)
+                        for _ in range(thread_count)]
+        self.thread = self.threads[0] if self.threads else None
+        for thread in self.threads:
+            thread.start()
+
+    def _on_resources_change(self):
+        self.callback.on_resources_update()
+
+    def _get_speaker_label(self, original_label, taken=()):
+        """Convert pyannote speaker labels to friendly names, avoiding names in taken"""
+        if original_label == "UNKNOWN":
+            return "UNKNOWN"
+            
+        speaker_map = self.local.speaker_map
+        if original_label not in speaker_map:
+            # Create new speaker number (1-based indexing)
+            used = set(speaker_map.values()) | set(taken)
+            speaker_num = len(speaker_map) + 1
+            while f"{speaker_num}" in used:
+                speaker_num += 1
+            speaker_map[original_label] = f"{speaker_num}"
+            
+        return speaker_map[original_label]
+
+    def _process_queue(self):
+        while self.running:
+            try:
+                job = self.scheduler.get(timeout=1)
+                self.callback.on_queue_update()
+
+                started = time.time()
+                success = self._process_task(job)
+                if job.status == "running":
+                    job.status = "done" if success else "failed"
+                if job.on_finished:
+                    job.on_finished(job)
+                self.scheduler.task_done(job, time.time() - started if success else None)
+                self.callback.on_queue_update()
+                self._report_model_loads()
+                host = getattr(self.local, "host", None)
+                if host is not None:
+                    host.job_finished()
+                if self.scheduler.is_idle():
+                    # Batch done: give the stage processes' memory back
+                    self.stop_hosts()
+                if self.archives and self.scheduler.is_idle():
+                    self.close_archives()
+                
+            except queue.Empty:
+                continue
+            except Exception as e:
+                self.callback.on_error(str(e))
+
+    @staticmethod
+    def _model_key(options):
+        return (options.get("model_size", "base"),
+                options.get("device", "cpu"),
+                options.get("compute_type", "int8"))
+
+    def _get_model(self, options):
+        """Return the Whisper model for a job, reusing the loaded one when it matches"""
+        key = self._model_key(options)
+        with self.model_lock:
+            if self.model is None or self.model_key != key:
+                store = ModelStore(self.callback.settings.current)
+                self.callback.on_status(f"Preparing Whisper model ({key[0]})...")
+                model_path = store.whisper_model(key[0])
+                self.callback.on_status(f"Loading Whisper model ({key[0]}, {key[2]})...")
+                # Drop the old model first so two never sit in memory together
+                from faster_whisper import WhisperModel
+                self.model = None
+                self.model = WhisperModel(model_path, device=key[1], compute_type=key[2])
+                self.model_key = key
+                self.scheduler.loaded_key = key
+                if getattr(self.local, "job", None) is not None:
+                    # Prefetches happen before the batch starts, like its starting model
+                    self.model_loads += 1
+            return self.model
+
+    def _get_escalation_model(self, options):
+        """Return the cascade's larger model, held alongside the first-pass model"""
+        key = (options["cascade_model"],
+               options.get("device", "cpu"),
+               options.get("compute_type", "int8"))
+        with self.model_lock:
+            if self.escalation_model is None or self.escalation_key != key:
+                store = ModelStore(self.callback.settings.current)
+                model_path = store.whisper_model(key[0])
+                self.callback.on_status(f"Loading Whisper model ({key[0]}) for rechecking...")
+                from faster_whisper import WhisperModel
+                self.escalation_model = None
+                self.escalation_model = WhisperModel(model_path, device=key[1],
+                                                     compute_type=key[2])
+                self.escalation_key = key
+            return self.escalation_model
+
+    def _get_diarization_pipeline(self, token):
+        """Return the pyannote pipeline, loading it from the model store once per process"""
+        with self.model_lock:
+            if self.diarization_pipeline is None:
+                from pyannote.audio import Pipeline
+                store = ModelStore(self.callback.settings.current)
+                cache_dir = store.diarization_cache()
+                self.callback.on_status("Loading diarization model...")
+                pipeline = Pipeline.from_pretrained(
+                    ModelStore.diarization_model,
+                    use_auth_token=token,
+                    cache_dir=cache_dir
+                )
+                if pipeline is None:
+                    raise ValueError("Could not load the diarization model; the repository "
+                                     "may be gated or private")
+                if store.check(cache_dir) is None:
+                    store.write_manifest(cache_dir)
+                self.diarization_pipeline = pipeline
+            return self.diarization_pipeline
+
+    def prefetch(self, options, diarization=False):
+        """Download and load the models for these options in the background"""
+        def run():
+            try:
+                isolated = self.callback.settings.current.get("process_isolation", "off") != "off"
+                if self.scheduler.is_idle() and not isolated:
+                    self._get_model(options)
+                else:
+                    # A batch is running (or models load in the stage process);
+                    # fetch the weights but leave the loaded model alone
+                    ModelStore(self.callback.settings.current).whisper_model(
+                        options.get("model_size", "base"))
+                token = self.callback.settings.current.get("hf_token")
+                if diarization and token and not isolated:
+                    self._get_diarization_pipeline(token)
+                self.callback.log(f"Model {options.get('model_size', 'base')} ready"
+                                  + (" (with diarization)" if diarization and token else ""))
+            except Exception as e:
+                self.callback.log(f"Model prefetch failed: {str(e)}")
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _resolve_language(self, options):
+        """Return (language or None to detect, whether it came from an earlier detection)"""
+        language = options.get("language") or "auto"
+        if language != "auto":
+            return language, False
+        key = options.get("language_key")
+        if key and key in self.detected_languages:
+            return self.detected_languages[key][0], True
+        return None, False
+
+    def _record_language(self, options, result, language, reused):
+        if reused:
+            self.callback.log(f"Language: {language} (reused from earlier detection, "
+                              f"no detection pass)")
+            return
+        if language is not None:
+            self.callback.log(f"Language: {language} (set by user)")
+            return
+        detected, probability = result["language"], result["language_probability"]
+        self.callback.log(f"Detected language: {detected} (probability {probability:.2f})")
+        key = options.get("language_key")
+        if key and probability >= LANGUAGE_REUSE_THRESHOLD:
+            self.detected_languages[key] = (detected, probability)
+
+    def _report_model_loads(self):
+        summary = self.scheduler.drain_summary()
+        if summary is None:
+            return
+        # Both counts cover first-pass model loads for the batch's jobs only
+        jobs, ungrouped_loads = summary
+        saved = max(ungrouped_loads - self.model_loads, 0)
+        self.callback.log(f"Queue finished: {jobs} job(s), {self.model_loads} model load(s); "
+                          f"submission order would have needed {ungrouped_loads} "
+                          f"({saved} model switch(es) saved)")
+        self.model_loads = 0
+
+    def _process_task(self, job):
+        """Process a single transcription task with proper resource management"""
+        input_path, output_path, options = job.input_path, job.output_path, job.options
+        self.local.speaker_map = {}
+        self.local.job = job
+        try:
+            self.local.host = self._stage_host()
+            job.checkpoint()
+            # Rebuilt per job so scratch settings apply without a restart
+            scratch_space = ScratchSpace(self.callback.settings.current)
+            with scratch_space.job(job.id) as scratch:
+                profiler = JobProfiler.for_job(options, shared=len(self.threads) > 1)
+                if profiler is None:
+                    return self._run_job(input_path, output_path, options, scratch)
+                return self._run_profiled(profiler, input_path, output_path, options, scratch)
+        except JobCancelled:
+            self._on_cancelled(job)
+            return False
+        except Exception as e:
+            if job.cancelled:
+                # Some libraries (yt-dlp) wrap the cancellation in their own error
+                self._on_cancelled(job)
+                return False
+            self.callback.log(f"Error details: {str(e)}")
+            self.callback.on_error(str(e))
+            return False
+        finally:
+            self.local.job = None
+
+    def _stage_host(self):
+        """This thread's stage process, or None when isolation is off"""
+        settings = self.callback.settings.current
+        mode = settings.get("process_isolation", "off")
+        host = getattr(self.local, "host", None)
+        if mode not in PROCESS_ISOLATION_MODES[1:]:
+            if host is not None:
+                host.stop()
+                self.hosts.remove(host)
+                self.local.host = None
+            return None
+        if host is None:
+            host = StageHost(self)
+            self.hosts.append(host)
+        host.per_stage = mode == "stage"
+        host.jobs_per_process = max(int(settings.get("jobs_per_process", 1)), 1)
+        return host
+
+    @contextlib.contextmanager
+    def _stage(self, name):
+        """Reserve resources for a stage of the job running on this thread"""
+        job = getattr(self.local, "job", None)
+        with self.governor.stage(job.id if job else None, name, self._checkpoint):
+            profiler = getattr(self.local, "profiler", None)
+            if profiler is not None and profiler.wants(name):
+                with profiler.section():
+                    yield
+            else:
+                yield
+
+    def _run_profiled(self, profiler, input_path, output_path, options, scratch):
+        """Run a job under the profiler and save its output next to the transcript"""
+        self.local.profiler = profiler
+        try:
+            if profiler.stages is None:
+                with profiler.section():
+                    return self._run_job(input_path, output_path, options, scratch)
+            return self._run_job(input_path, output_path, options, scratch)
+        finally:
+            self.local.profiler = None
+            base_path = os.path.splitext(output_path)[0]
+            try:
+                top = self.callback.settings.current.get("profile_top", 15)
+                for line in profiler.save(base_path, top):
+                    self.callback.log(line)
+            except OSError as e:
+                self.callback.log(f"Could not save profile: {str(e)}")
+
+    def _checkpoint(self):
+        """Cancellation/pause point for the job running on this thread"""
+        job = getattr(self.local, "job", None)
+        if job is not None:
+            job.checkpoint()
+
+    def _on_cancelled(self, job):
+        job.status = "cancelled"
+        self.callback.on_status(f"Cancelled: {os.path.basename(job.input_path)}")
+        # Let go of models nothing else queued or running needs
+        needed = self.scheduler.pending() + [other for other in self.scheduler.running_jobs()
+                                              if other is not job]
+        with self.model_lock:
+            if not any(other.model_key == self.model_key for other in needed):
+                self.model = None
+                self.model_key = None
+                self.scheduler.loaded_key = None
+            if not any(other.options.get("cascade_model", "off") != "off" for other in needed):
+                self.escalation_model = None
+                self.escalation_key = None
+            if not any(other.options.get("use_diarization") for other in needed):
+                self.diarization_pipeline = None
+        import gc
+        gc.collect()
+
+    def cancel_jobs(self, jobs):
+        """Cancel jobs: drop queued ones, stop running ones at their next checkpoint"""
+        removed = self.scheduler.remove(job.id for job in jobs)
+        for job in jobs:
+            if job.id not in removed:
+                job.cancel()
+
+    def pause_job(self, job):
+        """Pause a running job at its next checkpoint, or hold a queued one"""
+        job.pause()
+        if job.status in ("queued", "running"):
+            job.status = "paused" if job.status == "running" else "on hold"
+
+    def resume_job(self, job):
+        if job.status == "paused":
+            job.status = "running"
+        elif job.status == "on hold":
+            job.status = "queued"
+        job.resume()
+        self.scheduler.notify()
+
+    def _run_job(self, input_path, output_path, options, scratch):
+        # Download if YouTube
+        if self._is_youtube_url(input_path):
+            self.callback.on_status("Downloading YouTube audio...")
+            with self._stage("download"):
+                processed_input = self._download_youtube_audio(input_path, scratch)
+        else:
+            processed_input = input_path
+
+        timeline = None
+        if options.get("vad_prefilter"):
+            with self._stage("decode"):
+                timeline, processed_input = self._prefilter_speech(processed_input, options,
+                                                                   scratch)
+            if not timeline.regions:
+                self.callback.log("No speech detected; writing an empty transcript")
+                result = {"segments": SegmentStore(), "language": None,
+                          "language_probability": None}
+                lines = self._write_transcript(result, output_path, options)
+                self._index_transcript(result, input_path, output_path, options, lines)
+                self.callback.on_complete(output_path)
+                return True
+
+        host = getattr(self.local, "host", None)
+        audio = None
+        try:
+            if host is not None:
+                # Decode once here; the stage process reads the samples in place
+                with self._stage("decode"):
+                    self.callback.on_status("Decoding audio...")
+                    audio = self._decode_shared(processed_input,
+                                                MediaProbe.duration(processed_input))
+
+            # Load model (configuration was frozen when the job was queued)
+            self._checkpoint()
+            with self._stage(f"transcribe:{options.get('model_size', 'base')}"):
+                language, reused = self._resolve_language(options)
+                result = self._call_stage("_transcribe", processed_input, options, language,
+                                          samples=audio)
+                if host is not None:
+                    # The model lives in the stage process; keep the scheduler's view of it
+                    key = self._model_key(options)
+                    if host.model_key != key:
+                        self.model_loads += 1
+                    if host.alive:
+                        host.model_key = key
+                        self.scheduler.loaded_key = key
+                self._record_language(options, result, language, reused)
+
+            cascade_model = options.get("cascade_model", "off")
+            if cascade_model not in ("off", "", None):
+                model_size = options.get("model_size", "base")
+                if self._larger_model(cascade_model, model_size):
+                    with self._stage(f"transcribe:{cascade_model}"):
+                        result = self._call_stage("_escalate_low_confidence", result,
+                                                  processed_input, options, samples=audio)
+                else:
+                    self.callback.log(f"Skipping the recheck: {cascade_model} is not larger "
+                                      f"than the {model_size} model used for the first pass")
+
+            # Handle diarization if requested
+            self._checkpoint()
+            if options.get("use_diarization"):
+                self.callback.on_status("Processing speaker diarization...")
+                with self._stage("diarization"):
+                    result = self._call_stage("_add_speaker_diarization", result,
+                                              processed_input,
+                                              scratch if host is None else None, options,
+                                              samples=audio)
+        finally:
+            if audio is not None:
+                audio.close()
+
+        if timeline is not None:
+            # Everything above ran on speech-only audio
+            timeline.restore(result)
+
+        # Save output
+        self._checkpoint()
+        self.callback.on_status("Saving transcript...")
+        lines = self._write_transcript(result, output_path, options)
+        self._index_transcript(result, input_path, output_path, options, lines)
+        if options.get("archive_directory"):
+            self._archive_segments(result, input_path, output_path, options)
+
+        self.callback.on_complete(output_path)
+        return True
+
+    @staticmethod
+    def _larger_model(model, than):
+        """True if Whisper size model is larger than size than (tiny < ... < large)"""
+        sizes = list(MODEL_SPEED_FACTORS)
+        if model not in sizes or than not in sizes:
+            return False
+        return sizes.index(model) > sizes.index(than)
+
+    def _call_stage(self, method, *args, **kwargs):
+        """Run a heavy stage method here, or in this thread's stage process"""
+        host = getattr(self.local, "host", None)
+        if host is None:
+            return getattr(self, method)(*args, **kwargs)
+        profiler = getattr(self.local, "profiler", None)
+        if profiler is None or not profiler.active:
+            return host.call(method, *args, **kwargs)
+        # Profile the stage in the child; here we would only see the wait
+        with profiler.suspended():
+            return host.call(method, *args, profiler=profiler, **kwargs)
+
+    def _transcribe(self, audio_path, options, language, samples=None):
+        """First Whisper pass, over samples when given, else over the file"""
+        model = self._get_model(options)
+        self.callback.on_status("Transcribing audio...")
+        word_timestamps = bool(options.get("word_timestamps"))
+        segments, info = model.transcribe(audio_path if samples is None else samples,
+                                          beam_size=5, language=language,
+                                          word_timestamps=word_timestamps)
+        result = {
+            "segments": SegmentStore(),
+            "language": info.language,
+            "language_probability": info.language_probability,
+            "duration": info.duration,
+        }
+        for segment in segments:
+            # faster-whisper decodes lazily, so this stops work between segments
+            self._checkpoint()
+            result["segments"].append_whisper(segment, word_timestamps)
+        return result
+
+    def _write_transcript(self, result, output_path, options):
+        """Save the transcript, through the lease for jobs from the shared store"""
+        job = self.local.job
+        if job is not None and job.lease is not None:
+            return self._publish_shared(job, result, output_path, options)
+        return self._save_transcript(result, output_path, options)
+
+    def _publish_shared(self, job, result, output_path, options):
+        """Write a shared job's transcript exactly once, fenced by its lease
+
+        The transcript goes to a partial file first; it is renamed into place
+        only inside the store transaction that checks the lease and marks the
+        job done, so a worker that lost its lease can't overwrite the result.
+        """
+        store, store_id, fence = job.lease
+        partial_path = f"{output_path}.{os.getpid()}-{fence}.partial"
+        lines = self._save_transcript(result, partial_path, options)
+        try:
+            store.complete(store_id, fence, lambda: os.replace(partial_path, output_path))
+            job.status = "done"  # The store has it; no more heartbeats needed
+        except LeaseLost:
+            job.cancel()
+            raise JobCancelled()
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return lines
+
+    @staticmethod
+    def _low_confidence(segments, settings):
+        """Indices failing Whisper's own fallback rules, minus probable silence"""
+        import numpy as np
+        compression = segments.column("compression_ratio")
+        logprob = segments.column("avg_logprob")
+        no_speech = segments.column("no_speech_prob")
+        # Repetitive output, usually a hallucination loop
+        repetitive = compression > settings.get("cascade_compression_threshold", 2.4)
+        # Low scores over non-speech aren't worth a bigger model
+        unsure = ((logprob < settings.get("cascade_logprob_threshold", -1.0)) &
+                  (no_speech <= settings.get("cascade_no_speech_threshold", 0.6)))
+        return np.flatnonzero(repetitive | unsure).tolist()
+
+    def _escalate_low_confidence(self, result, audio_path, options, samples=None,
+                                 sample_rate=16000):
+        """Re-decode low-confidence spans with the larger model and splice them in"""
+        settings = self.callback.settings.current
+        segments = result["segments"]
+        flagged = self._low_confidence(segments, settings)
+        if not flagged:
+            self.callback.log("Recheck: all segments confident, nothing escalated")
+            return result
+
+        # Neighbouring flagged segments become one span so the model sees context
+        spans = []
+        for i in flagged:
+            if spans and i == spans[-1][1] + 1:
+                spans[-1][1] = i
+            else:
+                spans.append([i, i])
+
+        model = self._get_escalation_model(options)
+        self.callback.on_status(f"Rechecking {len(spans)} passages with {options['cascade_model']}...")
+        word_timestamps = bool(options.get("word_timestamps"))
+        escalated = 0.0
+        # Rebuild the store once: kept ranges are copied, rechecked spans replaced
+        spliced = SegmentStore()
+        kept = 0
+        for first, last in spans:
+            self._checkpoint()
+            start, end = segments.bounds(first)[0], segments.bounds(last)[1]
+            if samples is not None:
+                clip = samples[int(start * sample_rate):int(end * sample_rate)]
+            else:
+                # Decode just this span, not the whole recording
+                clip = self._decode_to_array(audio_path, end - start, sample_rate, start=start)
+            if not len(clip):
+                continue
+            prompt = segments.text(first - 1) if first > 0 else None
+            redone, _ = model.transcribe(clip, beam_size=5, language=result["language"],
+                                         word_timestamps=word_timestamps,
+                                         initial_prompt=prompt,
+                                         condition_on_previous_text=False)
+            replacement = SegmentStore()
+            for segment in redone:
+                replacement.append_whisper(segment, word_timestamps, offset=start,
+                                           model=options["cascade_model"])
+            if len(replacement):
+                spliced.extend_range(segments, kept, first).extend_range(replacement)
+                kept = last + 1
+                escalated += end - start
+            del clip
+        if kept:
+            result["segments"] = segments = spliced.extend_range(segments, kept)
+
+        speeds = self.scheduler.speed_factors
+        total = result.get("duration") or (segments.bounds(-1)[1] if len(segments) else 0.0)
+        large_only = total * speeds.get(options["cascade_model"], MODEL_SPEED_FACTORS["large"])
+        cascade = (total * speeds.get(options.get("model_size", "base"), MODEL_SPEED_FACTORS["base"])
+                   + escalated * speeds.get(options["cascade_model"], MODEL_SPEED_FACTORS["large"]))
+        share = escalated / total if total else 0.0
+        self.callback.log(
+            f"Recheck: escalated {share:.0%} of the audio "
+            f"({MediaProbe.format_duration(escalated)} in {len(spans)} passages) to "
+            f"{options['cascade_model']}; ~{MediaProbe.format_duration(max(large_only - cascade, 0))} "
+            f"saved versus {options['cascade_model']} only")
+        return result
+
+    def _prefilter_speech(self, audio_path, options, scratch, sample_rate=16000):
+        """Find speech once and write it, silence removed, to a WAV in scratch
+
+        Returns (timeline, path); Whisper and diarization both read the
+        speech-only file and their times are mapped back afterwards. The
+        audio is decoded and searched in blocks, so memory stays flat
+        however long the recording is.
+        """
+        import wave
+        import numpy as np
+
+        self.callback.on_status("Detecting speech...")
+        settings = self.callback.settings.current
+        speech_path = scratch.file("speech.wav")
+        regions = []
+        offset = 0  # Samples in the blocks before this one
+        with wave.open(speech_path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(sample_rate)
+            for block in self._decode_blocks(audio_path, sample_rate=sample_rate):
+                self._checkpoint()
+                ranges = SpeechTimeline.speech_ranges(block, settings)
+                scratch.reserve(sum(end - start for start, end in ranges) * 2 + 44)
+                for start, end in ranges:
+                    chunk = block[start:end]
+                    out.writeframes((np.clip(chunk, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+                    # Speech running over a block boundary becomes two adjacent regions
+                    regions.append(((offset + start) / sample_rate, (offset + end) / sample_rate))
+                offset += len(block)
+        timeline = SpeechTimeline(regions, offset / sample_rate)
+
+        skipped = timeline.skipped_seconds
+        fraction = skipped / timeline.total_seconds if timeline.total_seconds else 0.0
+        # Measured per-file speed covers transcription and diarization alike
+        speed = self.scheduler.speed_factors.get(options.get("model_size", "base"),
+                                                 MODEL_SPEED_FACTORS["base"])
+        self.callback.log(
+            f"Speech detection: skipping {fraction:.0%} of "
+            f"{MediaProbe.format_duration(timeline.total_seconds)} "
+            f"({MediaProbe.format_duration(skipped)} of silence in "
+            f"{len(timeline.regions)} speech regions), saves ~"
+            f"{MediaProbe.format_duration(skipped * speed)}")
+        return timeline, speech_path
+
+    def _archive_segments(self, result, input_path, output_path, options):
+        """Append the job's segments to the batch's columnar archive"""
+        directory = options["archive_directory"]
+        with self.archive_lock:
+            archive = self.archives.get(directory)
+            if archive is None:
+                archive = SegmentArchive(directory,
+                                         self.callback.settings.current.get("archive_format", "auto"))
+                self.archives[directory] = archive
+        archive.add(result, input_path, output_path, options)
+
+    def close_archives(self):
+        """Finish the batch's archive files so they can be read"""
+        with self.archive_lock:
+            archives, self.archives = self.archives, {}
+        for archive in archives.values():
+            try:
+                count = archive.close()
+                self.callback.log(f"Archived {count} segments to {archive.path}")
+            except Exception as e:
+                self.callback.log(f"Could not finish archive {archive.path}: {str(e)}")
+
+    def _index_transcript(self, result, input_path, output_path, options, lines):
+        """Add the saved transcript to the full-text search index"""
+        settings = self.callback.settings.current
+        if not settings.get("search_index", True):
+            return
+        try:
+            TranscriptIndex(settings.get("search_index_path") or TranscriptIndex.default_path).add(
+                output_path, input_path, options.get("title"), options.get("model_size"),
+                result.get("language"), result["segments"], lines)
+        except Exception as e:
+            # Searching is a convenience; never fail the job over it
+            self.callback.log(f"Could not update search index: {str(e)}")
+
+    def _is_youtube_url(self, url):
+        return is_youtube_url(url)
+
+    def _download_youtube_audio(self, url, scratch):
+        """Download YouTube audio into the job's scratch directory"""
+        import yt_dlp
+        try:
+            # Keep the native audio stream; Whisper and ffmpeg decode it directly,
+            # which saves an MP3 re-encode and a second copy on disk
+            outtmpl = scratch.file("youtube_audio.%(ext)s")
+            self.callback.log(f"Downloading to: {scratch.path}")
+            
+            ydl_opts = {
+                'format': 'bestaudio/best',
+                'outtmpl': outtmpl,
+                'quiet': True,
+                'no_warnings': True,
+                'progress_hooks': [lambda d: self._download_progress_hook(d, scratch)]
+            }
+            
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                self.callback.log("Starting YouTube download...")
+                ydl.download([url])
+            
+            downloaded = [f for f in os.listdir(scratch.path)
+                          if f.startswith("youtube_audio.") and not f.endswith(".part")]
+            if not downloaded:
+                raise FileNotFoundError(f"Downloaded file not found in {scratch.path}")
+            
+            final_path = scratch.file(downloaded[0])
+            self.callback.log(f"Download completed: {final_path}")
+            return final_path
+            
+        except Exception as e:
+            self.callback.log(f"Download error: {str(e)}")
+            raise Exception(f"YouTube download failed: {str(e)}")
+
+    def _download_progress_hook(self, d, scratch=None):
+        """Progress hook for YouTube download"""
+        self._checkpoint()
+        if scratch is not None and d['status'] == 'downloading':
+            expected = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            size = max(expected, d.get('downloaded_bytes') or 0)
+            if size > scratch.space.quota_bytes:
+                raise OSError(f"Download of {size / 1e6:.0f} MB exceeds the scratch quota "
+                              f"of {scratch.space.quota_bytes / 1e6:.0f} MB")
+        if d['status'] == 'downloading':
+            try:
+                # Remove ANSI color codes from the percentage string
+                percent = d['_percent_str'].replace('[0;94m', '').replace('[0m', '')
+                speed = d.get('_speed_str', 'N/A').replace('[0;32m', '').replace('[0m', '')
+                self.callback.on_status(f"Downloading: {percent.strip()} at {speed.strip()}")
+            except:
+                pass
+        elif d['status'] == 'finished':
+            self.callback.on_status("Download finished, processing audio...")
+            
+    def _add_speaker_diarization(self, whisper_result, audio_path, scratch, options=None,
+                                 samples=None):
+        options = options or {}
+        try:
+            settings = Settings().current
+            token = settings.get("hf_token")
+            
+            if not token:
+                raise ValueError("No HuggingFace token found in settings")
+            
+            # Suppress torchaudio warning
+            import warnings
+            warnings.filterwarnings("ignore", message=".*torchaudio.*backend.*")
+            
+            try:
+                # First try to load the pipeline
+                pipeline = self._get_diarization_pipeline(token)
+                self._configure_pipeline(pipeline, options)
+                self._checkpoint()
+
+                self.callback.on_status("Performing speaker diarization...")
+                hints = {key: options[key] for key in ("num_speakers", "min_speakers",
+                                                       "max_speakers") if options.get(key)}
+                speakers, read_audio = self._run_windowed_diarization(
+                    pipeline, audio_path, settings, scratch, hints, samples=samples)
+                self._checkpoint()
+                speakers = self._identify_speakers(pipeline, speakers, read_audio,
+                                                   audio_path, settings)
+                    
+                # Add speaker information to whisper segments
+                return SpeakerAligner.apply(whisper_result, speakers)
+
+            except Exception as e:
+                error_msg = str(e)
+                if "gated" in error_msg.lower() or "private" in error_msg.lower():
+                    error_msg = (
+                        "Please accept the model terms for both:\n"
+                        "1. https://huggingface.co/pyannote/speaker-diarization\n"
+                        "2. https://huggingface.co/pyannote/segmentation\n\n"
+                        "After accepting, ensure your token has 'read' access."
+                    )
+                elif "Format not recognised" in str(e):
+                    error_msg = (
+                        "Audio format not supported directly.\n"
+                        "Converting to compatible format..."
+                    )
+                elif "connection" in error_msg.lower():
+                    error_msg = "Failed to connect. Please check your internet connection."
+                
+                choice = self._ask_diarization_fallback(
+                    f"Diarization failed: {error_msg}\n\nWhat would you like to do?")
                 
+                if choice == 1:  # Continue without
+                    return whisper_result
+                elif choice == 2:  # Try alternative
+                    return self._alternative_diarization(whisper_result, audio_path)
+                else:  # Cancel
+                    raise ValueError("Transcription cancelled by user")
+
+        except Exception as e:
+            self.callback.on_status(f"Diarization failed: {str(e)}")
+            import traceback
+            self.callback.log(f"Full diarization error:\n{traceback.format_exc()}")
+            
+            choice = self._ask_diarization_fallback(
+                f"Diarization failed: {str(e)}\n\nWhat would you like to do?")
+            
+            if choice == 1:
+                return whisper_result
+            elif choice == 2:
+                return self._alternative_diarization(whisper_result, audio_path)
+            else:
+                raise ValueError("Transcription cancelled by user")
+
+    def _get_speaker_index(self, settings):
+        if self.speaker_index is None:
+            self.speaker_index = SpeakerIndex(SpeakerIndex.default_path,
+                                              settings.get("speaker_match_threshold", 0.6))
+        return self.speaker_index
+
+    def _identify_speakers(self, pipeline, speakers, read_audio, audio_path, settings):
+        """Relabel diarized speakers with IDs that stay stable across files
+
+        With the speaker index on, each speaker's embedding is matched against
+        known voices; otherwise speakers are numbered by first appearance.
+        """
+        labels = {}
+        taken = set()  # Names an unmatched speaker must not reuse
+        if settings.get("use_speaker_index", True) and speakers:
+            try:
+                index = self._get_speaker_index(settings)
+                embeddings = self._speaker_embeddings(pipeline, speakers, read_audio,
+                                                      audio_path, index)
+                labels = index.identify(embeddings)
+                index.save()
+                # Speakers without an embedding (only very short turns) are
+                # numbered past the known voices, not as one of them
+                taken = set(index.names)
+                self.callback.log(f"Matched {len(labels)} speaker(s) against "
+                                  f"{len(index)} known voice(s)")
+            except Exception as e:
+                self.callback.log(f"Speaker index unavailable, numbering speakers per file: {e}")
+                labels = {}
+
+        relabeled = []
+        for turn in sorted(speakers, key=lambda t: t['start']):
+            if turn['speaker'] in labels:
+                label = labels[turn['speaker']]
+            else:
+                label = self._get_speaker_label(turn['speaker'], taken)
+            relabeled.append({'start': turn['start'], 'end': turn['end'], 'speaker': label})
+        return relabeled
+
+    def _speaker_embeddings(self, pipeline, speakers, read_audio, audio_path, index,
+                            sample_rate=16000):
+        """One normalised embedding per diarized speaker, from its longest turns
+
+        Uses the embedding model already inside the diarization pipeline.
+        Results are cached in the index by file and turn layout, so re-running
+        a file reuses them instead of recomputing.
+        """
+        import hashlib
+
+        embedder = getattr(pipeline, "_embedding", None)
+        if embedder is None:
+            raise ValueError("this pyannote version does not expose its embedding model")
+
+        try:
+            stat = os.stat(audio_path)
+            audio_id = f"{os.path.abspath(audio_path)}|{stat.st_size}|{stat.st_mtime}"
+        except OSError:
+            audio_id = audio_path
+
+        by_speaker = {}
+        for turn in speakers:
+            by_speaker.setdefault(turn['speaker'], []).append(turn)
+
+        embeddings = {}
+        for label, turns in by_speaker.items():
+            self._checkpoint()
+            longest = sorted(turns, key=lambda t: t['end'] - t['start'], reverse=True)[:3]
+            layout = ";".join(f"{t['start']:.2f}-{t['end']:.2f}" for t in longest)
+            cache_key = hashlib.sha1(f"{audio_id}|{layout}".encode("utf-8")).hexdigest()
+            cached = index.cached_embedding(cache_key)
+            if cached is not None:
+                embeddings[label] = cached
+                continue
+
+            vector = self._embed_turns(embedder, longest, read_audio, sample_rate)
+            if vector is not None:
+                embeddings[label] = index.cache_embedding(cache_key, vector)
+        return embeddings
+
+    @staticmethod
+    def _embed_turns(embedder, turns, read_audio, sample_rate=16000):
+        """Length-weighted mean embedding of up to 10 s from each turn, or None"""
+        import numpy as np
+        import torch
+
+        clips = []
+        for turn in turns:
+            clip = read_audio(turn['start'], min(turn['end'], turn['start'] + 10.0))
+            if len(clip) >= sample_rate // 2:
+                clips.append(clip)
+        if not clips:
+            return None
+
+        length = max(len(clip) for clip in clips)
+        batch = np.zeros((len(clips), 1, length), dtype=np.float32)
+        masks = np.zeros((len(clips), length), dtype=np.float32)
+        for i, clip in enumerate(clips):
+            batch[i, 0, :len(clip)] = clip
+            masks[i, :len(clip)] = 1.0
+        vectors = np.asarray(embedder(torch.from_numpy(batch), masks=torch.from_numpy(masks)),
+                             dtype=np.float32)
+        weights = np.array([len(clip) for clip in clips], dtype=np.float32)
+        valid = ~np.isnan(vectors).any(axis=1)
+        if not valid.any():
+            return None
+        return np.average(vectors[valid], axis=0, weights=weights[valid])
+
+    def _ask_diarization_fallback(self, message):
+        """Ask how to continue after diarization fails; headless runs continue without it"""
+        if getattr(self.callback, "root", None) is None:
+            self.callback.log(f"{message.splitlines()[0]} - continuing without diarization")
+            return 1
+        dialog = ChoiceDialog(self.callback.root, "Diarization Failed", message)
+        return dialog.result
+
+    def _decode_to_wav(self, audio_path, wav_path, sample_rate=16000):
+        """Decode any input to 16-bit mono WAV at the diarization sample rate"""
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", audio_path,
+             "-ac", "1", "-ar", str(sample_rate), "-acodec", "pcm_s16le", wav_path],
+            capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not decode audio: {result.stderr.strip()}")
+
+    def _decode_to_array(self, audio_path, duration=None, sample_rate=16000, start=None,
+                         buffer=None):
+        """Decode to mono float32 samples in memory through an ffmpeg pipe
+
+        With start, only the duration seconds from there are decoded. With a
+        buffer, samples are decoded into it and a view of it is returned,
+        unless the audio turns out longer than the buffer.
+        """
+        import numpy as np
+
+        command = ["ffmpeg", "-nostdin", "-v", "error"]
+        if start is not None:
+            command += ["-ss", f"{start:.3f}", "-t", f"{duration:.3f}"]
+        command += ["-i", audio_path,
+                    "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"]
+        # Read straight into a preallocated buffer when the length is known
+        if buffer is None:
+            buffer = np.empty(int((duration or 0) * sample_rate) + sample_rate, dtype=np.float32)
+        samples = buffer
+        view = memoryview(samples).cast("B")
+        filled = 0
+        with subprocess.Popen(command, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE) as process:
+            while filled < len(view):
+                count = process.stdout.readinto(view[filled:])
+                if not count:
+                    break
+                filled += count
+            extra = process.stdout.read()
+            errors = process.stderr.read()
+            process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not decode audio: {errors.decode(errors='replace').strip()}")
+        samples = samples[:filled // 4]
+        if extra:
+            samples = np.concatenate([samples, np.frombuffer(extra, dtype=np.float32)])
+        return samples
+
+    def _decode_shared(self, audio_path, duration, sample_rate=16000):
+        """Decode straight into a new SharedAudio block, with no private copy"""
+        import numpy as np
+
+        audio = SharedAudio(length=int((duration or 0) * sample_rate) + sample_rate)
+        try:
+            buffer = audio.array()
+            samples = self._decode_to_array(audio_path, duration, sample_rate, buffer=buffer)
+            if np.may_share_memory(samples, buffer):
+                audio.length = len(samples)
+                return audio
+        except BaseException:
+            buffer = samples = None
+            audio.close()
+            raise
+        # Longer than probed: move to a block of the right size
+        buffer = None
+        audio.close()
+        return SharedAudio(samples)
+
+    def _decode_blocks(self, audio_path, block_seconds=300, sample_rate=16000):
+        """Decode to mono float32 samples, yielded block_seconds at a time"""
+        import numpy as np
+
+        command = ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_path,
+                   "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"]
+        block_size = int(block_seconds * sample_rate)
+        with subprocess.Popen(command, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE) as process:
+            try:
+                while True:
+                    block = np.empty(block_size, dtype=np.float32)
+                    view = memoryview(block).cast("B")
+                    filled = 0
+                    while filled < len(view):
+                        count = process.stdout.readinto(view[filled:])
+                        if not count:
+                            break
+                        filled += count
+                    if filled >= 4:
+                        yield block[:filled // 4]
+                    if filled < len(view):
+                        break
+                errors = process.stderr.read()
+                process.wait()
+            finally:
+                if process.poll() is None:
+                    # Abandoned part way (e.g. the job was cancelled)
+                    process.kill()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not decode audio: {errors.decode(errors='replace').strip()}")
+
+    @staticmethod
+    def _configure_pipeline(pipeline, options):
+        """Apply the job's inference batch sizes and segmentation step
+
+        The pipeline is shared, so this runs before every job; only one
+        diarization runs at a time.
+        """
+        segmentation_batch = options.get("segmentation_batch_size")
+        if segmentation_batch and hasattr(pipeline, "segmentation_batch_size"):
+            pipeline.segmentation_batch_size = int(segmentation_batch)
+        embedding_batch = options.get("embedding_batch_size")
+        if embedding_batch and hasattr(pipeline, "embedding_batch_size"):
+            pipeline.embedding_batch_size = int(embedding_batch)
+        step = options.get("segmentation_step")
+        segmentation = getattr(pipeline, "_segmentation", None)
+        if step and segmentation is not None and hasattr(segmentation, "duration"):
+            # Step is a fraction of the segmentation window; larger is faster
+            segmentation.step = float(step) * segmentation.duration
+
+    def _window_embeddings(self, embedder, turns, read_audio, sample_rate=16000):
+        """Voice embedding per local speaker of one window, for matching across windows"""
+        if embedder is None:
+            return {}
+        by_speaker = {}
+        for turn in turns:
+            by_speaker.setdefault(turn['speaker'], []).append(turn)
+        embeddings = {}
+        try:
+            for label, speaker_turns in by_speaker.items():
+                longest = sorted(speaker_turns, key=lambda t: t['end'] - t['start'],
+                                 reverse=True)[:3]
+                vector = self._embed_turns(embedder, longest, read_audio, sample_rate)
+                if vector is not None:
+                    embeddings[label] = vector
+        except Exception as e:
+            # Overlap matching still works without embeddings
+            self.callback.log(f"Window speaker embeddings unavailable: {e}")
+            return {}
+        return embeddings
+
+    def _run_windowed_diarization(self, pipeline, audio_path, settings, scratch,
+                                  hints=None, samples=None, sample_rate=16000):
+        """Diarize in fixed-size overlapping windows so memory stays flat for any length
+
+        Returns (turns, read_audio) where read_audio(start, end) gives the samples
+        for a span, for computing speaker embeddings afterwards. Samples already
+        decoded (shared with a stage process) are windowed in place.
+        """
+        hints = hints or {}
+        import soundfile as sf
+        import torch
+
+        # Keep each window's float32 buffer to a quarter of the ceiling, leaving
+        # room for pyannote's own intermediates
+        ceiling = settings.get("diarization_memory_mb", 512) * 1024 * 1024
+        window_seconds = max(ceiling / 4 / (sample_rate * 4), 120)
+        overlap_seconds = min(settings.get("diarization_window_overlap", 30),
+                              window_seconds / 4)
+
+        if samples is not None:
+            duration = len(samples) / float(sample_rate)
+        else:
+            duration = MediaProbe.duration(audio_path)
+        if duration is not None and duration <= window_seconds:
+            # Fits in one window: pipe the samples straight to pyannote, no temp file
+            if samples is None:
+                self.callback.on_status("Decoding audio...")
+                samples = self._decode_to_array(audio_path, duration, sample_rate)
+            waveform = torch.from_numpy(samples).unsqueeze(0)
+            diarization = pipeline({"waveform": waveform, "sample_rate": sample_rate}, **hints)
+            speakers = [{'start': turn.start, 'end': turn.end, 'speaker': speaker}
+                        for turn, _, speaker in diarization.itertracks(yield_label=True)]
+            read_audio = lambda start, end: samples[int(start * sample_rate):int(end * sample_rate)]
+            return speakers, read_audio
+
+        if samples is not None:
+            total_seconds = duration
+
+            def read_audio(start, end):
+                return samples[int(start * sample_rate):int(end * sample_rate)]
+        else:
+            # Too long to hold in memory: stream-decode to a 16-bit WAV in scratch
+            self.callback.on_status("Converting audio format...")
+            if duration is not None:
+                scratch.reserve(int(duration * sample_rate * 2))
+            wav_path = scratch.file("diarization.wav")
+            self._decode_to_wav(audio_path, wav_path, sample_rate)
+
+            info = sf.info(wav_path)
+            sample_rate = info.samplerate
+            total_seconds = info.frames / float(sample_rate)
+
+            def read_audio(start, end):
+                with sf.SoundFile(wav_path) as audio:
+                    audio.seek(int(start * sample_rate))
+                    return audio.read(int((end - start) * sample_rate), dtype='float32')
+
+        # A window may hear only some of the speakers, so an exact count or a
+        # minimum would force a split; only the upper bound carries over
+        upper = hints.get("num_speakers") or hints.get("max_speakers")
+        window_hints = {"max_speakers": upper} if upper else {}
+
+        stitcher = DiarizationStitcher(settings.get("speaker_match_threshold", 0.6))
+        embedder = getattr(pipeline, "_embedding", None)
+        step = window_seconds - overlap_seconds
+        window_count = max(int((total_seconds - overlap_seconds) // step) + 1, 1)
+        window_start = 0.0
+        previous_end = None
+        index = 0
+        while window_start < total_seconds:
+            self._checkpoint()
+            index += 1
+            self.callback.on_status(
+                f"Performing speaker diarization (window {index}/{window_count})...")
+            frames = read_audio(window_start, window_start + window_seconds)
+            window_end = window_start + len(frames) / float(sample_rate)
+            waveform = torch.from_numpy(frames).unsqueeze(0)
+            diarization = pipeline({"waveform": waveform, "sample_rate": sample_rate},
+                                   **window_hints)
+            del waveform, frames
+
+            turns = [{'start': turn.start + window_start,
+                      'end': turn.end + window_start,
+                      'speaker': speaker}
+                     for turn, _, speaker in diarization.itertracks(yield_label=True)]
+            stitcher.add_window(window_start, turns, previous_end,
+                                self._window_embeddings(embedder, turns, read_audio, sample_rate))
+
+            if window_end >= total_seconds:
+                break
+            previous_end = window_end
+            window_start += step
+
+        return stitcher.finish(), read_audio
+
+    def _alternative_diarization(self, whisper_result, audio_path):
+        """Alternative diarization method using direct pipeline"""
+        try:
+            from pyannote.audio import Pipeline
+            self.callback.on_status("Attempting alternative diarization method...")
+            
+            # Try using a different model configuration
+            pipeline = Pipeline.from_pretrained(
+                "pyannote/speaker-diarization@2.1",
+                use_auth_token=self.callback.settings.current.get("hf_token")
+            )
+
+            # Apply diarization
+            self.callback.on_status("Running diarization...")
+            diarization = pipeline(audio_path)
+            
+            # Process results
+            speakers = []
+            for turn, _, speaker in diarization.itertracks(yield_label=True):
+                speakers.append({
+                    'start': turn.start,
+                    'end': turn.end,
+                    'speaker': speaker
+                })
+            
+            # Number speakers by first appearance
+            speakers = self._identify_speakers(pipeline, speakers, None, audio_path,
+                                               {"use_speaker_index": False})
+            
+            # Add speaker information to whisper segments
+            return SpeakerAligner.apply(whisper_result, speakers)
+            
+        except Exception as e:
+            self.callback.on_status(f"Alternative diarization failed: {str(e)}")
+            self.callback.log(f"Alternative diarization error:\n{traceback.format_exc()}")
+            
+            if getattr(self.callback, "root", None) is None:
+                self.callback.log("Alternative diarization failed - continuing without diarization")
+                return whisper_result
+            if messagebox.askyesno("Alternative Method Failed",
+                "Alternative diarization method also failed.\n\n"
+                "Would you like to continue without speaker diarization?"):
                 return whisper_result
+            else:
+                raise ValueError("Transcription cancelled by user")
+
+    def _save_transcript(self, result, output_path, options):
+        """Save transcript with improved formatting for speaker diarization
+
+        Returns the 1-based line number each segment was written on.
+        """
+        lines = []
+        with open(output_path, "w", encoding="utf-8") as f:
+            current_speaker = None
+            line = 1
+            
+            for start, end, speaker, text in SegmentStore.coerce(result["segments"]).rows():
+                # Get timestamp if needed
+                timestamp = ""
+                if options.get("include_timestamps"):
+                    timestamp = f"[{start:.2f}s - {end:.2f}s] "
+                
+                # Handle speaker changes
+                if speaker is None:
+                    speaker = 'UNKNOWN'
+                text = text.strip()
+                
+                # Only write speaker header when speaker changes
+                if speaker != current_speaker:
+                    # Add single blank line between speakers (but not at the start of file)
+                    if current_speaker is not None:
+                        f.write("\n")
+                        line += 1
+                    f.write(f"SPEAKER {speaker}\n")
+                    line += 1
+                    current_speaker = speaker
+                
+                lines.append(line)
+                # Write the text with optional timestamp
+                if options.get("include_timestamps"):
+                    f.write(f"{timestamp}{text}")
+                else:
+                    f.write(text)
+                
+                # Add a single newline after each utterance
+                f.write("\n")
+                line += 1
+        return lines
+
+    def add_task(self, input_path, output_path, options, duration=None,
+                 priority=0, batch_id=None):
+        job = TranscriptionJob(input_path, output_path, options,
+                               duration=duration, priority=priority,
+                               batch_id=batch_id)
+        self.scheduler.put(job)
+        return job
+
+    def wait_idle(self, poll=0.5):
+        """Block until every queued job has finished"""
+        while not self.scheduler.is_idle():
+            time.sleep(poll)
+
+    def stop(self, cancel=False):
+        """Stop taking new jobs; with cancel, also stop the running ones"""
+        self.running = False
+        if cancel:
+            for job in self.scheduler.running_jobs():
+                job.cancel()
+
+    def stop_hosts(self):
+        """End the stage processes; call once the worker threads are done"""
+        for host in list(self.hosts):
+            host.stop()
+
+class SharedAudio:
+    """Decoded 16 kHz float32 samples in a shared-memory block
+
+    Pickles as the block's name and length, so a stage process attaches to
+    the same pages instead of receiving a copy of a multi-hour recording.
+    Without samples or a name, an empty block of length samples is created
+    to decode into. The creating side unlinks the block on close().
+    """
+    def __init__(self, samples=None, name=None, length=0):
+        from multiprocessing import shared_memory
+
+        if name is None:
+            self.length = len(samples) if samples is not None else length
+            self.block = shared_memory.SharedMemory(create=True, size=max(self.length * 4, 1))
+            if samples is not None:
+                self.array()[:] = samples
+            self.owner = True
+        else:
+            self.length = length
+            self.block = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+    def __reduce__(self):
+        return (SharedAudio, (None, self.block.name, self.length))
+
+    def array(self):
+        import numpy as np
+        return np.ndarray(self.length, dtype=np.float32, buffer=self.block.buf)
+
+    def close(self):
+        try:
+            self.block.close()
+        except BufferError:
+            pass  # A view is still alive; the mapping goes with the process
+        if self.owner:
+            try:
+                self.block.unlink()
+            except FileNotFoundError:
+                pass
+
+class StageHost:
+    """A child process that runs a worker's heavy stages
+
+    Whisper, the recheck model and pyannote load in the child and stay there
+    between calls, off the GUI's interpreter lock. Ending the child is the
+    only dependable way to hand torch and CTranslate2 memory back to the OS,
+    so it is recycled after jobs_per_process jobs (or after every stage) and
+    whenever its thread runs out of work. Status and log messages stream
+    back while a stage runs; a cancelled job's child is killed.
+    """
+    def __init__(self, worker, jobs_per_process=1, per_stage=False):
+        self.worker = worker
+        self.jobs_per_process = jobs_per_process
+        self.per_stage = per_stage
+        self.process = None
+        self.requests = None
+        self.events = None
+        self.jobs = 0
+        self.model_key = None  # Whisper model loaded in the child, if known
+        self._calls = itertools.count(1)
+        # Held for a whole call, so another thread can't stop the child mid-stage
+        self.lock = threading.RLock()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        import multiprocessing
+        # Spawn, not fork: a forked copy of a process holding Tk and torch threads
+        # can deadlock, and would start out as large as the parent
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.events = context.Queue()
+        self.process = context.Process(
+            target=run_stage_host, name="scribey-stages", daemon=True,
+            args=(self.requests, self.events, dict(self.worker.callback.settings.current)))
+        self.process.start()
+        self.worker.governor.track(self.process.pid)
+        self.jobs = 0
+        self.model_key = None
+
+    def call(self, method, *args, profiler=None, **kwargs):
+        """Run worker.<method>(*args, **kwargs) in the child and return its result
+
+        With a profiler, the child profiles the call in the same mode and the
+        result is merged into it.
+        """
+        with self.lock:
+            return self._call(method, args, kwargs, profiler)
+
+    def _call(self, method, args, kwargs, profiler=None):
+        if not self.alive:
+            self.start()
+        call_id = next(self._calls)
+        self.requests.put((call_id, method, args, kwargs, profiler and profiler.mode))
+        callback = self.worker.callback
+        try:
+            while True:
+                try:
+                    event = self.events.get(timeout=0.2)
+                except queue.Empty:
+                    if not self.process.is_alive():
+                        code = self.process.exitcode
+                        self.stop()
+                        raise RuntimeError(f"Stage process exited unexpectedly (code {code})")
+                    # A cancelled job stops waiting; pausing holds the result until resumed
+                    self.worker._checkpoint()
+                    continue
+                kind = event[0]
+                if kind == "status":
+                    callback.on_status(event[1])
+                elif kind == "log":
+                    callback.log(event[1])
+                elif kind == "ask":
+                    self.requests.put(("answer", self.worker._ask_diarization_fallback(event[1])))
+                elif event[1] != call_id:
+                    continue  # Left over from a call that was abandoned
+                elif kind == "result":
+                    if profiler is not None and event[3] is not None:
+                        profiler.merge(*event[3])
+                    return event[2]
+                else:
+                    callback.log(f"Stage process error:\n{event[3]}")
+                    raise RuntimeError(event[2])
+        except JobCancelled:
+            # The stage may be anywhere; killing the child is the fast way out
+            self.kill()
+            raise
+        finally:
+            if self.per_stage:
+                self.stop()
+
+    def job_finished(self):
+        self.jobs += 1
+        if self.jobs >= self.jobs_per_process:
+            self.stop()
+
+    def stop(self, timeout=10):
+        """Let the child finish and exit, killing it if it doesn't"""
+        with self.lock:
+            if self.process is None:
+                return
+            if self.process.is_alive():
+                self.requests.put(None)
+                self.process.join(timeout)
+            self.kill()
+
+    def kill(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.worker.governor.untrack(self.process.pid)
+        for channel in (self.requests, self.events):
+            channel.cancel_join_thread()
+            channel.close()
+        self.process = self.requests = self.events = None
+        self.model_key = None
+        self.worker.scheduler.loaded_key = None
+
+class StageHostCallback:
+    """Worker callback inside a stage process: forwards messages to the parent"""
+    root = None
+
+    def __init__(self, requests, events, settings):
+        self.requests = requests
+        self.events = events
+        self.settings = Settings()
+        self.settings.current = settings
+
+    def log(self, message):
+        self.events.put(("log", message))
+
+    def on_status(self, message):
+        self.events.put(("status", message))
+
+    def on_progress(self, value):
+        pass
+
+    def on_queue_update(self):
+        pass
+
+    def on_resources_update(self):
+        pass
+
+    def on_error(self, error):
+        self.log(f"Error: {error}")
+
+    def on_complete(self, output_path):
+        pass
+
+    def ask(self, message):
+        """Put a question to the parent (which can show dialogs) and wait for the answer"""
+        self.events.put(("ask", message))
+        while True:
+            request = self.requests.get()
+            if request is not None and request[0] == "answer":
+                return request[1]
+
+class StageHostWorker(TranscriptionWorker):
+    """The worker inside a stage process: no queue threads, questions go to the parent"""
+    def __init__(self, callback):
+        super().__init__(callback, start=False)
+
+    def _ask_diarization_fallback(self, message):
+        return self.callback.ask(message)
+
+    def _get_speaker_index(self, settings):
+        # Other stage processes may have added voices since; always read the file
+        self.speaker_index = None
+        return super()._get_speaker_index(settings)
+
+def run_stage_host(requests, events, settings):
+    """Stage process main loop: run requested worker methods until told to stop"""
+    import gc
+    worker = StageHostWorker(StageHostCallback(requests, events, settings))
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        if request[0] == "answer":
+            continue
+        call_id, method, args, kwargs, profile_mode = request
+        shared = [value for value in list(args) + list(kwargs.values())
+                  if isinstance(value, SharedAudio)]
+        args = [value.array() if isinstance(value, SharedAudio) else value for value in args]
+        kwargs = {key: value.array() if isinstance(value, SharedAudio) else value
+                  for key, value in kwargs.items()}
+        worker.local.speaker_map = {}
+        profiler = JobProfiler(profile_mode) if profile_mode else None
+        try:
+            if profiler is None:
+                result = getattr(worker, method)(*args, **kwargs)
+            else:
+                with profiler.section():
+                    result = getattr(worker, method)(*args, **kwargs)
+            events.put(("result", call_id, result, profiler and profiler.export()))
+        except BaseException as e:
+            events.put(("error", call_id, str(e), traceback.format_exc()))
+        finally:
+            if profiler is not None:
+                profiler._stop()
+            # Views of the shared block must go before it can be closed
+            args = kwargs = result = None
+            gc.collect()
+            for audio in shared:
+                audio.close()
+
+class StreamingTranscriber:
+    """Rolling-window transcription of live audio from stdin, a FIFO or a growing file
+
+    Audio is re-decoded every `step` seconds over the unfinished tail of the
+    stream. Segments that end at least `settle` seconds before the newest audio
+    are final: they are emitted once and cut from the buffer. The rest is
+    emitted as a partial that later decodes may revise.
+    """
+    SAMPLE_RATE = 16000
+    CHUNK_SECONDS = 0.25
+
+    def __init__(self, model, options, emit, step=1.0, window=15.0, settle=2.0):
+        self.model = model
+        self.options = options
+        self.emit = emit  # emit(kind, start, end, text, latency)
+        self.step = step
+        self.window = max(window, settle + step)
+        self.settle = settle
+        language = options.get("language") or "auto"
+        self.language = None if language == "auto" else language
+        self.prompt = None
+        self.arrivals = []  # (total samples received, wall time) per chunk
+        self.latencies = []
+
+    @staticmethod
+    def read_source(source, raw_format=None, raw_rate=16000, follow=False,
+                    idle_timeout=5.0):
+        """Yield mono float32 chunks at 16 kHz from stdin ('-'), a FIFO or a file
+
+        Encoded input and raw PCM at other rates go through an ffmpeg pipe. With
+        follow, a regular file is read like `tail -f` until it stops growing.
+        """
+        import numpy as np
+
+        def open_input():
+            if source == "-":
+                return sys.stdin.buffer
+            return open(source, "rb")
+
+        def read_input(stream):
+            idle_since = None
+            while True:
+                data = stream.read1(65536) if hasattr(stream, "read1") else stream.read(65536)
+                if data:
+                    idle_since = None
+                    yield data
+                    continue
+                if not follow or source == "-":
+                    return
+                # Growing file: wait for the writer, give up after idle_timeout
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since > idle_timeout:
+                    return
+                time.sleep(0.1)
+
+        chunk_samples = int(StreamingTranscriber.SAMPLE_RATE * StreamingTranscriber.CHUNK_SECONDS)
+        stream = open_input()
+        try:
+            if raw_format == "s16le" and raw_rate == StreamingTranscriber.SAMPLE_RATE:
+                # Already in the right shape: no decoder in the path at all
+                pending = b""
+                for data in read_input(stream):
+                    pending += data
+                    usable = len(pending) - len(pending) % 2
+                    if usable >= chunk_samples * 2:
+                        yield np.frombuffer(pending[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                        pending = pending[usable:]
+                if len(pending) >= 2:
+                    usable = len(pending) - len(pending) % 2
+                    yield np.frombuffer(pending[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                return
+
+            command = ["ffmpeg", "-nostdin", "-v", "error",
+                       "-probesize", "32k", "-analyzeduration", "0"]
+            if raw_format:
+                command += ["-f", raw_format, "-ar", str(raw_rate), "-ac", "1"]
+            command += ["-i", "pipe:0", "-ac", "1", "-ar", str(StreamingTranscriber.SAMPLE_RATE),
+                        "-f", "f32le", "pipe:1"]
+            process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+            def feed():
+                try:
+                    for data in read_input(stream):
+                        process.stdin.write(data)
+                        process.stdin.flush()
+                except (BrokenPipeError, OSError):
+                    pass
+                finally:
+                    try:
+                        process.stdin.close()
+                    except OSError:
+                        pass
+
+            threading.Thread(target=feed, daemon=True).start()
+            try:
+                while True:
+                    data = process.stdout.read1(chunk_samples * 4)
+                    if not data:
+                        break
+                    usable = len(data) - len(data) % 4
+                    while usable != len(data):
+                        more = process.stdout.read(4 - len(data) % 4)
+                        if not more:
+                            break
+                        data += more
+                        usable = len(data) - len(data) % 4
+                    yield np.frombuffer(data[:usable], dtype=np.float32)
+            finally:
+                process.kill()
+                process.wait()
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+    def run(self, chunks):
+        """Consume audio chunks until the source ends, emitting segments as they settle"""
+        import numpy as np
+
+        incoming = queue.Queue()
+
+        # Read on a separate thread so a slow decode never leaves audio sitting in the pipe
+        def reader():
+            try:
+                for chunk in chunks:
+                    incoming.put(chunk)
+            finally:
+                incoming.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+
+        rate = self.SAMPLE_RATE
+        parts = []
+        buffer = np.zeros(0, dtype=np.float32)
+        offset = 0.0  # Stream time at the start of the buffer
+        received = 0
+        since_decode = 0
+        finished = False
+        while not finished:
+            items = [incoming.get()]
+            while True:
+                try:
+                    items.append(incoming.get_nowait())
+                except queue.Empty:
+                    break
+            for chunk in items:
+                if chunk is None:
+                    finished = True
+                    continue
+                parts.append(chunk)
+                received += len(chunk)
+                since_decode += len(chunk)
+                self.arrivals.append((received, time.time()))
+
+            if not finished and since_decode < self.step * rate:
+                continue
+            since_decode = 0
+            if parts:
+                buffer = np.concatenate([buffer] + parts)
+                parts = []
+            if len(buffer):
+                cut = self._decode(buffer, offset, final=finished)
+                buffer = buffer[int(cut * rate):]
+                offset += cut
+
+    def _decode(self, buffer, offset, final):
+        """Transcribe the buffer; returns how many seconds from its start are now final"""
+        rate = self.SAMPLE_RATE
+        segments, info = self.model.transcribe(
+            buffer,
+            beam_size=self.options.get("beam_size", 1),
+            language=self.language,
+            condition_on_previous_text=False,
+            initial_prompt=self.prompt)
+        segments = list(segments)
+        if self.language is None and info.language_probability >= LANGUAGE_REUSE_THRESHOLD:
+            # Detect once, then skip detection on every later window
+            self.language = info.language
+
+        buffer_seconds = len(buffer) / float(rate)
+        if final:
+            finals, partials = segments, []
+        else:
+            cutoff = buffer_seconds - self.settle
+            finals = [segment for segment in segments if segment.end <= cutoff]
+            partials = segments[len(finals):]
+            if not finals and buffer_seconds >= self.window and len(segments) > 1:
+                # Window full without a natural break: settle everything but the last segment
+                finals, partials = segments[:-1], segments[-1:]
+
+        for segment in finals:
+            text = segment.text.strip()
+            if text:
+                latency = self._latency(offset + segment.end)
+                self.latencies.append(latency)
+                self.emit("final", offset + segment.start, offset + segment.end, text, latency)
+                self.prompt = ((self.prompt or "") + " " + text)[-200:]
+
+        if partials:
+            text = " ".join(segment.text.strip() for segment in partials).strip()
+            if text:
+                self.emit("partial", offset + partials[0].start, offset + partials[-1].end,
+                          text, self._latency(offset + partials[-1].end))
+
+        if finals:
+            return min(finals[-1].end, buffer_seconds)
+        if not segments and buffer_seconds >= self.window:
+            # Nothing but silence: keep only the tail in case speech is starting
+            return buffer_seconds - self.settle
+        return 0.0
+
+    def _latency(self, stream_time):
+        """Seconds between the audio at stream_time arriving and now"""
+        import bisect
+        sample = int(stream_time * self.SAMPLE_RATE)
+        index = bisect.bisect_left(self.arrivals, (sample, 0.0))
+        if index >= len(self.arrivals):
+            index = len(self.arrivals) - 1
+        return max(time.time() - self.arrivals[index][1], 0.0) if self.arrivals else 0.0
+
+class SegmentArchive:
+    """Columnar archive of every segment in a batch, for analytics
+
+    Rows are buffered and written in chunks: row groups of one Parquet file
+    (pyarrow), or gzip members appended to a JSONL file where pyarrow isn't
+    installed. Each writer creates its own file, so an archive directory
+    grows into a dataset that pandas, pyarrow or DuckDB read as one table.
+    """
+    columns = [("file", "string"), ("transcript", "string"), ("title", "string"),
+               ("segment", "int32"), ("start", "float64"), ("end", "float64"),
+               ("speaker", "string"), ("text", "string"), ("model", "string"),
+               ("language", "string"), ("confidence", "float64"),
+               ("avg_logprob", "float64"), ("no_speech_prob", "float64"),
+               ("compression_ratio", "float64")]
+    _serial = itertools.count(1)
+
+    def __init__(self, directory, archive_format="auto", chunk_rows=50000):
+        import importlib.util
+        if archive_format == "auto":
+            archive_format = "parquet" if importlib.util.find_spec("pyarrow") else "jsonl"
+        self.format = archive_format
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        name = (f"segments_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+                f"_{next(SegmentArchive._serial)}")
+        self.path = os.path.join(directory, name + (".parquet" if archive_format == "parquet"
+                                                    else ".jsonl.gz"))
+        # Parquet is only readable once its footer is written, so it is
+        # written under a temporary name and renamed by close()
+        self.write_path = self.path + ".partial" if archive_format == "parquet" else self.path
+        self.rows = []
+        self.count = 0
+        self.writer = None
+        self.schema = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def records(result, input_path, output_path, options):
+        import math
+        for index, segment in enumerate(result["segments"]):
+            avg_logprob = segment.get("avg_logprob")
+            speaker = segment.get("speaker")
+            yield {
+                "file": input_path,
+                "transcript": os.path.abspath(output_path),
+                "title": options.get("title"),
+                "segment": index,
+                "start": segment.get("start"),
+                "end": segment.get("end"),
+                "speaker": str(speaker) if speaker is not None else None,
+                "text": segment["text"].strip(),
+                "model": segment.get("model", options.get("model_size")),
+                "language": result.get("language"),
+                # Mean per-token probability
+                "confidence": math.exp(avg_logprob) if avg_logprob is not None else None,
+                "avg_logprob": avg_logprob,
+                "no_speech_prob": segment.get("no_speech_prob"),
+                "compression_ratio": segment.get("compression_ratio"),
+            }
+
+    def add(self, result, input_path, output_path, options):
+        with self.lock:
+            for record in self.records(result, input_path, output_path, options):
+                self.rows.append(record)
+                if len(self.rows) >= self.chunk_rows:
+                    self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.writer is None:
+                self.schema = pa.schema([(name, getattr(pa, kind)())
+                                         for name, kind in self.columns])
+                self.writer = pq.ParquetWriter(self.write_path, self.schema,
+                                               compression="zstd")
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+        else:
+            import gzip
+            # Each flush appends a gzip member; readers see one continuous stream
+            with gzip.open(self.write_path, "at", encoding="utf-8") as f:
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in self.rows)
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+                os.replace(self.write_path, self.path)
+        return self.count
+
+class QueueModel:
+    """Ordered input paths with O(1) membership, the data behind the queue view"""
+
+    def __init__(self):
+        self.paths = []
+        self.positions = {}  # path -> index in paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __getitem__(self, index):
+        return self.paths[index]
+
+    def __contains__(self, path):
+        return path in self.positions
+
+    def index(self, path):
+        return self.positions[path]
+
+    def add(self, path):
+        """Append a path unless it is already queued; returns whether it was added"""
+        if path in self.positions:
+            return False
+        self.positions[path] = len(self.paths)
+        self.paths.append(path)
+        return True
+
+    def extend(self, paths):
+        return [path for path in paths if self.add(path)]
+
+    def remove(self, paths):
+        """Remove several paths with one pass over the list"""
+        paths = set(paths)
+        if not paths:
+            return
+        self.paths = [path for path in self.paths if path not in paths]
+        self.positions = {path: index for index, path in enumerate(self.paths)}
+
+    def clear(self):
+        self.paths = []
+        self.positions = {}
 
-            except Exception as e:
-                error_msg = str(e)
-                if "gated" in error_msg.lower() or "private" in error_msg.lower():
-                    error_msg = (
-                        "Please accept the model terms for both:\n"
-                        "1. https://huggingface.co/pyannote/speaker-diarization\n"
-                        "2. https://huggingface.co/pyannote/segmentation\n\n"
-                        "After accepting, ensure your token has 'read' access."
-                    )
-                elif "Format not recognised" in str(e):
-                    error_msg = (
-                        "Audio format not supported directly.\n"
-                        "Converting to compatible format..."
-                    )
-                elif "connection" in error_msg.lower():
-                    error_msg = "Failed to connect. Please check your internet connection."
-                
-                dialog = ChoiceDialog(
-                    self.callback.root,
-                    "Diarization Failed",
-                    f"Diarization failed: {error_msg}\n\nWhat would you like to do?"
-                )
-                
-                if dialog.result == 1:  # Continue without
-                    return whisper_result
-                elif dialog.result == 2:  # Try alternative
-                    return self._alternative_diarization(whisper_result, audio_path)
-                else:  # Cancel
-                    raise ValueError("Transcription cancelled by user")
+class VirtualQueueView:
+    """Treeview that only ever holds the rows on screen
 
-        except Exception as e:
-            self.callback.on_status(f"Diarization failed: {str(e)}")
-            import traceback
-            self.callback.log(f"Full diarization error:\n{traceback.format_exc()}")
-            
-            dialog = ChoiceDialog(
-                self.callback.root,
-                "Diarization Failed",
-                f"Diarization failed: {str(e)}\n\nWhat would you like to do?"
-            )
-            
-            if dialog.result == 1:
-                return whisper_result
-            elif dialog.result == 2:
-                return self._alternative_diarization(whisper_result, audio_path)
-            else:
-                raise ValueError("Transcription cancelled by user")
+    Rows are rebuilt from the QueueModel as the view scrolls, so a queue of
+    tens of thousands of items costs no more to draw than a screenful.
+    Selection is kept by path, since row widgets are reused.
+    """
+    placeholder = "Drag files here or use 'Add Files/URLs' button"
 
-    def _alternative_diarization(self, whisper_result, audio_path):
-        """Alternative diarization method using direct pipeline"""
-        try:
-            self.callback.on_status("Attempting alternative diarization method...")
-            
-            # Try using a different model configuration
-            pipeline = Pipeline.from_pretrained(
-                "pyannote/speaker-diarization@2.1",
-                use_auth_token=self.callback.settings.current.get("hf_token")
-            )
+    def __init__(self, parent, model, columns, row_values):
+        self.model = model
+        self.row_values = row_values  # path -> (name, *column values)
+        self.top = 0
+        self.rows = 15
+        self.selected = set()
+        self.anchor = None
 
-            # Apply diarization
-            self.callback.on_status("Running diarization...")
-            diarization = pipeline(audio_path)
-            
-            # Process results
-            speakers = []
-            for turn, _, speaker in diarization.itertracks(yield_label=True):
-                speakers.append({
-                    'start': turn.start,
-                    'end': turn.end,
-                    'speaker': speaker
-                })
-            
-            # Add speaker information to whisper segments
-            for segment in whisper_result["segments"]:
-                matching_speakers = []
-                for speaker in speakers:
-                    if (segment['start'] >= speaker['start'] and 
-                        segment['end'] <= speaker['end']):
-                        matching_speakers.append(speaker['speaker'])
-                
-                if matching_speakers:
-                    # If multiple speakers found, use the most common one
-                    from collections import Counter
-                    segment['speaker'] = Counter(matching_speakers).most_common(1)[0][0]
-                else:
-                    segment['speaker'] = "UNKNOWN"
-            
-            return whisper_result
-            
-        except Exception as e:
-            self.callback.on_status(f"Alternative diarization failed: {str(e)}")
-            self.callback.log(f"Alternative diarization error:\n{traceback.format_exc()}")
-            
-            if messagebox.askyesno("Alternative Method Failed",
-                "Alternative diarization method also failed.\n\n"
-                "Would you like to continue without speaker diarization?"):
-                return whisper_result
-            else:
-                raise ValueError("Transcription cancelled by user")
+        self.tree = ttk.Treeview(parent, columns=[c for c, _, _ in columns],
+                                 show="tree headings", selectmode="extended")
+        self.tree.heading("#0", text="Item")
+        self.tree.column("#0", width=300, stretch=True)
+        for column, heading, width in columns:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=False)
+        self.tree.tag_configure("placeholder", foreground="gray")
+        self.tree.pack(fill="both", expand=True, side="left")
 
-    def _save_transcript(self, result, output_path, options):
-        """Save transcript with improved formatting for speaker diarization"""
-        with open(output_path, "w", encoding="utf-8") as f:
-            current_speaker = None
-            
-            for segment in result["segments"]:
-                # Get timestamp if needed
-                timestamp = ""
-                if options.get("include_timestamps"):
-                    timestamp = f"[{segment['start']:.2f}s - {segment['end']:.2f}s] "
-                
-                # Handle speaker changes
-                speaker = segment.get('speaker', 'UNKNOWN')
-                text = segment['text'].strip()
-                
-                # Only write speaker header when speaker changes
-                if speaker != current_speaker:
-                    # Add single blank line between speakers (but not at the start of file)
-                    if current_speaker is not None:
-                        f.write("\n")
-                    f.write(f"SPEAKER {speaker}\n")
-                    current_speaker = speaker
-                
-                # Write the text with optional timestamp
-                if options.get("include_timestamps"):
-                    f.write(f"{timestamp}{text}")
-                else:
-                    f.write(text)
-                
-                # Add a single newline after each utterance
-                f.write("\n")
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
 
-    def add_task(self, input_path, output_path, options):
-        self.queue.put((input_path, output_path, options))
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units", 3))
+        self.tree.bind("<Control-a>", self.select_all)
+        self.render()
 
-    def stop(self):
-        self.running = False
+    def _on_resize(self, event):
+        # Roughly 20px per row in the default theme; header takes one row
+        rows = max(event.height // 20 - 1, 1)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    def _on_select(self, event=None):
+        visible = set(self.model.paths[self.top:self.top + self.rows])
+        chosen = {self.model[int(iid)] for iid in self.tree.selection()
+                  if iid.isdigit() and int(iid) < len(self.model)}
+        self.selected = (self.selected - visible) | chosen
+        return "break"
+
+    def select_all(self, event=None):
+        self.selected = set(self.model.paths)
+        self.render()
+        return "break"
+
+    def curselection(self):
+        """Selected model indices, like Listbox.curselection()"""
+        self.selected &= self.model.positions.keys()
+        return sorted(self.model.index(path) for path in self.selected)
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.model))
+            self.render()
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]), args[2])
+
+    def scroll(self, amount, what="units", step=1):
+        step = self.rows if what == "pages" else step
+        self.top += amount * step
+        self.render()
+        return "break"
+
+    def render(self):
+        """Rebuild just the visible rows"""
+        count = len(self.model)
+        self.top = max(0, min(self.top, count - self.rows))
+        self.tree.delete(*self.tree.get_children())
+        if not count:
+            self.tree.insert("", "end", iid="placeholder", text=self.placeholder,
+                             tags=("placeholder",))
+            self.scrollbar.set(0, 1)
+            return
+        visible_selection = []
+        for index in range(self.top, min(self.top + self.rows, count)):
+            path = self.model[index]
+            name, *values = self.row_values(path)
+            self.tree.insert("", "end", iid=str(index), text=name, values=values)
+            if path in self.selected:
+                visible_selection.append(str(index))
+        self.tree.selection_set(visible_selection)
+        self.scrollbar.set(self.top / count, min((self.top + self.rows) / count, 1.0))
 
 class TranscriptionGUI:
     def __init__(self, root):
@@ -624,16 +4472,39 @@ class TranscriptionGUI:
         self.timestamps = tk.BooleanVar(value=self.settings.current["include_timestamps"])
         self.speaker_diarization = tk.BooleanVar(value=self.settings.current["use_diarization"])
         self.batch_processing = tk.BooleanVar(value=self.settings.current["batch_processing"])
-        self.input_paths = []
+        self.word_timestamps = tk.BooleanVar(value=self.settings.current["word_timestamps"])
+        self.language = tk.StringVar(value=self.settings.current["language"])
+        self.cascade_model = tk.StringVar(value=self.settings.current["cascade_model"])
+        self.speaker_hint = tk.StringVar(value=self.settings.current["speaker_hint"])
+        self.input_paths = QueueModel()
         self.output_path = tk.StringVar()
         self.youtube_titles = {}
+        self.youtube_durations = {}
+        self.youtube_sources = {}  # URL -> channel, for per-source language reuse
+        self.item_languages = {}  # input path -> per-job language override
+        self.schedule_policy = tk.StringVar(value=self.settings.current["schedule_policy"])
+        self.priorities = {}  # input path -> user priority override
+        self.jobs_by_path = {}  # input path -> most recent TranscriptionJob
+        self.probing = set()  # Input paths submitted but still waiting for their duration
+        # Log lines waiting to be drawn; bounded so a flood can't pile up
+        self.log_limit = self.settings.current["log_max_lines"]
+        self.log_lines = collections.deque(maxlen=self.log_limit)
+        self.batch_ids = itertools.count(1)
         
         # Initialize worker
-        self.worker = TranscriptionWorker(self)
+        self.worker = TranscriptionWorker(self, self.schedule_policy.get())
+        self.shared_queue = None
+        if self.settings.current["shared_store_path"]:
+            # Also take jobs other machines submitted to the shared store
+            self.shared_queue = SharedQueueClient(
+                SharedJobStore(self.settings.current["shared_store_path"]), self.worker)
         
         self.check_diarization_setup()
         self.setup_ui()
         self.check_initial_dependencies()
+        
+        # Warm the selected models once the window is up
+        self.root.after(500, self.prefetch_models)
 
     def check_diarization_setup(self):
         """Check if diarization is properly set up, if not, run setup script"""
@@ -642,17 +4513,22 @@ class TranscriptionGUI:
             hub_dir = Path.home() / ".cache" / "hub"
             
             if not (cache_dir.exists() and hub_dir.exists()):
-                try:
-                    # Run the setup script
-                    setup_script = Path(__file__).parent / "diarization_setup.py"
-                    result = subprocess.run([sys.executable, str(setup_script), "--setup"],
-                                         capture_output=True, text=True)
-                    
-                    if result.returncode != 0:
-                        self.log("Warning: Diarization setup failed. Some features may not work.")
-                        self.log(f"Setup error: {result.stderr}")
-                except Exception as e:
-                    self.log(f"Error running diarization setup: {e}")   
+                # The outcome is cached per environment, so a setup that can't
+                # succeed here isn't relaunched on every start
+                def run_setup():
+                    try:
+                        # Run the setup script
+                        setup_script = Path(__file__).parent / "diarization_setup.py"
+                        result = subprocess.run([sys.executable, str(setup_script), "--setup"],
+                                             capture_output=True, text=True)
+                        return {"ok": result.returncode == 0, "error": result.stderr}
+                    except Exception as e:
+                        return {"ok": False, "error": str(e)}
+                
+                outcome = EnvironmentProbe.get("diarization_setup", run_setup)
+                if not outcome["ok"]:
+                    self.log("Warning: Diarization setup failed. Some features may not work.")
+                    self.log(f"Setup error: {outcome['error']}")
 
     def check_initial_dependencies(self):
         """Check for required dependencies when the app starts"""
@@ -692,9 +4568,16 @@ class TranscriptionGUI:
         settings_frame = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(settings_frame, text="Settings")
         
+        # Search tab
+        search_frame = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(search_frame, text="Search")
+        
         # Setup main tab
         self.setup_main_tab(main_frame)
         
+        # Setup search tab
+        self.setup_search_tab(search_frame)
+        
         # Setup settings tab
         self.setup_settings_tab(settings_frame)
         
@@ -708,6 +4591,11 @@ class TranscriptionGUI:
         self.status_label = ttk.Label(status_frame, text="Ready")
         self.status_label.pack(side="left")
 
+        # Memory/CPU reserved by running stages
+        self.resources_label = ttk.Label(status_frame, foreground="gray",
+                                         text=self.worker.governor.describe())
+        self.resources_label.pack(side="right")
+
     def setup_main_tab(self, parent):
         # Input section
         input_frame = ttk.LabelFrame(parent, text="Input", padding="5")
@@ -724,24 +4612,19 @@ class TranscriptionGUI:
         self.files_frame = ttk.LabelFrame(parent, text="Files", padding="5")
         self.files_frame.pack(fill="both", expand=True, padx=5, pady=5)
         
-        self.files_list = tk.Listbox(self.files_frame, selectmode=tk.EXTENDED)
-        self.files_list.pack(fill="both", expand=True, side="left")
-
-        # Add placeholder text
-        self.files_list.insert(tk.END, "Drag files here or use 'Add Files/URLs' button")
-        self.files_list.config(foreground="gray")
-        
-        # Bind the list change handler
-        self.files_list.bind('<<ListboxSelect>>', self.on_list_change)
+        self.finish_times = {}
+        self.refresh_pending = False
+        self.queue_view = VirtualQueueView(
+            self.files_frame, self.input_paths,
+            [("length", "Length", 70), ("status", "Status", 90), ("eta", "Done ~", 60),
+             ("priority", "Priority", 60), ("language", "Lang", 50)],
+            self.queue_row)
+        self.files_list = self.queue_view.tree
 
+        from tkinterdnd2 import DND_FILES
         self.files_list.drop_target_register(DND_FILES)
         self.files_list.dnd_bind('<<Drop>>', self.handle_drop)
         
-        scrollbar = ttk.Scrollbar(self.files_frame, orient="vertical", 
-                                command=self.files_list.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.files_list.configure(yscrollcommand=scrollbar.set)
-        
         # Buttons for file management
         btn_frame = ttk.Frame(parent)
         btn_frame.pack(fill="x", padx=5, pady=5)
@@ -752,6 +4635,14 @@ class TranscriptionGUI:
                   command=self.add_youtube_url).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Remove Selected", 
                   command=self.remove_selected).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Prioritize", 
+                  command=self.prioritize_selected).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Set Language", 
+                  command=self.set_selected_language).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Pause/Resume", 
+                  command=self.toggle_pause_selected).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cancel", 
+                  command=self.cancel_selected).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Clear All", 
                   command=self.clear_files).pack(side="left", padx=5)
         
@@ -801,6 +4692,7 @@ class TranscriptionGUI:
                                  values=["tiny", "base", "small", "medium", "large"],
                                  textvariable=self.model_size)
         model_combo.pack(side="left", padx=5)
+        model_combo.bind("<<ComboboxSelected>>", lambda e: self.prefetch_models())
         
         # Checkboxes for options
         ttk.Checkbutton(options_frame, text="Include Timestamps", 
@@ -809,12 +4701,39 @@ class TranscriptionGUI:
         self.diarization_check = ttk.Checkbutton(options_frame, 
                                                 text="Speaker Diarization", 
                                                 variable=self.speaker_diarization,
-                                                command=self.check_diarization)
+                                                command=self.on_diarization_toggle)
         self.diarization_check.pack(side="left", padx=5)
         
         ttk.Checkbutton(options_frame, text="Batch Processing", 
                        variable=self.batch_processing).pack(side="left", padx=5)
         
+        ttk.Checkbutton(options_frame, text="Word-level Speakers", 
+                       variable=self.word_timestamps).pack(side="left", padx=5)
+
+        # Language for the batch ("auto" detects once and reuses it)
+        ttk.Label(options_frame, text="Language:").pack(side="left")
+        ttk.Combobox(options_frame, width=5, values=LANGUAGES,
+                     textvariable=self.language).pack(side="left", padx=5)
+
+        # Expected number of speakers: "auto", "2" or a range like "2-4"
+        ttk.Label(options_frame, text="Speakers:").pack(side="left")
+        ttk.Entry(options_frame, width=5,
+                  textvariable=self.speaker_hint).pack(side="left", padx=5)
+
+        # Cascade: re-decode low-confidence passages with a larger model
+        ttk.Label(options_frame, text="Recheck with:").pack(side="left")
+        ttk.Combobox(options_frame, width=6, state="readonly",
+                     values=["off", "small", "medium", "large"],
+                     textvariable=self.cascade_model).pack(side="left", padx=5)
+
+        # Queue ordering
+        ttk.Label(options_frame, text="Order:").pack(side="left")
+        policy_combo = ttk.Combobox(options_frame, width=6, state="readonly",
+                                    values=SCHEDULING_POLICIES,
+                                    textvariable=self.schedule_policy)
+        policy_combo.pack(side="left", padx=5)
+        policy_combo.bind("<<ComboboxSelected>>", self.on_policy_change)
+        
         # Start button
         self.start_button = ttk.Button(parent, text="Start Transcription", 
                                      command=self.start_transcription)
@@ -826,13 +4745,14 @@ class TranscriptionGUI:
         
         self.log_text = scrolledtext.ScrolledText(log_frame, height=8)
         self.log_text.pack(fill="both", expand=True)
+        self.root.after(200, self.flush_log)
 
-    def on_list_change(self, event=None):
-        """Clear placeholder text when items are added"""
-        if self.files_list.size() == 1 and \
-        self.files_list.get(0) == "Drag files here or use 'Add Files/URLs' button":
-            self.files_list.delete(0)
-            self.files_list.config(foreground="black")
+    def on_policy_change(self, event=None):
+        policy = self.schedule_policy.get()
+        self.worker.scheduler.set_policy(policy)
+        self.settings.current["schedule_policy"] = policy
+        self.settings.save()
+        self.refresh_queue_view()
 
     def get_output_filename(self, input_path, index=0):
         """Updated filename generation for YouTube videos"""
@@ -841,7 +4761,7 @@ class TranscriptionGUI:
                 # Use video title for YouTube URLs
                 base = self.youtube_titles[input_path]
                 # Clean the title for use as filename
-                base = "".join(c for c in base if c.isalnum() or c in (' ', '-', '_')).rstrip()
+                base = safe_filename(base)
             else:
                 base = os.path.splitext(os.path.basename(input_path))[0]
             return f"{base}_transcript.txt"
@@ -851,6 +4771,109 @@ class TranscriptionGUI:
                 return f"{prefix}_{index + 1}.txt"
             return f"{prefix}.txt"
 
+    def setup_search_tab(self, parent):
+        query_frame = ttk.Frame(parent)
+        query_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.search_query = tk.StringVar()
+        entry = ttk.Entry(query_frame, textvariable=self.search_query)
+        entry.pack(side="left", fill="x", expand=True, padx=5)
+        entry.bind("<Return>", lambda e: self.run_search())
+        ttk.Button(query_frame, text="Search", 
+                  command=self.run_search).pack(side="left", padx=5)
+        ttk.Button(query_frame, text="Index Folder...", 
+                  command=self.index_folder).pack(side="left", padx=5)
+        
+        results_frame = ttk.Frame(parent)
+        results_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        
+        columns = ("time", "speaker", "text", "file")
+        self.search_results = ttk.Treeview(results_frame, columns=columns, show="headings")
+        for column, heading, width in (("time", "Time", 70), ("speaker", "Speaker", 70),
+                                       ("text", "Text", 420), ("file", "File", 200)):
+            self.search_results.heading(column, text=heading)
+            self.search_results.column(column, width=width, stretch=(column == "text"))
+        self.search_results.pack(fill="both", expand=True, side="left")
+        self.search_results.bind("<Double-1>", self.open_search_result)
+        
+        scrollbar = ttk.Scrollbar(results_frame, orient="vertical",
+                                  command=self.search_results.yview)
+        scrollbar.pack(side="right", fill="y")
+        self.search_results.configure(yscrollcommand=scrollbar.set)
+        
+        ttk.Label(parent, text="Double-click a result to jump to it", 
+                 foreground="gray").pack(anchor="w", padx=5)
+        self.search_hits = {}
+
+    def search_index(self):
+        return TranscriptIndex(self.settings.current.get("search_index_path") or None)
+
+    def run_search(self):
+        query = self.search_query.get().strip()
+        self.search_results.delete(*self.search_results.get_children())
+        self.search_hits = {}
+        if not query:
+            return
+        started = time.time()
+        try:
+            hits = self.search_index().search(query, limit=200)
+        except Exception as e:
+            messagebox.showerror("Search Failed", f"Could not search: {str(e)}")
+            return
+        for hit in hits:
+            when = MediaProbe.format_duration(hit["start"]) if hit["start"] is not None else ""
+            name = hit["title"] or os.path.basename(hit["output_path"])
+            item = self.search_results.insert("", tk.END, values=(
+                when, hit["speaker"], hit["snippet"], name))
+            self.search_hits[item] = hit
+        self.status_label["text"] = (f"{len(hits)} result(s) in "
+                                     f"{(time.time() - started) * 1000:.0f} ms")
+
+    def open_search_result(self, event=None):
+        selection = self.search_results.selection()
+        if not selection:
+            return
+        hit = self.search_hits.get(selection[0])
+        if hit is None:
+            return
+        source = hit["source_path"]
+        if source and is_youtube_url(source) and hit["start"] is not None:
+            # Jump straight to the moment in the video
+            separator = "&" if "?" in source else "?"
+            webbrowser.open(f"{source}{separator}t={int(hit['start'])}s")
+            return
+        self.show_transcript(hit["output_path"], hit["line"])
+
+    def show_transcript(self, path, line):
+        """Open a transcript in a viewer scrolled to and highlighting the given line"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not open transcript: {str(e)}")
+            return
+        viewer = tk.Toplevel(self.root)
+        viewer.title(os.path.basename(path))
+        viewer.geometry("700x500")
+        text = scrolledtext.ScrolledText(viewer, wrap="word")
+        text.pack(fill="both", expand=True)
+        text.insert("1.0", content)
+        text.tag_configure("hit", background="yellow")
+        text.tag_add("hit", f"{line}.0", f"{line}.end")
+        text.see(f"{line}.0")
+        text.configure(state="disabled")
+
+    def index_folder(self):
+        """Add existing transcripts in a folder to the search index"""
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        self.status_label["text"] = "Indexing transcripts..."
+        self.root.update()
+        added, segments = index_transcript_folder(self.search_index(), directory)
+        self.status_label["text"] = "Ready"
+        self.log(f"Indexed {added} transcript(s), {segments} segment(s) from {directory}")
+
     def setup_settings_tab(self, parent):
         # HuggingFace Token
         token_frame = ttk.LabelFrame(parent, text="HuggingFace Token", padding="5")
@@ -873,6 +4896,63 @@ class TranscriptionGUI:
                        variable=tk.BooleanVar(value=self.settings.current["dark_mode"]),
                        command=self.toggle_theme).pack()
         
+        # Performance settings
+        self.performance_frame = ttk.LabelFrame(parent, text="Performance", padding="5")
+        self.performance_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.add_numeric_setting(self.performance_frame, "Jobs in parallel (restart to apply):",
+                                 "parallel_jobs", 1, 16)
+        self.add_choice_setting(self.performance_frame,
+                                "Run heavy stages in a separate process:",
+                                "process_isolation", PROCESS_ISOLATION_MODES)
+        self.add_numeric_setting(self.performance_frame, "Jobs per process before restarting:",
+                                 "jobs_per_process", 1, 1000)
+        self.add_numeric_setting(self.performance_frame, "Memory budget (MB, 0 = 75% of RAM):",
+                                 "memory_budget_mb", 0, 1048576, 512)
+        self.add_numeric_setting(self.performance_frame, "Diarization segmentation batch:",
+                                 "diarization_segmentation_batch", 1, 256)
+        self.add_numeric_setting(self.performance_frame, "Diarization embedding batch:",
+                                 "diarization_embedding_batch", 1, 256)
+        self.add_numeric_setting(self.performance_frame, "Diarization step (fraction of window):",
+                                 "diarization_segmentation_step", 0.05, 1.0, 0.05)
+        self.add_numeric_setting(self.performance_frame, "Diarization memory limit (MB):",
+                                 "diarization_memory_mb", 128, 65536, 128)
+        self.add_numeric_setting(self.performance_frame, "Diarization window overlap (s):",
+                                 "diarization_window_overlap", 5, 300, 5)
+        self.add_numeric_setting(self.performance_frame, "Scratch space per job (MB):",
+                                 "scratch_quota_mb", 256, 262144, 256)
+        self.add_bool_setting(self.performance_frame,
+                              "Use RAM disk (/dev/shm) for scratch files", "scratch_use_tmpfs")
+        self.add_path_setting(self.performance_frame, "Scratch directory:", "scratch_directory")
+        self.add_bool_setting(self.performance_frame,
+                              "Skip silence before transcribing (voice activity detection)",
+                              "vad_prefilter")
+        self.add_numeric_setting(self.performance_frame, "Shortest silence to skip (ms):",
+                                 "vad_min_silence_ms", 250, 60000, 250)
+        self.add_choice_setting(self.performance_frame, "Reuse auto-detected language per:",
+                                "language_scope", LANGUAGE_SCOPES)
+        self.add_bool_setting(self.performance_frame,
+                              "Keep speaker numbers consistent across files (speaker index)",
+                              "use_speaker_index")
+        ttk.Button(self.performance_frame, text="Forget Known Speakers",
+                   command=self.reset_speaker_index).pack(anchor="w", pady=2)
+        self.add_bool_setting(self.performance_frame,
+                              "Export segments to a columnar archive (Parquet/JSONL)",
+                              "archive_export")
+        self.add_path_setting(self.performance_frame, "Archive directory:", "archive_directory")
+        self.add_choice_setting(self.performance_frame,
+                                "Profile jobs (saves .prof by transcripts, .collapsed when sampling):",
+                                "profile_jobs", ["off"] + JobProfiler.modes)
+        self.add_text_setting(self.performance_frame,
+                              "Only profile stages (e.g. transcribe, diarization; blank = all):",
+                              "profile_stages")
+        self.add_path_setting(self.performance_frame, "Model store:", "model_store_directory")
+        self.add_path_setting(self.performance_frame,
+                              "Shared job store (restart to apply):", "shared_store_path")
+        self.add_bool_setting(self.performance_frame,
+                              "Offline mode: only use models already in the store (restart to apply)",
+                              "offline_models")
+        
         ttk.Label(token_frame, text="Note: Token must have 'Read public gated models' permission", 
               wraplength=400).pack(pady=5)
     
@@ -883,6 +4963,95 @@ class TranscriptionGUI:
         link.pack(pady=5)
         link.bind("<Button-1>", lambda e: webbrowser.open("https://huggingface.co/settings/tokens"))
         
+    def add_numeric_setting(self, parent, label, key, from_, to, increment=1):
+        """Add a spinbox bound to a numeric setting, saved whenever it changes"""
+        row = ttk.Frame(parent)
+        row.pack(fill="x", pady=2)
+        ttk.Label(row, text=label).pack(side="left")
+        var = tk.StringVar(value=str(self.settings.current[key]))
+        
+        def save(event=None):
+            try:
+                value = type(self.settings.default_settings[key])(float(var.get()))
+            except ValueError:
+                var.set(str(self.settings.current[key]))
+                return
+            self.settings.current[key] = value
+            self.settings.save()
+        
+        spinbox = ttk.Spinbox(row, from_=from_, to=to, increment=increment,
+                              width=8, textvariable=var, command=save)
+        spinbox.pack(side="right")
+        spinbox.bind("<FocusOut>", save)
+        spinbox.bind("<Return>", save)
+        return var
+
+    def add_choice_setting(self, parent, label, key, values):
+        """Add a read-only combobox bound to a setting, saved whenever it changes"""
+        row = ttk.Frame(parent)
+        row.pack(fill="x", pady=2)
+        ttk.Label(row, text=label).pack(side="left")
+        var = tk.StringVar(value=self.settings.current[key])
+        
+        def save(event=None):
+            self.settings.current[key] = var.get()
+            self.settings.save()
+        
+        combo = ttk.Combobox(row, values=values, textvariable=var, state="readonly", width=10)
+        combo.pack(side="right")
+        combo.bind("<<ComboboxSelected>>", save)
+        return var
+
+    def add_bool_setting(self, parent, label, key):
+        """Add a checkbox bound to a boolean setting, saved whenever it changes"""
+        var = tk.BooleanVar(value=self.settings.current[key])
+        
+        def save():
+            self.settings.current[key] = var.get()
+            self.settings.save()
+        
+        ttk.Checkbutton(parent, text=label, variable=var, command=save).pack(anchor="w", pady=2)
+        return var
+
+    def add_text_setting(self, parent, label, key):
+        """Add an entry bound to a free-text setting"""
+        row = ttk.Frame(parent)
+        row.pack(fill="x", pady=2)
+        ttk.Label(row, text=label).pack(side="left")
+        var = tk.StringVar(value=self.settings.current[key])
+        
+        def save(event=None):
+            self.settings.current[key] = var.get().strip()
+            self.settings.save()
+        
+        entry = ttk.Entry(row, textvariable=var)
+        entry.pack(side="left", fill="x", expand=True, padx=5)
+        entry.bind("<FocusOut>", save)
+        return var
+
+    def add_path_setting(self, parent, label, key):
+        """Add an entry with a Browse button bound to a directory setting"""
+        row = ttk.Frame(parent)
+        row.pack(fill="x", pady=2)
+        ttk.Label(row, text=label).pack(side="left")
+        var = tk.StringVar(value=self.settings.current[key])
+        
+        def save(event=None):
+            self.settings.current[key] = var.get().strip()
+            self.settings.save()
+        
+        def browse():
+            directory = filedialog.askdirectory()
+            if directory:
+                var.set(directory)
+                save()
+        
+        entry = ttk.Entry(row, textvariable=var)
+        entry.pack(side="left", fill="x", expand=True, padx=5)
+        entry.bind("<FocusOut>", save)
+        ttk.Button(row, text="Browse", command=browse).pack(side="right")
+        return var
+
     def verify_huggingface_token(self):
         """Verify HuggingFace token and model access"""
         if not self.speaker_diarization.get():
@@ -900,6 +5069,7 @@ class TranscriptionGUI:
         ]
         
         try:
+            import requests
             for model in models:
                 response = requests.get(
                     f"https://huggingface.co/{model}",
@@ -923,10 +5093,24 @@ class TranscriptionGUI:
                 "Please check your internet connection.")
             return False
 
+    def prefetch_models(self):
+        """Start loading the currently selected models in the background"""
+        options = {
+            "model_size": self.model_size.get(),
+            "device": self.settings.current["device"],
+            "compute_type": self.settings.current["compute_type"],
+        }
+        self.worker.prefetch(options, diarization=self.speaker_diarization.get())
+
+    def on_diarization_toggle(self):
+        self.check_diarization()
+        if self.speaker_diarization.get():
+            self.prefetch_models()
+
     def check_diarization(self):
         """Modified check_diarization method"""
         if self.speaker_diarization.get():
-            if not HAS_DIARIZATION:
+            if not EnvironmentProbe.has_diarization():
                 messagebox.showwarning("Feature Unavailable", 
                     "Speaker diarization is not available.\n"
                     "Some required packages couldn't be installed with Python 3.13.\n"
@@ -957,6 +5141,16 @@ class TranscriptionGUI:
                 self.speaker_diarization.set(False)
                 self.notebook.select(1)  # Switch to settings tab
 
+    def reset_speaker_index(self):
+        if not messagebox.askyesno("Forget Known Speakers",
+            "Remove all enrolled speaker voices? Future files will number speakers from 1 again."):
+            return
+        if self.worker.speaker_index is not None:
+            self.worker.speaker_index.reset()
+        elif os.path.exists(SpeakerIndex.default_path):
+            os.remove(SpeakerIndex.default_path)
+        self.log("Speaker index cleared")
+
     def save_hf_token(self):
         token = self.hf_token.get()
         if token:
@@ -980,6 +5174,7 @@ class TranscriptionGUI:
         
         # Enable/disable drag and drop
         if is_file:
+            from tkinterdnd2 import DND_FILES
             self.files_list.drop_target_register(DND_FILES)
         else:
             try:
@@ -996,10 +5191,8 @@ class TranscriptionGUI:
             filetypes=[("Audio/Video files", 
                       "*.mp3 *.wav *.mp4 *.avi *.mov *.mkv *.m4a *.webm")]
         )
-        for file in files:
-            if file not in self.input_paths:
-                self.input_paths.append(file)
-                self.files_list.insert(tk.END, os.path.basename(file))
+        if self.input_paths.extend(files):
+            self.queue_view.render()
 
     def add_youtube_url(self):
         """Handle adding YouTube URLs with improved UI"""
@@ -1014,19 +5207,13 @@ class TranscriptionGUI:
                 
                 try:
                     # Get video title
-                    ydl_opts = {
-                        'quiet': True,
-                        'no_warnings': True,
-                        'extract_flat': True
-                    }
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        title = info.get('title', url)
+                    info = fetch_youtube_info(url)
                         
-                    self.input_paths.append(url)
-                    self.youtube_titles[url] = title
-                    display_text = f"🎬 {title}"  # Using emoji for visual distinction
-                    self.files_list.insert(tk.END, display_text)
+                    self.youtube_titles[url] = info['title']
+                    self.youtube_durations[url] = info['duration']
+                    self.youtube_sources[url] = info['source']
+                    self.input_paths.add(url)
+                    self.queue_view.render()
                     
                 except Exception as e:
                     messagebox.showerror("Error", f"Failed to fetch video info: {str(e)}")
@@ -1037,19 +5224,97 @@ class TranscriptionGUI:
 
     def remove_selected(self):
         """Updated remove function to handle YouTube entries"""
-        selected = self.files_list.curselection()
-        for index in reversed(selected):
-            path = self.input_paths[index]
-            self.files_list.delete(index)
-            self.input_paths.pop(index)
+        paths = [self.input_paths[index] for index in self.queue_view.curselection()]
+        self.input_paths.remove(paths)
+        self.queue_view.selected.clear()
+        for path in paths:
             if path in self.youtube_titles:
                 del self.youtube_titles[path]
+            self.youtube_durations.pop(path, None)
+            self.youtube_sources.pop(path, None)
+            self.item_languages.pop(path, None)
+            self.priorities.pop(path, None)
+            self.probing.discard(path)
+        self.worker.cancel_jobs([self.jobs_by_path.pop(path) for path in paths
+                                 if path in self.jobs_by_path])
+        self.queue_view.render()
 
     def clear_files(self):
             """Updated clear function to handle YouTube entries"""
-            self.files_list.delete(0, tk.END)
             self.input_paths.clear()
+            self.queue_view.selected.clear()
             self.youtube_titles.clear()
+            self.youtube_durations.clear()
+            self.youtube_sources.clear()
+            self.item_languages.clear()
+            self.priorities.clear()
+            self.probing.clear()
+            self.worker.cancel_jobs(list(self.jobs_by_path.values()))
+            self.jobs_by_path.clear()
+            self.queue_view.render()
+
+    def set_selected_language(self):
+        """Override the language for the selected items ("auto" clears the override)"""
+        selected = self.queue_view.curselection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select items first.")
+            return
+        language = simpledialog.askstring(
+            "Set Language",
+            "Language code for the selected items (e.g. en, de), or 'auto':",
+            parent=self.root)
+        if language is None:
+            return
+        language = language.strip().lower() or "auto"
+        for index in selected:
+            path = self.input_paths[index]
+            if language == "auto":
+                self.item_languages.pop(path, None)
+            else:
+                self.item_languages[path] = language
+        self.refresh_queue_view()
+
+    def prioritize_selected(self):
+        """Bump the priority of the selected items so they run before the rest"""
+        top = max(self.priorities.values(), default=0)
+        for index in self.queue_view.curselection():
+            path = self.input_paths[index]
+            top += 1
+            self.priorities[path] = top
+            job = self.jobs_by_path.get(path)
+            if job is not None:
+                self.worker.scheduler.set_priority(job.id, top)
+        self.refresh_queue_view()
+
+    def selected_jobs(self):
+        jobs = []
+        for index in self.queue_view.curselection():
+            job = self.jobs_by_path.get(self.input_paths[index])
+            if job is not None and job.status not in ("done", "failed", "cancelled"):
+                jobs.append(job)
+        return jobs
+
+    def cancel_selected(self):
+        """Cancel the selected jobs; running ones stop at their next checkpoint"""
+        jobs = self.selected_jobs()
+        if not jobs:
+            messagebox.showwarning("Warning", "Please select queued or running items.")
+            return
+        self.worker.cancel_jobs(jobs)
+        self.refresh_queue_view()
+
+    def toggle_pause_selected(self):
+        """Pause running jobs (or hold queued ones), or resume them if already paused"""
+        jobs = self.selected_jobs()
+        if not jobs:
+            messagebox.showwarning("Warning", "Please select queued or running items.")
+            return
+        for job in jobs:
+            if job.paused:
+                self.worker.resume_job(job)
+            else:
+                self.worker.pause_job(job)
+        self.refresh_queue_view()
 
     def browse_output(self):
         directory = filedialog.askdirectory()
@@ -1064,12 +5329,9 @@ class TranscriptionGUI:
         if files:
             # Handle multiple files from drag and drop
             file_list = self.root.tk.splitlist(files)
-            for file in file_list:
-                # Clean up the file path (remove braces and quotes if present)
-                file = file.strip('{}')
-                if file not in self.input_paths:
-                    self.input_paths.append(file)
-                    self.files_list.insert(tk.END, os.path.basename(file))
+            # Clean up the file paths (remove braces and quotes if present)
+            if self.input_paths.extend(file.strip('{}') for file in file_list):
+                self.queue_view.render()
 
     def start_transcription(self):
         if not self.input_paths:
@@ -1087,9 +5349,37 @@ class TranscriptionGUI:
         options = {
             "include_timestamps": self.timestamps.get(),
             "use_diarization": self.speaker_diarization.get(),
+            "word_timestamps": self.word_timestamps.get(),
+            "model_size": self.model_size.get(),
+            "device": self.settings.current["device"],
+            "compute_type": self.settings.current["compute_type"],
+            "vad_prefilter": self.settings.current["vad_prefilter"],
+            "cascade_model": self.cascade_model.get(),
+            "segmentation_batch_size": self.settings.current["diarization_segmentation_batch"],
+            "embedding_batch_size": self.settings.current["diarization_embedding_batch"],
+            "segmentation_step": self.settings.current["diarization_segmentation_step"],
         }
+        try:
+            options.update(parse_speaker_hint(self.speaker_hint.get()))
+        except ValueError:
+            messagebox.showwarning("Warning", "Speakers must be 'auto', a number like 2, "
+                                   "or a range like 2-4.")
+            return
+        if self.settings.current["profile_jobs"] != "off":
+            options["profile"] = self.settings.current["profile_jobs"]
+            stages = parse_profile_stages(self.settings.current["profile_stages"])
+            if stages:
+                options["profile_stages"] = stages
+        if self.settings.current["archive_export"]:
+            options["archive_directory"] = self.settings.current["archive_directory"] or \
+                os.path.join(self.output_path.get(), "archive")
         
+        batch_id = next(self.batch_ids)
+        batch = []
         for idx, input_path in enumerate(self.input_paths):
+            # Rows already queued (or done) stay as they are; Start only adds new ones
+            if input_path in self.jobs_by_path or input_path in self.probing:
+                continue
             output_filename = self.get_output_filename(input_path, idx)
             output_path = os.path.join(self.output_path.get(), output_filename)
             
@@ -1097,18 +5387,116 @@ class TranscriptionGUI:
                 if not messagebox.askyesno("File exists", 
                     f"{output_filename} already exists. Overwrite?"):
                     continue
+            batch.append((input_path, output_path))
+        if not batch:
+            self.status_label["text"] = "Nothing new to transcribe"
+            return
+        
+        self.probing.update(input_path for input_path, _ in batch)
+        self.status_label["text"] = f"Probing media durations ({len(batch)} files)..."
+        threading.Thread(target=self.probe_and_queue, args=(batch, options, batch_id),
+                         daemon=True).start()
+
+    def probe_and_queue(self, batch, options, batch_id):
+        """Probe durations off the Tk thread, queueing jobs in chunks as they are known"""
+        chunk, posted = [], time.time()
+        for input_path, output_path in batch:
+            duration = self.youtube_durations.get(input_path)
+            if duration is None:
+                duration = MediaProbe.duration(input_path)
+            chunk.append((input_path, output_path, duration))
+            if len(chunk) >= 200 or time.time() - posted >= 0.25:
+                self.root.after(0, self.queue_jobs, chunk, options, batch_id)
+                chunk, posted = [], time.time()
+        self.root.after(0, self.queue_jobs, chunk, options, batch_id, True)
+
+    def queue_jobs(self, probed, options, batch_id, last=False):
+        """Hand probed inputs to the worker (on the Tk thread)"""
+        for input_path, output_path, duration in probed:
+            if input_path not in self.probing:
+                continue  # Removed from the list while it was being probed
+            self.probing.discard(input_path)
+            job_options = dict(options)
+            job_options["language"] = self.item_languages.get(input_path, self.language.get())
+            job_options["title"] = self.youtube_titles.get(input_path)
+            job_options["language_key"] = language_key(
+                self.settings.current.get("language_scope", "batch"),
+                input_path, self.youtube_sources.get(input_path), batch_id)
             
-            self.worker.add_task(input_path, output_path, options)
+            job = self.worker.add_task(input_path, output_path, job_options,
+                                       duration=duration,
+                                       priority=self.priorities.get(input_path, 0),
+                                       batch_id=batch_id)
+            self.jobs_by_path[input_path] = job
+        
+        if last:
+            self.status_label["text"] = "Ready"
+        self.schedule_queue_refresh()
+
+    def display_name(self, input_path):
+        if input_path in self.youtube_titles:
+            return f"🎬 {self.youtube_titles[input_path]}"  # Using emoji for visual distinction
+        return os.path.basename(input_path)
+
+    def queue_row(self, path):
+        """Name and status columns for one queue item"""
+        job = self.jobs_by_path.get(path)
+        language = self.item_languages.get(path, "")
+        if job is None:
+            duration = self.youtube_durations.get(path)
+            priority = self.priorities.get(path, "")
+            status = "probing" if path in self.probing else ""
+            return (self.display_name(path), MediaProbe.format_duration(duration)
+                    if duration else "", status, "", priority or "", language)
+        eta = ""
+        if job.id in self.finish_times:
+            eta = datetime.fromtimestamp(self.finish_times[job.id]).strftime('%H:%M')
+        if job.options.get("language", "auto") != "auto":
+            language = job.options["language"]
+        return (self.display_name(path), MediaProbe.format_duration(job.duration), job.status,
+                eta, job.priority or "", language)
+
+    def refresh_queue_view(self):
+        """Recompute finish times and redraw the visible queue rows"""
+        self.refresh_pending = False
+        self.finish_times = self.worker.scheduler.estimate_finish_times()
+        self.queue_view.render()
+
+    def schedule_queue_refresh(self):
+        """Coalesce bursts of queue updates into one redraw"""
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.root.after(250, self.refresh_queue_view)
 
     def log(self, message):
-        self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')}: {message}\n")
-        self.log_text.see(tk.END)
+        # Safe from any thread: lines are buffered and drawn by flush_log
+        self.log_lines.append(f"{datetime.now().strftime('%H:%M:%S')}: {message}\n")
+
+    def flush_log(self):
+        """Append buffered log lines in one insert and trim the widget to its limit"""
+        if self.log_lines:
+            lines = []
+            while self.log_lines:
+                lines.append(self.log_lines.popleft())
+            self.log_text.insert(tk.END, "".join(lines[-self.log_limit:]))
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - self.log_limit - 1
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+        self.root.after(200, self.flush_log)
 
     # Callback methods for TranscriptionWorker
     def on_status(self, message):
         self.status_label["text"] = message
         self.log(message)
 
+    def on_queue_update(self):
+        self.root.after(0, self.schedule_queue_refresh)
+
+    def on_resources_update(self):
+        self.root.after(0, lambda: self.resources_label.configure(
+            text=self.worker.governor.describe()))
+
     def on_progress(self, value):
         self.progress["value"] = value
 
@@ -1121,7 +5509,336 @@ class TranscriptionGUI:
         self.status_label["text"] = "Ready"
         self.progress["value"] = 0
 
-def main():
+class ConsoleCallback:
+    """Worker callback for headless runs: prints progress instead of updating widgets"""
+    root = None
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.completed = 0
+        self.failed = 0
+
+    def log(self, message):
+        print(f"{datetime.now().strftime('%H:%M:%S')}: {message}", flush=True)
+
+    def on_status(self, message):
+        self.log(message)
+
+    def on_progress(self, value):
+        pass
+
+    def on_queue_update(self):
+        pass
+
+    def on_resources_update(self):
+        pass
+
+    def on_error(self, error):
+        self.failed += 1
+        print(f"Error: {error}", file=sys.stderr, flush=True)
+
+    def on_complete(self, output_path):
+        self.completed += 1
+        self.log(f"Completed: {output_path}")
+
+def index_transcript_folder(index, directory):
+    """Index every *_transcript.txt under directory that changed since it was last indexed"""
+    added = segments = 0
+    for path in Path(directory).rglob("*_transcript.txt"):
+        if index.is_current(str(path)):
+            continue
+        segments += index.add_existing(str(path))
+        added += 1
+    return added, segments
+
+def build_cli_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="Scribey",
+        description="Transcribe audio/video files or YouTube URLs. "
+                    "Run without arguments to open the window.")
+    parser.add_argument("inputs", nargs="*", help="Files or YouTube URLs to transcribe")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for transcripts (default: the saved output "
+                             "directory, else the current directory)")
+    parser.add_argument("--model", choices=list(MODEL_SPEED_FACTORS),
+                        help="Whisper model size")
+    parser.add_argument("--language", help="Language code, or 'auto' to detect")
+    parser.add_argument("--timestamps", action="store_true", help="Include timestamps")
+    parser.add_argument("--diarize", action="store_true", help="Label speakers")
+    parser.add_argument("--word-timestamps", action="store_true",
+                        help="Attribute speakers per word")
+    parser.add_argument("--speakers", metavar="N",
+                        help="Expected speakers for diarization: a number, a range like 2-4, "
+                             "or 'auto'")
+    parser.add_argument("--segmentation-batch", type=int, metavar="N",
+                        help="Diarization segmentation batch size (default: 32)")
+    parser.add_argument("--embedding-batch", type=int, metavar="N",
+                        help="Diarization embedding batch size (default: 32)")
+    parser.add_argument("--segmentation-step", type=float, metavar="FRACTION",
+                        help="Diarization segmentation step as a fraction of the window "
+                             "(default: 0.1; larger is faster, coarser)")
+    parser.add_argument("--order", choices=SCHEDULING_POLICIES, help="Queue order")
+    parser.add_argument("--recheck-with", choices=["off", "small", "medium", "large"],
+                        help="Re-decode low-confidence passages with this larger model")
+    parser.add_argument("--vad", action="store_true",
+                        help="Skip silence: only transcribe and diarize detected speech")
+    parser.add_argument("--stream", metavar="SOURCE",
+                        help="Transcribe live audio from SOURCE: '-' for stdin, a FIFO, "
+                             "or a file that is still being written")
+    parser.add_argument("--stream-format", choices=["s16le", "f32le"],
+                        help="SOURCE is raw mono PCM in this format (default: any format ffmpeg detects)")
+    parser.add_argument("--stream-rate", type=int, default=16000,
+                        help="Sample rate of raw PCM input (default: 16000)")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep reading SOURCE as it grows, until it is idle for 5 seconds")
+    parser.add_argument("--step", type=float, default=1.0,
+                        help="Seconds of new audio between decodes (default: 1.0)")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="Print partial and final segments as JSON lines")
+    parser.add_argument("--archive", nargs="?", const="", metavar="DIR",
+                        help="Also write every segment to a Parquet (or gzipped JSONL) archive "
+                             "in DIR (default: <output dir>/archive)")
+    parser.add_argument("--profile", nargs="?", const="cprofile",
+                        choices=["off"] + JobProfiler.modes,
+                        help="Profile each job; saves <transcript>.prof, plus .collapsed "
+                             "when sampling (default mode: cprofile)")
+    parser.add_argument("--profile-stages", metavar="STAGES",
+                        help="Only profile these comma-separated stages: download, decode, "
+                             "transcribe, diarization")
+    parser.add_argument("--isolate", nargs="?", const="job", choices=PROCESS_ISOLATION_MODES,
+                        help="Run transcription and diarization in a child process that is "
+                             "restarted after --jobs-per-process jobs (job, the default) or "
+                             "after every stage (stage), so memory is given back")
+    parser.add_argument("--jobs-per-process", type=int, metavar="N",
+                        help="With --isolate job: jobs before the child process is restarted")
+    parser.add_argument("--shared-store", metavar="PATH",
+                        help="Share the queue with other Scribey workers through this SQLite "
+                             "file, or a directory to keep it in (e.g. on a network share); "
+                             "inputs are submitted to it")
+    parser.add_argument("--serve", action="store_true",
+                        help="With --shared-store: keep taking shared jobs until interrupted")
+    parser.add_argument("--submit-only", action="store_true",
+                        help="With --shared-store: submit the inputs and exit without working")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="Search indexed transcripts and print matching segments")
+    parser.add_argument("--index-dir", metavar="DIR",
+                        help="Add existing *_transcript.txt files under DIR to the search index")
+    return parser
+
+def run_cli(args):
+    """Transcribe the given inputs without opening the window"""
+    settings = Settings()
+    ModelStore.apply_offline_mode(settings.current)
+    missing = [p for p in DependencyManager.check_dependencies('base') if p != 'tkinterdnd2']
+    if missing:
+        print(f"Missing required packages: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    output_dir = args.output_dir or settings.current["output_directory"] or os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+
+    store_path = args.shared_store or settings.current.get("shared_store_path")
+    store = SharedJobStore(store_path) if store_path else None
+
+    # Run-only overrides; not saved
+    if args.isolate:
+        settings.current["process_isolation"] = args.isolate
+    if args.jobs_per_process:
+        settings.current["jobs_per_process"] = args.jobs_per_process
+
+    callback = ConsoleCallback(settings)
+    worker = TranscriptionWorker(callback, args.order or settings.current["schedule_policy"])
+    options = {
+        "include_timestamps": args.timestamps,
+        "use_diarization": args.diarize,
+        "word_timestamps": args.word_timestamps,
+        "model_size": args.model or settings.current["model_size"],
+        "device": settings.current["device"],
+        "compute_type": settings.current["compute_type"],
+        "language": args.language or settings.current["language"],
+        "vad_prefilter": args.vad or settings.current["vad_prefilter"],
+        "cascade_model": args.recheck_with or settings.current["cascade_model"],
+        "segmentation_batch_size": args.segmentation_batch or
+            settings.current["diarization_segmentation_batch"],
+        "embedding_batch_size": args.embedding_batch or
+            settings.current["diarization_embedding_batch"],
+        "segmentation_step": args.segmentation_step or
+            settings.current["diarization_segmentation_step"],
+    }
+    try:
+        options.update(parse_speaker_hint(args.speakers or settings.current["speaker_hint"]))
+    except ValueError:
+        print("--speakers must be 'auto', a number like 2, or a range like 2-4", file=sys.stderr)
+        return 2
+    if args.archive is not None or settings.current["archive_export"]:
+        options["archive_directory"] = args.archive or settings.current["archive_directory"] or \
+            os.path.join(output_dir, "archive")
+    profile = args.profile or settings.current["profile_jobs"]
+    if profile != "off":
+        options["profile"] = profile
+        stages = parse_profile_stages(args.profile_stages or settings.current["profile_stages"])
+        if stages:
+            options["profile_stages"] = stages
+
+    batch_id = 1
+    if store is not None:
+        # Batch-scoped language reuse must not mix up batches from other machines
+        import uuid
+        batch_id = uuid.uuid4().hex
+    for input_path in args.inputs:
+        source = None
+        if is_youtube_url(input_path):
+            try:
+                info = fetch_youtube_info(input_path)
+            except Exception as e:
+                callback.on_error(f"Failed to fetch video info for {input_path}: {e}")
+                continue
+            base, duration, source = safe_filename(info['title']), info['duration'], info['source']
+            title = info['title']
+        elif os.path.exists(input_path):
+            base = os.path.splitext(os.path.basename(input_path))[0]
+            duration = MediaProbe.duration(input_path)
+            title = None
+            if store is not None:
+                input_path = os.path.abspath(input_path)
+        else:
+            callback.on_error(f"Input not found: {input_path}")
+            continue
+
+        job_options = dict(options)
+        job_options["language_key"] = language_key(
+            settings.current.get("language_scope", "batch"), input_path, source, batch_id)
+        job_options["title"] = title
+        output_path = os.path.join(output_dir, f"{base}_transcript.txt")
+        if store is not None:
+            store_id = store.submit(input_path, os.path.abspath(output_path), job_options,
+                                    duration=duration)
+            callback.log(f"Submitted shared job {store_id}: {input_path}")
+        else:
+            worker.add_task(input_path, output_path, job_options,
+                            duration=duration, batch_id=batch_id)
+
+    if store is not None and args.submit_only:
+        worker.stop()
+        return 1 if callback.failed else 0
+
+    try:
+        if store is not None:
+            client = SharedQueueClient(store, worker)
+            callback.log(f"Working on shared jobs from {store_path} as {client.worker_id}")
+            while True:
+                time.sleep(2)
+                counts = store.counts()
+                if not args.serve and not counts.get("queued") and not counts.get("leased") \
+                        and worker.scheduler.is_idle():
+                    break
+            client.stop()
+        else:
+            worker.wait_idle()
+    except KeyboardInterrupt:
+        # Stop the running job at its next checkpoint so its scratch files get cleaned up
+        callback.log("Interrupted, cancelling...")
+        worker.stop(cancel=True)
+        for thread in worker.threads:
+            thread.join(timeout=30)
+        worker.close_archives()
+        worker.stop_hosts()
+        return 130
+    worker.stop()
+    for thread in worker.threads:
+        thread.join()
+    worker.close_archives()
+    worker.stop_hosts()
+    callback.log(f"Done: {callback.completed} completed, {callback.failed} failed")
+    return 1 if callback.failed else 0
+
+def run_stream(args):
+    """Transcribe a live source, printing segments as soon as they settle"""
+    settings = Settings()
+    ModelStore.apply_offline_mode(settings.current)
+    callback = ConsoleCallback(settings)
+    # Status goes to stderr so stdout carries only the transcript
+    callback.log = lambda message: print(message, file=sys.stderr, flush=True)
+    worker = TranscriptionWorker(callback)
+    options = {
+        "model_size": args.model or settings.current["model_size"],
+        "device": settings.current["device"],
+        "compute_type": settings.current["compute_type"],
+        "language": args.language or settings.current["language"],
+    }
+    model = worker._get_model(options)
+    worker.stop()
+
+    transcript = None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        name = f"stream_{datetime.now().strftime('%Y%m%d_%H%M%S')}_transcript.txt"
+        transcript = open(os.path.join(args.output_dir, name), "w", encoding="utf-8")
+        callback.log(f"Writing transcript to {transcript.name}")
+
+    interactive = sys.stdout.isatty() and not args.jsonl
+
+    def emit(kind, start, end, text, latency):
+        if args.jsonl:
+            print(json.dumps({"type": kind, "start": round(start, 2), "end": round(end, 2),
+                              "text": text, "latency": round(latency, 2)}), flush=True)
+        elif kind == "final":
+            line = f"[{start:.2f}s - {end:.2f}s] {text}" if args.timestamps else text
+            print(("\r\033[K" if interactive else "") + line, flush=True)
+        elif interactive:
+            print(f"\r\033[K... {text}"[:200], end="", flush=True)
+        if kind == "final" and transcript is not None:
+            transcript.write((f"[{start:.2f}s - {end:.2f}s] {text}" if args.timestamps else text) + "\n")
+            transcript.flush()
+
+    streamer = StreamingTranscriber(model, options, emit, step=args.step)
+    try:
+        streamer.run(StreamingTranscriber.read_source(
+            args.stream, args.stream_format, args.stream_rate, args.follow))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if transcript is not None:
+            transcript.close()
+
+    if streamer.latencies:
+        latencies = sorted(streamer.latencies)
+        callback.log(f"Finalised {len(latencies)} segment(s); latency median "
+                     f"{latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+    return 0
+
+def run_search(args):
+    settings = Settings()
+    index = TranscriptIndex(settings.current.get("search_index_path") or None)
+    if args.index_dir:
+        added, segments = index_transcript_folder(index, args.index_dir)
+        print(f"Indexed {added} transcript(s), {segments} segment(s)", file=sys.stderr)
+    if args.search:
+        import sqlite3
+        started = time.time()
+        try:
+            hits = index.search(args.search)
+        except sqlite3.Error as e:
+            print(f"Search failed: {e}", file=sys.stderr)
+            return 1
+        for hit in hits:
+            when = f" [{MediaProbe.format_duration(hit['start'])}]" if hit["start"] is not None else ""
+            print(f"{hit['output_path']}:{hit['line']}{when} SPEAKER {hit['speaker']}: {hit['snippet']}")
+        print(f"{len(hits)} result(s) in {(time.time() - started) * 1000:.0f} ms", file=sys.stderr)
+    return 0
+
+def main(argv=None):
+    args = build_cli_parser().parse_args(argv)
+    if args.search or args.index_dir:
+        sys.exit(run_search(args))
+    if args.stream:
+        sys.exit(run_stream(args))
+    if args.inputs or args.serve:
+        sys.exit(run_cli(args))
+
+    ModelStore.apply_offline_mode(Settings().current)
+    from tkinterdnd2 import TkinterDnD
     root = TkinterDnD.Tk()
     app = TranscriptionGUI(root)
     root.mainloop()
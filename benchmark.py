@@ -0,0 +1,210 @@
+"""Benchmarks for Scribey's heavy stages
+
+    python benchmark.py diarization interview.wav --speakers 2 --segmentation-step 0.2
+    python benchmark.py segments --hours 10
+
+Each benchmark times a baseline against a tuned configuration and reports
+how far the tuned output agrees with the baseline.
+"""
+import argparse
+import copy
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from Scribey import (MediaProbe, ModelStore, SegmentStore, Settings, SpeakerAligner,
+                     TranscriptionWorker, parse_speaker_hint)
+
+SAMPLE_RATE = 16000
+
+def decode(path):
+    """Mono float32 samples at 16 kHz, through ffmpeg"""
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", path,
+         "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "f32le", "pipe:1"],
+        capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def timed(function, repeat):
+    """Best wall time over repeat runs, and the last result"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def frame_labels(turns, total_seconds, resolution=0.01):
+    """Speaker index per 10 ms frame (-1 for silence), plus the label names"""
+    names = sorted({speaker for _, _, speaker in turns})
+    index = {name: i for i, name in enumerate(names)}
+    labels = np.full(int(total_seconds / resolution) + 1, -1, dtype=np.int32)
+    for start, end, speaker in turns:
+        labels[int(start / resolution):int(end / resolution)] = index[speaker]
+    return labels, names
+
+def agreement(reference, hypothesis, total_seconds):
+    """Share of speech frames labelled alike, after mapping speakers one-to-one
+
+    Speakers are matched greedily by overlap, which is what pyannote's
+    label numbering differences need; this is 1 - DER only without overlaps.
+    """
+    ref, ref_names = frame_labels(reference, total_seconds)
+    hyp, hyp_names = frame_labels(hypothesis, total_seconds)
+    speech = (ref >= 0) | (hyp >= 0)
+    if not speech.any():
+        return 1.0
+    both = (ref >= 0) & (hyp >= 0)
+    overlap = np.zeros((len(ref_names), len(hyp_names)), dtype=np.int64)
+    np.add.at(overlap, (ref[both], hyp[both]), 1)
+    matched = 0
+    while overlap.size and overlap.max() > 0:
+        r, h = np.unravel_index(np.argmax(overlap), overlap.shape)
+        matched += overlap[r, h]
+        overlap[r, :] = 0
+        overlap[:, h] = 0
+    return matched / speech.sum()
+
+def run_diarization(pipeline, samples, options, hints):
+    import torch
+    TranscriptionWorker._configure_pipeline(pipeline, options)
+    waveform = torch.from_numpy(samples).unsqueeze(0)
+    diarization = pipeline({"waveform": waveform, "sample_rate": SAMPLE_RATE}, **hints)
+    return [(turn.start, turn.end, speaker)
+            for turn, _, speaker in diarization.itertracks(yield_label=True)]
+
+def benchmark_diarization(args):
+    from pyannote.audio import Pipeline
+
+    settings = Settings().current
+    ModelStore.apply_offline_mode(settings)
+    store = ModelStore(settings)
+    pipeline = Pipeline.from_pretrained(ModelStore.diarization_model,
+                                        use_auth_token=settings.get("hf_token"),
+                                        cache_dir=store.diarization_cache())
+    samples = decode(args.audio)
+    total_seconds = len(samples) / SAMPLE_RATE
+    print(f"{args.audio}: {MediaProbe.format_duration(total_seconds)}")
+
+    baseline_options = {"segmentation_batch_size": 32, "embedding_batch_size": 32,
+                        "segmentation_step": 0.1}
+    tuned_options = {
+        "segmentation_batch_size": args.segmentation_batch or 32,
+        "embedding_batch_size": args.embedding_batch or 32,
+        "segmentation_step": args.segmentation_step or 0.1,
+    }
+    hints = parse_speaker_hint(args.speakers)
+
+    baseline_time, baseline = timed(
+        lambda: run_diarization(pipeline, samples, baseline_options, {}), args.repeat)
+    tuned_time, tuned = timed(
+        lambda: run_diarization(pipeline, samples, tuned_options, hints), args.repeat)
+
+    print(f"{'configuration':<48}{'time':>9}{'x realtime':>12}{'speakers':>10}{'agreement':>11}")
+    rows = [("default", baseline_time, baseline, 1.0),
+            (f"hints={hints or 'none'} {tuned_options}", tuned_time, tuned,
+             agreement(baseline, tuned, total_seconds))]
+    for name, elapsed, turns, agree in rows:
+        speakers = len({speaker for _, _, speaker in turns})
+        print(f"{name[:47]:<48}{elapsed:>8.1f}s{total_seconds / elapsed:>11.1f}x"
+              f"{speakers:>10}{agree:>10.1%}")
+    print(f"Speed-up: {baseline_time / tuned_time:.2f}x")
+
+def synthetic_transcript(hours, speakers, seed=0):
+    """Segment dicts shaped like faster-whisper's output, plus diarization turns"""
+    rng = random.Random(seed)
+    total = hours * 3600.0
+    segments, t = [], 0.0
+    while t < total:
+        words = []
+        for _ in range(rng.randint(8, 30)):
+            length = rng.uniform(0.15, 0.6)
+            words.append({"start": t, "end": t + length,
+                          "word": " " + "".join(rng.choices("etaoinshrdlu", k=rng.randint(2, 9))),
+                          "probability": rng.random()})
+            t += length
+        segments.append({"start": words[0]["start"], "end": t,
+                         "text": "".join(word["word"] for word in words),
+                         "avg_logprob": -rng.random(), "no_speech_prob": rng.random() / 10,
+                         "compression_ratio": rng.uniform(1.0, 2.0), "words": words})
+        t += rng.uniform(0.0, 1.5)
+    turns, t = [], 0.0
+    while t < total:
+        length = rng.uniform(2.0, 40.0)
+        turns.append({"start": t, "end": t + length, "speaker": f"SPEAKER_{rng.randrange(speakers):02d}"})
+        t += length + rng.uniform(0.0, 1.0)
+    return segments, turns
+
+def measured(build):
+    """Result of build() and the bytes it kept allocated"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def benchmark_segments(args):
+    segments, turns = synthetic_transcript(args.hours, args.speakers)
+    words = sum(len(segment["words"]) for segment in segments)
+    print(f"{args.hours:g} h synthetic transcript: {len(segments)} segments, {words} words, "
+          f"{len(turns)} speaker turns")
+
+    dicts, dict_bytes = measured(lambda: copy.deepcopy(segments))
+    store, store_bytes = measured(lambda: SegmentStore.coerce(segments))
+    del dicts
+
+    dict_time, dict_result = timed(
+        lambda: SpeakerAligner.apply({"segments": copy.deepcopy(segments)}, turns), args.repeat)
+    # The copy is part of the dict timing above, so time the store's too
+    store_time, store_result = timed(
+        lambda: SpeakerAligner.apply({"segments": SegmentStore.coerce(segments)}, turns),
+        args.repeat)
+    del store_result
+    aligned_time, _ = timed(lambda: SpeakerAligner.apply({"segments": store}, turns), args.repeat)
+
+    print(f"{'representation':<24}{'memory':>12}{'align (incl. build)':>22}{'align only':>12}")
+    print(f"{'list of dicts':<24}{dict_bytes / 2**20:>10.1f}MB{dict_time:>21.2f}s{'':>12}")
+    print(f"{'SegmentStore':<24}{store_bytes / 2**20:>10.1f}MB{store_time:>21.2f}s"
+          f"{aligned_time:>11.2f}s")
+    print(f"Memory: {dict_bytes / max(store_bytes, 1):.1f}x smaller; "
+          f"utterances: {len(dict_result['segments'])}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark Scribey stages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diarization = commands.add_parser("diarization",
+                                      help="Speaker hints and batching vs. default settings")
+    diarization.add_argument("audio", help="Audio or video file to diarize")
+    diarization.add_argument("--speakers", default="auto",
+                             help="Speaker hint for the tuned run: N, MIN-MAX or auto")
+    diarization.add_argument("--segmentation-batch", type=int)
+    diarization.add_argument("--embedding-batch", type=int)
+    diarization.add_argument("--segmentation-step", type=float)
+    diarization.add_argument("--repeat", type=int, default=1,
+                             help="Runs per configuration; the fastest counts")
+    diarization.set_defaults(run=benchmark_diarization)
+
+    segments = commands.add_parser("segments",
+                                   help="SegmentStore vs. a list of dicts: memory and alignment")
+    segments.add_argument("--hours", type=float, default=2.0,
+                          help="Length of the synthetic transcript")
+    segments.add_argument("--speakers", type=int, default=4)
+    segments.add_argument("--repeat", type=int, default=1,
+                          help="Runs per representation; the fastest counts")
+    segments.set_defaults(run=benchmark_segments)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())